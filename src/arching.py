@@ -1,4 +1,10 @@
 import math
+from itertools import count, islice, takewhile
+
+import numpy as np
+
+import arcs
+from profiling import stage
 from svg import Svg
 from helpers import *
 
@@ -9,71 +15,419 @@ def cycloid(h,L,N=101):
 
     b = h/2
     a = L/(2*math.pi)
-    theta = [2*math.pi*i/(N-1) for i in range(N)]
+    theta = 2*math.pi*np.arange(N)/(N-1)
 
-    x = [a*t - b*math.sin(t) for t in theta]
-    y = [a   - b*math.cos(t) for t in theta]
-    my = min(y)
-    y = [dir*(i-my) for i in y]
+    x = a*theta - b*np.sin(theta)
+    y = a - b*np.cos(theta)
+    y = dir*(y-y.min())
 
     return [x,y]
 
+def cycloid_at(h, L, x, iterations=8):
+    """
+    Height of the cycloid arch cycloid(h, L) at x, for arrays of arches
+
+    The cycloid is x = a*t - b*sin(t), y = b*(1-cos(t)) with a = L/(2*pi)
+    and b = h/2, t is found by Newton iteration. x is clipped to [0, L].
+
+    Args:
+        h (ndarray): Arch heights, negative for arches downwards
+        L (ndarray): Arch widths, larger than pi*|h|
+        x (ndarray): Positions from the start of each arch
+        iterations (int): Newton iterations
+
+    Returns:
+        ndarray: Heights, h, L and x broadcast together
+    """
+    b = np.abs(h)/2
+    a = np.asarray(L)/(2*np.pi)
+    x = np.clip(x, 0, L)
+
+    t = x/a
+    for _ in range(iterations):
+        t -= (a*t - b*np.sin(t) - x) / (a - b*np.cos(t))
+
+    return np.sign(h)*b*(1 - np.cos(t))
+
 def circle_arch(h, L, x, d1=None, h1=None, smooth=0):
-    dir = 1 if h > 0 else -1
-    h *= dir
-
-    r = h/2 + math.pow(L,2)/(8*h)
-    tmp = circle_circle_intersect((0,0),r,(L,0),r)
-    if len(tmp) == 1:
-        c = tmp[0]
-    else:
-        c = tmp[0] if tmp[0][1] < tmp[1][1] else tmp[1]
-
-    if d1 is not None and h1 is not None:
-        h1 *= dir
-
-        if h1 <= 0:
-            raise Exception("h and h1 must have same polarity")
-        if d1 <= 0:
-            raise Exception("d1 must be positive")
-        if d1 >= h1:
-            raise Exception("d1 must be lower than h1")
-        if h1 >= h:
-            raise Exception("h1 must be lower than h")
-        
-        h1 -= d1
-        
-        r1 = h1/2 + math.pow(L,2)/(8*h1)
-        tmp = circle_circle_intersect((0,d1),r1,(L,d1),r1)
-        c1 = tmp[0] if tmp[0][1] < tmp[1][1] else tmp[1]
-
-
-
-        tmp = circle_circle_intersect(c,r,c1,r1)
-        
-        
-        
-        y0 = [
-            dir*(math.sqrt(math.pow(r,2) - math.pow(xi-c[0],2)) + c[1]) 
-            for xi in x
-        ]
-        y1 = [
-            dir*(math.sqrt(math.pow(r1,2) - math.pow(xi-c1[0],2)) + c1[1]) 
-            for xi in x
-        ]
-        combine = lambda a,b: (a,b)
-        y = [min(yi,yj) for yi,yj in map(combine, y0, y1)]
-
-
-    elif d1 is not None or h1 is not None:
+    return x, _long_arch(h, L, x, h1, d1)
+
+def _long_arch(h, L, x, h1=None, d1=None):
+    # Heights of circle_arch, h, L, x, h1 and d1 may be arrays broadcast
+    # together, h1 and d1 NaN where an arch has no flatter center arch
+    h = np.asarray(h, dtype=float)
+    L = np.asarray(L, dtype=float)
+    x = np.asarray(x, dtype=float)
+    dir = np.where(h > 0, 1, -1)
+    h = h*dir
+
+    # Circles through (0, 0) and (L, 0), centered below
+    r = h/2 + L*L/(8*h)
+    c, _, _ = circle_circle_intersections((0, 0), r, (L, 0), r, touch=True)
+    y = dir*(np.sqrt(r*r - (x-c[0])**2) + c[1])
+
+    if h1 is None and d1 is None:
+        return y
+    if h1 is None or d1 is None:
         raise Exception("Either both or none of d1 and h1 can be given")
-    else:
-        y = [
-            dir*(math.sqrt(math.pow(r,2) - math.pow(xi-c[0],2)) + c[1]) 
-            for xi in x
-        ]
+    h1 = np.asarray(h1, dtype=float)*dir
+    d1 = np.asarray(d1, dtype=float)
+    given = ~np.isnan(h1)
+    if np.any(given != ~np.isnan(d1)):
+        raise Exception("Either both or none of d1 and h1 can be given")
+    for invalid, message in (
+        (h1 <= 0, "h and h1 must have same polarity"),
+        (d1 <= 0, "d1 must be positive"),
+        (d1 >= h1, "d1 must be lower than h1"),
+        (h1 >= h, "h1 must be lower than h"),
+    ):
+        if np.any(invalid & given):
+            raise Exception(message)
+
+    h1 = h1 - d1
+    r1 = h1/2 + L*L/(8*h1)
+    c1, _, _ = circle_circle_intersections((0, d1), r1, (L, d1), r1, touch=True)
+    y1 = dir*(np.sqrt(r1*r1 - (x-c1[0])**2) + c1[1])
+    return np.where(given, np.minimum(y, y1), y)
+
+def _rows(half, h, L, y, afc=None, afd=None):
+    # Crossings of the left half of the outline, the innermost of them and
+    # the height of the long arch at y. half is one outline, or one for
+    # each y with h, L, afc and afd for each y
+    xc = arcs.crossings(half, y)
+    inner = np.max(np.where(np.isnan(xc), -np.inf, xc), axis=1)
+    with np.errstate(invalid="ignore"):
+        long = _long_arch(h, L, y, afc, afd)
+    return xc, inner, long
+
+@stage("arching")
+def surface(v, h, x, y, afc=None, afd=None):
+    """
+    Height field of a plate arching over the outline.
+
+    The long arch is circle_arch(h, v.h) along the center line. Each cross
+    section is a cycloid with the height of the long arch at y over the
+    width between the innermost outline points at y, as the cross arches
+    of Violin.get_arching. The corners, outside of that width, are at the
+    edge height 0.
+
+    Args:
+        v (Violin): Calculated instrument
+        h (float): Arch height, negative for the back
+        x (ndarray): Grid x positions, shape (nx,)
+        y (ndarray): Grid y positions, shape (ny,)
+        afc (float): (Optional) Height of the flatter center arch, see circle_arch h1
+        afd (float): (Optional) Offset of the flatter center arch, see circle_arch d1
+
+    Returns:
+        ndarray: z, shape (ny, nx), NaN outside the outline
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    xc, inner, long = _rows(v.get_half_outline(), h, v.h, y, afc, afd)
+    width = 2*(v.rl - inner)
+
+    # Distance from the nearest side, inside where an odd number of
+    # crossings of the left half lie left of it
+    xm = np.minimum(x, 2*v.rl - x)[None, :]
+    count = np.zeros((len(y), len(x)), dtype=np.int8)
+    for k in range(xc.shape[1]):
+        count += xc[:, k, None] < xm
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = cycloid_at(long[:, None], width[:, None], xm - inner[:, None])
+    return np.where(count % 2 == 1, z, np.nan)
+
+
+def sections(v, h, stations=None, spacing=None, afc=None, afd=None, N=101, chunk_size=64):
+    """
+    Cross arches at any stations along the body, computed on demand.
+
+    Each section is a cycloid with the height of the long arch at y over
+    the width between the innermost outline points at y, as the rows of
+    surface. Stations are read and computed chunk_size at a time, so any
+    number of sections takes the same memory. Stations at the ends or off
+    the body are skipped.
+
+    Args:
+        v (Violin): Calculated instrument
+        h (float): Arch height, negative for the back
+        stations (iterable): (Optional) y of the sections (mm), may be a generator
+        spacing (float): (Optional) A section every spacing mm from the lower end, instead of stations
+        afc (float): (Optional) Height of the flatter center arch, see circle_arch h1
+        afd (float): (Optional) Offset of the flatter center arch, see circle_arch d1
+        N (int): Points per section
+        chunk_size (int): Stations computed at once
+
+    Returns:
+        generator: Tuples of y, width and the section [x, z] with x from 0
+        to width, as the arches of Violin.get_arching. The arguments are
+        checked on the call, not on the first section.
+    """
+    if (stations is None) == (spacing is None):
+        raise ValueError("Either stations or spacing must be given")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    if stations is None:
+        if spacing <= 0:
+            raise ValueError("spacing must be positive")
+        stations = takewhile(lambda y: y < v.h, (spacing*k for k in count(1)))
+    return _sections(v, h, iter(stations), afc, afd, N, chunk_size)
+
+def _sections(v, h, stations, afc, afd, N, chunk_size):
+    while True:
+        y = np.fromiter(islice(stations, chunk_size), dtype=float)
+        if len(y) == 0:
+            return
+        with np.errstate(invalid="ignore"):
+            _, inner, long = _rows(v.get_half_outline(), h, v.h, y, afc, afd)
+        width = 2*(v.rl - inner)
+        for yk, w, hk in zip(y.tolist(), width.tolist(), long.tolist()):
+            if 0 < yk < v.h and 0 < w < math.inf and math.isfinite(hk):
+                yield yk, w, cycloid(hk, w, N)
+
+def zones(levels):
+    """
+    Graduation map by zones of the relative arch height
+
+    Args:
+        levels (list): (level, thickness) pairs, the thickness (mm) applies
+            from the relative height level (0 at the edge, 1 at the top)
+            up to the next level
+
+    Returns:
+        function: thickness(x, y, s), see plate
+    """
+    levels = sorted(levels)
+    start = np.array([l for l, _ in levels], dtype=float)
+    thickness = np.array([t for _, t in levels], dtype=float)
+
+    def graduation(x, y, s):
+        return thickness[np.clip(np.searchsorted(start, s, side="right") - 1, 0, len(start)-1)]
+    return graduation
+
+def _breaks(segments):
+    # y of the arc ends and of the top and bottom points within the arcs,
+    # between them the crossings of a horizontal line change smoothly.
+    # Sorted for each outline, NaN at the end for the arcs without a top
+    # or bottom point
+    y = [segments["y0"], segments["y1"]]
+    lo, hi = np.minimum(segments["a0"], segments["a1"]), np.maximum(segments["a0"], segments["a1"])
+    for a, sign in ((np.pi/2, 1), (-np.pi/2, -1)):
+        k = np.ceil((lo - a)/(2*np.pi))
+        within = a + 2*np.pi*k <= hi
+        y.append(np.where(within, segments["cy"] + sign*segments["r"], np.nan))
+    return np.sort(np.concatenate(y, axis=-1), axis=-1)
+
+def _gauss(n):
+    u, w = np.polynomial.legendre.leggauss(n)
+    return (u + 1)/2, w/2
+
+@stage("plate")
+def plate(v, h, thickness=3, density=0.45, afc=None, afd=None, n=8):
+    """
+    Volume and mass of a plate, integrated over the outline.
+
+    The plate is a shell of thickness normal to the arching surface, so
+    its volume is the integral of the thickness times the surface area
+    element sqrt(1 + |grad z|^2) over the outline. The outline is cut into
+    bands at the y of the arc ends and of their top and bottom points,
+    each band gets n Gauss-Legendre rows, clustered at the band ends where
+    the width changes like a square root. Every row is integrated with n
+    points on each interval inside the outline, split where the corners
+    start, the rows and points of all instruments at once.
+
+    Args:
+        v: Calculated Violin, or ViolinBatch
+        h: Arch height, negative for the back, an array for a batch
+        thickness: Thickness (mm), a number or a function thickness(x, y, s)
+            of arrays of positions (mm) and relative arch height s, see zones
+        density: Density (g/cm3)
+        afc: (Optional) Height of the flatter center arch, see circle_arch h1,
+            an array for a batch with NaN for the instruments without one
+        afd: (Optional) Offset of the flatter center arch, see circle_arch d1
+        n (int): Quadrature points per band and interval
+
+    Returns:
+        dict: area (mm2, projected), surface (mm2), arch_volume (mm3, under
+        the arch), volume (mm3), mass (g), arrays for a batch
+    """
+    half = v.get_half_outline()
+    single = half.ndim == 1
+    half = half.reshape(-1, half.shape[-1])
+    N = len(half)
+    each = lambda value: None if value is None else np.broadcast_to(np.asarray(value, dtype=float), (N,))
+    h, afc, afd, rl, length = each(h), each(afc), each(afd), each(v.rl), each(v.h)
+    u, w = _gauss(n)
+
+    # Bands of all instruments, instrument is the one of each band
+    breaks = _breaks(v.get_outline().reshape(N, -1))
+    y0, y1 = breaks[:, :-1], breaks[:, 1:]
+    keep = y1 - y0 > 1e-9
+    instrument, _ = np.nonzero(keep)
+    y0, y1 = y0[keep, None], y1[keep, None]
+
+    # Rows, y = y0 + (y1-y0)*s(u) with s(u) = u^2*(3-2u)
+    y = y0 + (y1-y0)*u*u*(3-2*u)
+    wy = ((y1-y0)*6*u*(1-u)*w).ravel()
+    # Step of the slopes across the rows, within the band as the innermost
+    # crossing can jump at its ends
+    dy = np.minimum(1e-4, np.minimum(y - y0, y1 - y)/2).ravel()
+    y = y.ravel()
+    instrument = np.repeat(instrument, n)
+    at = lambda value: None if value is None else value[instrument]
+    half, h, length, afc, afd, rl = half[instrument], h[instrument], length[instrument], at(afc), at(afd), rl[instrument]
+    xc, inner, long = _rows(half, h, length, y, afc, afd)
+
+    # Within a band the innermost crossing stays on its arc, the rows at
+    # y +- dy for the slopes need only that one
+    k = np.argmax(np.where(np.isnan(xc), -np.inf, xc), axis=1)
+    arc = half[np.arange(len(k)), k % half.shape[1]]
+    side = np.where(k < half.shape[1], -1, 1)
+
+    def rows_at(y):
+        with np.errstate(invalid="ignore"):
+            return arc["cx"] + side*np.sqrt(arc["r"]*arc["r"] - (y-arc["cy"])**2), _long_arch(h, length, y, afc, afd)
+
+    # Intervals between the crossings and the start of the corners on both
+    # sides, the inside ones have an odd number of crossings left of them
+    xc = np.concatenate((xc, 2*rl[:, None] - xc), axis=1)
+    xs = np.sort(np.concatenate((xc, inner[:, None], 2*rl[:, None] - inner[:, None]), axis=1), axis=1)
+    a, b = xs[:, :-1], xs[:, 1:]
+    with np.errstate(invalid="ignore"):
+        mid = (a + b)/2
+        inside = (np.sum(xc[:, None, :] < mid[:, :, None], axis=2) % 2 == 1) & (b > a)
+    row, _ = np.nonzero(inside)
+    a, b = a[inside][:, None], b[inside][:, None]
+
+    # Points, shape (intervals, n)
+    x = a + (b-a)*u
+    weight = wy[row, None]*(b-a)*w
+
+    def height(x, inner, long):
+        xm = np.minimum(x, 2*rl[row, None] - x)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return cycloid_at(long[row, None], 2*(rl[row, None] - inner[row, None]), xm - inner[row, None])
+
+    # Slopes by central differences, across the rows from the rows at y +- dy
+    d = 1e-4
+    z = height(x, inner, long)
+    dzdx = (height(x + d, inner, long) - height(x - d, inner, long))/(2*d)
+    inner_p, long_p = rows_at(y + dy)
+    inner_m, long_m = rows_at(y - dy)
+    dzdy = (height(x, inner_p, long_p) - height(x, inner_m, long_m))/(2*dy[row, None])
+    element = np.sqrt(1 + dzdx*dzdx + dzdy*dzdy)
+
+    if callable(thickness):
+        thickness = thickness(x, np.broadcast_to(y[row, None], x.shape), z/h[row, None])
+
+    # Sums over the points of each instrument
+    owner = instrument[row]
+    total = lambda values: np.bincount(owner, weights=np.sum(values, axis=1), minlength=N)
+    volume = total(weight*thickness*element)
+    result = {
+        "area": total(weight),
+        "surface": total(weight*element),
+        "arch_volume": total(weight*np.abs(z)),
+        "volume": volume,
+        "mass": volume*density*1e-3,
+    }
+    return {k: value[0] for k, value in result.items()} if single else result
+
+
+class ArchingModel:
+    """
+    Arching height field precomputed on a grid for fast point queries.
+
+    Heights and normals are interpolated bilinearly from the grid cell
+    containing each point, so a query costs the same for any number of
+    points and the whole batch is one NumPy operation. Inside tests are
+    exact against the arcs of the outline.
+
+    Args:
+        v (Violin): Calculated instrument
+        h (float): Arch height, negative for the back
+        afc (float): (Optional) Height of the flatter center arch, see circle_arch h1
+        afd (float): (Optional) Offset of the flatter center arch, see circle_arch d1
+        resolution (float): Grid spacing (mm)
+    """
+
+    def __init__(self, v, h, afc=None, afd=None, resolution=0.5):
+        self.violin = v
+        self.resolution = resolution
+        height, width = v.get_dimensions_mm()
+        self.nx = int(math.ceil(width/resolution)) + 1
+        self.ny = int(math.ceil(height/resolution)) + 1
+        self.x = np.arange(self.nx)*resolution
+        self.y = np.arange(self.ny)*resolution
+
+        # The edge is at height 0, so cells across the edge interpolate
+        # towards it
+        z = surface(v, h, self.x, self.y, afc=afc, afd=afd)
+        self.z = np.where(np.isnan(z), 0, z)
+        self._half = v.get_half_outline()
+
+        # Cells at least half a diagonal away from the outline are wholly
+        # inside or outside, only points in the others need the exact test
+        inside = ~np.isnan(z)
+        cx, cy = np.meshgrid(self.x[:-1] + resolution/2, self.y[:-1] + resolution/2)
+        cx, cy = cx.ravel(), cy.ravel()
+        near = np.empty(len(cx), dtype=bool)
+        for k in range(0, len(cx), 1<<16):
+            block = slice(k, k + (1<<16))
+            px, py = arcs.nearest(v.get_outline(), cx[block], cy[block])
+            near[block] = np.hypot(px - cx[block], py - cy[block]) <= resolution/np.sqrt(2)
+        near = near.reshape(self.ny-1, self.nx-1)
+        self.cells = np.where(near, -1, inside[:-1,:-1]).astype(np.int8)
+
+    def _cell(self, x, y):
+        u = np.clip(np.asarray(x, dtype=float)/self.resolution, 0, self.nx-1)
+        v = np.clip(np.asarray(y, dtype=float)/self.resolution, 0, self.ny-1)
+        i = np.minimum(v.astype(np.intp), self.ny-2)
+        j = np.minimum(u.astype(np.intp), self.nx-2)
+        z = self.z
+        return u-j, v-i, z[i,j], z[i,j+1], z[i+1,j], z[i+1,j+1]
+
+    def inside(self, x, y):
+        """
+        Returns:
+            ndarray: True for points inside the outline
+        """
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        i = np.floor(y/self.resolution).astype(np.intp)
+        j = np.floor(x/self.resolution).astype(np.intp)
+        on_grid = (i >= 0) & (i < self.ny-1) & (j >= 0) & (j < self.nx-1)
+        state = np.zeros(x.shape, dtype=np.int8)
+        state[on_grid] = self.cells[i[on_grid], j[on_grid]]
+
+        # Exact test against the arcs for cells on the outline
+        edge = state == -1
+        xc = arcs.crossings(self._half, y[edge])
+        xm = np.minimum(x[edge], 2*self.violin.rl - x[edge])
+        state[edge] = np.sum(xc < xm[:, None], axis=1) % 2
+        return state == 1
+
+    def height(self, x, y):
+        """
+        Returns:
+            ndarray: Arching height at the points, NaN outside the outline
+        """
+        fu, fv, z00, z01, z10, z11 = self._cell(x, y)
+        z = (1-fv)*((1-fu)*z00 + fu*z01) + fv*((1-fu)*z10 + fu*z11)
+        return np.where(self.inside(x, y), z, np.nan)
 
-    return x,y
+    def normal(self, x, y):
+        """
+        Returns:
+            ndarray: Unit surface normals at the points, shape (..., 3), NaN outside the outline
+        """
+        fu, fv, z00, z01, z10, z11 = self._cell(x, y)
+        dx = ((1-fv)*(z01-z00) + fv*(z11-z10)) / self.resolution
+        dy = ((1-fu)*(z10-z00) + fu*(z11-z01)) / self.resolution
+        n = np.stack((-dx, -dy, np.ones_like(dx)), axis=-1)
+        n /= np.linalg.norm(n, axis=-1, keepdims=True)
+        return np.where(self.inside(x, y)[..., None], n, np.nan)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+## Vectorized four circle geometry for many instruments at once
+#
+
+import numpy as np
+
+from violin import Violin
+import arcs
+from arching import plate
+from helpers import line_circle_intersections, circle_circle_intersections
+
+def _select(cond, p0, p1):
+    return (np.where(cond, p0[0], p1[0]), np.where(cond, p0[1], p1[1]))
+
+# Derived values that are points, as (x, y)
+POINTS = ("c1", "c2", "cl", "cu", "cc", "cc_left", "cml_left", "cmu_left",
+          "cA", "du1", "du2", "dl1", "dl2", "yuc", "ylc", "auc", "alc")
+
+def record_dtype(float_type="f8"):
+    """
+    Structured dtype of one calculated instrument: the parameters, every
+    derived value (points as 2 values) and the valid flag
+
+    Args:
+        float_type (str): f8, or f4 for half the size
+    """
+    return np.dtype(
+        [(p, float_type) for p in Violin.params] +
+        [(d, float_type, (2,)) if d in POINTS else (d, float_type) for d in Violin.derived] +
+        [("valid", "?")]
+    )
+
+RECORD = record_dtype()
+
+def save_records(file, records):
+    """
+    Writes records as a .npy file, which load_records maps back into memory
+    """
+    np.save(file, records, allow_pickle=False)
+
+def load_records(file, mmap=True):
+    """
+    Reads records written by save_records
+
+    Args:
+        mmap (bool): Map the file read only instead of reading it, nothing is parsed or copied
+
+    Returns:
+        ndarray: Records, see record_dtype
+    """
+    return np.load(file, mmap_mode="r" if mmap else None, allow_pickle=False)
+
+def violin_from_record(record) -> Violin:
+    """
+    Returns a calculated Violin with the values of one record, without
+    calculating it again
+    """
+    v = Violin.__new__(Violin)
+    for p in Violin.params:
+        setattr(v, p, float(record[p]))
+    for d in Violin.derived:
+        value = record[d]
+        setattr(v, d, (float(value[0]), float(value[1])) if d in POINTS else float(value))
+    v.body_calculated = v.corner_calculated = True
+    v._half_outline = v._outline = v._fragments = None
+    v.move_px = (0, 0)
+    return v
+
+class ViolinBatch:
+    """
+    Four circle geometry for N instruments, calculated as NumPy arrays.
+
+    Mirrors Violin: the parameters and every derived value keep the
+    same names, scalars become arrays of length N and points become
+    (x, y) tuples of arrays. Parameter sets without a valid geometry
+    give NaN instead of raising a math domain error.
+    """
+
+    params = Violin.params
+
+    body_calculated = False
+    corner_calculated = False
+
+    def __init__(self, kc, ku, kw, b1, b2, bu, bl, cu1, cu2, cl1, cl2, h = None, km = None, kmu = None, kml = None):
+        """
+        Initialize parameters for a batch of instruments.
+
+        Takes the same arguments as Violin, as scalars or array likes.
+        All arguments are broadcast against each other and flattened.
+        """
+        if ( km is None and (kmu is None or kml is None) ):
+            raise Exception("ViolinBatch init: Either km or both kmu and kml must be given")
+        elif (km is not None):
+            kmu = km
+            kml = km
+
+        values = np.broadcast_arrays(*[
+            np.asarray(p, dtype=float)
+            for p in (h if h is not None else 100, kc, ku, kmu, kml, kw, b1, b2, bu, bl, cu1, cu2, cl1, cl2)
+        ])
+        for name, value in zip(self.params, values):
+            setattr(self, name, np.ravel(value))
+
+    @classmethod
+    def from_violins(cls, violins):
+        """
+        Creates a batch from the parameters of a sequence of Violin objects
+        """
+        return cls(**{
+            p: [getattr(v, p) for v in violins] for p in cls.params
+        })
+
+    def __len__(self):
+        return len(self.h)
+
+    def violin(self, i) -> Violin:
+        """
+        Returns a (not calculated) Violin with the parameters of instrument i
+        """
+        return Violin(**{p: float(getattr(self, p)[i]) for p in self.params})
+
+    def to_records(self, float_type="f8"):
+        """
+        Returns:
+            ndarray: One record per instrument, see record_dtype
+        """
+        records = np.empty(len(self), dtype=record_dtype(float_type))
+        for p in self.params:
+            records[p] = getattr(self, p)
+        for d in Violin.derived:
+            value = getattr(self, d)
+            records[d] = np.stack(value, axis=-1) if d in POINTS else value
+        records["valid"] = self.valid
+        return records
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Creates a calculated batch from records. The values are views of
+        the record fields, so records loaded with mmap are not copied.
+        """
+        batch = cls.__new__(cls)
+        for p in cls.params:
+            setattr(batch, p, records[p])
+        for d in Violin.derived:
+            value = records[d]
+            setattr(batch, d, (value[:,0], value[:,1]) if d in POINTS else value)
+        batch.body_calculated = batch.corner_calculated = True
+        return batch
+
+    def calculate_body_params(self):
+        # Circle parameters
+        kA = ( np.sqrt(np.square(1 + self.kc) - np.square(self.kc+self.kw/2)) - 1 )
+        kB = ( np.sqrt(np.square(self.ku + self.kc) - np.square(self.kc+self.kw/2)) - self.ku )
+        self.kr1 = self.kml + np.hypot(1, 1-self.kml)
+        self.kr2 = self.kmu + np.hypot(self.ku, self.ku-self.kmu)
+
+        self.rl = self.h / ( self.kr1 + self.kr2 + kA + kB)
+        self.hc = self.rl*(kA+kB)
+
+        self.r1 = self.rl * self.kr1
+        self.r2 = self.rl * self.kr2
+
+        # Upper and lower major circles
+        self.c1 = (self.rl, self.r1)
+        self.c2 = (self.rl, self.r1+self.hc)
+
+        # Bout centers
+        self.cl = (self.rl, self.r1-self.rl)
+        self.cu = (self.rl, self.r1+self.hc+self.rl*self.ku)
+        self.cc = (self.rl, self.cl[1] + self.rl*np.sqrt(np.square(1+self.kc) - np.square(self.kc+self.kw/2)))
+
+        # Center left circle
+        self.cc_left = (self.rl*(1-(self.kc+self.kw/2)),self.cc[1])
+
+        # Minor circles
+        self.cml_left  = (self.rl*(1-(1-self.kml)), self.cl[1])
+        self.cmu_left  = (self.rl*(1-(self.ku-self.kmu)), self.cu[1])
+
+        self.body_calculated = True
+
+        return self.rl,self.r1,self.r2,self.cl,self.cu,self.cc,self.cc_left,self.c1,self.c2,self.cml_left,self.cmu_left
+
+    def calculate_corner_params(self):
+        self.A1, self.A2 = self.rl*self.b1, self.rl*self.b2
+        self.xl1, self.xl2 = self.rl*self.cl1, self.rl*self.cl2
+        self.xu1, self.xu2 = self.rl*self.ku*self.cu1, self.rl*self.ku*self.cu2
+
+        self.cA = (self.cc[0] - self.kw * self.rl / 2 - self.A1, self.cc[1])
+
+        self.Lu = np.hypot(self.cu[0]-self.xu1-self.cA[0], self.cu[1]-self.cA[1])
+        self.Ll = np.hypot(self.cl[0]-self.xl1-self.cA[0], self.cl[1]-self.cA[1])
+
+        self.du1 =   (
+                self.cA[0] + (self.cu[0]- self.xu1-self.cA[0]) * self.A2/self.Lu,
+                self.cA[1] + (self.cu[1] - self.cA[1]) * self.A2/self.Lu
+                )
+        self.dl1 =   (
+                self.cA[0] + (self.cl[0] - self.xl1-self.cA[0]) * self.A2/self.Ll,
+                self.cA[1] + (self.cl[1] - self.cA[1]) * self.A2/self.Ll
+                )
+
+        p0, p1, _ = line_circle_intersections(self.cu, self.rl*self.ku, (self.cu[0]-self.xu2, self.cu[1]), self.cA)
+        self.du2 = _select(p0[0] < p1[0], p0, p1)
+
+        p0, p1, _ = line_circle_intersections(self.cl, self.rl, (self.cl[0]-self.xl2, self.cl[1]), self.cA)
+        self.dl2 = _select(p0[0] < p1[0], p0, p1)
+
+        self.yu, self.yl = self.du2[1]-self.du1[1],self.dl1[1]-self.dl2[1]
+        self.au, self.al = self.bu*self.yu, self.bl*self.yl
+
+        # Circles that don't meet are moved to touch, as in Violin
+        p0, p1, _ = circle_circle_intersections(self.du1, self.yu, self.cmu_left, self.rl*self.kmu+self.yu, touch=True)
+        self.yuc = _select(p0[1] > p1[1], p0, p1)
+
+        p0, p1, _ = circle_circle_intersections(self.dl1, self.yl, self.cl, self.rl+self.yl, touch=True)
+        self.ylc = _select(p0[1] < p1[1], p0, p1)
+
+        p0, p1, _ = circle_circle_intersections(self.du1, self.au, self.cc_left, self.rl*self.kc-self.au, touch=True)
+        self.auc = _select(p0[1] < p1[1], p0, p1)
+
+        p0, p1, _ = circle_circle_intersections(self.dl1, self.al, self.cc_left, self.rl*self.kc-self.al, touch=True)
+        self.alc = _select(p0[1] > p1[1], p0, p1)
+
+        self.corner_calculated = True
+
+    def calculate(self):
+        """
+        Calculates body and corner parameters in one pass, invalid parameter
+        sets are reported through the valid mask instead of warnings
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.calculate_body_params()
+            self.calculate_corner_params()
+        return self
+
+    @property
+    def valid(self):
+        """
+        Mask of the instruments with a fully defined geometry
+        """
+        valid = np.isfinite(self.rl)
+        if self.corner_calculated:
+            for p in (self.du2, self.dl2, self.yuc, self.ylc, self.auc, self.alc):
+                valid &= np.isfinite(p[0]) & np.isfinite(p[1])
+        return valid
+
+    def get_dimensions_mm(self):
+        return self.h, 2*self.rl
+
+    def get_bout_widths_mm(self):
+        return 2*self.rl*self.ku, self.rl*self.kw, 2*self.rl
+
+    def get_half_outline(self):
+        """
+        Returns:
+            ndarray: Left halves of the outlines as arcs.ARC records, shape (N, 11)
+        """
+        return arcs.half_outline(self)
+
+    def get_outline(self):
+        """
+        Returns:
+            ndarray: Outlines as arcs.ARC records, shape (N, 20)
+        """
+        return arcs.outline(self)
+
+    def get_outline_properties(self):
+        """
+        Returns:
+            dict: Arrays of the outline properties, see arcs.properties
+        """
+        return arcs.properties(self.get_outline())
+
+    def get_plate(self, h, thickness=3, density=0.45, afc=None, afd=None):
+        """
+        Volume and mass of the plates with the arching, see arching.plate
+
+        Args:
+            h: Arch heights, negative for the back
+            thickness: Thickness (mm), a number or a graduation map, see arching.zones
+            density: Density (g/cm3)
+            afc: (Optional) Heights of the flatter center arches, NaN for none
+            afd: (Optional) Offsets of the flatter center arches, NaN for none
+
+        Returns:
+            dict: Arrays of area, surface, arch_volume, volume and mass, NaN
+            for the instruments without a valid geometry
+        """
+        p = plate(self, h, thickness=thickness, density=density, afc=afc, afd=afd)
+        valid = self.valid
+        return {k: np.where(valid, value, np.nan) for k, value in p.items()}
@@ -0,0 +1,186 @@
+## Benchmarks of the geometry, arching and rendering stages
+#
+#  python src/main.py bench [--save baseline.json] [--baseline baseline.json] [--threshold 0.25]
+#
+#  Every stage runs over all catalog entries plus synthetic variants of
+#  them. Times are the best of --repeat passes per call, allocations the
+#  tracemalloc peak of one pass per call, measured in a separate pass as
+#  tracing slows the code down.
+#
+
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+import numpy as np
+
+import arching
+import render
+from batch import ViolinBatch
+from catalog import Catalog
+
+def synthetic(entries, n, seed=0, spread=0.02):
+    """
+    Variants of the entries with all parameters but h moved by up to
+    spread (relative), only valid ones are returned
+
+    Returns:
+        list: (instrument, entry) with n variants per entry at most
+    """
+    rng = np.random.default_rng(seed)
+    variants = []
+    for instrument, entry in entries:
+        base = {p: entry[p] for p in ViolinBatch.params if p in entry}
+        if "km" in entry:
+            base["kmu"] = base["kml"] = entry["km"]
+        params = {p: np.full(n, float(v)) if p == "h" else v*(1 + rng.uniform(-spread, spread, n)) for p, v in base.items()}
+        batch = ViolinBatch(**params).calculate()
+        for i in np.flatnonzero(batch.valid):
+            variant = {p: float(params[p][i]) for p in params}
+            variant.update({k: entry[k] for k in ("af", "afc", "afd") if k in entry})
+            variants.append((instrument, variant))
+    return variants
+
+def _calculated(instrument, entry):
+    return render.violin_from_entry(entry)
+
+def _body(instrument, entry):
+    v = render.violin_from_entry(entry, calculate=False)
+    v.calculate_body_params()
+    return v
+
+def _arch(entry):
+    return entry.get("af", 15), entry.get("afc"), entry.get("afd")
+
+# Stage name -> (prepare(instrument, entry), run(prepared)), preparation is not timed
+STAGES = {
+    "body":         (lambda i, e: render.violin_from_entry(e, calculate=False), lambda v: v.calculate_body_params()),
+    "corner":       (_body, lambda v: v.calculate_corner_params()),
+    "outline_path": (_calculated, lambda v: v.get_outline_path()),
+    "template":     (lambda i, e: (_calculated(i, e), i), lambda p: p[0].get_template(type=p[1])),
+    "arching":      (lambda i, e: (_calculated(i, e), _arch(e)), lambda p: p[0].get_arching(*p[1])),
+    "sections":     (lambda i, e: (_calculated(i, e), _arch(e)), lambda p: sum(1 for _ in p[0].get_arching_sections(p[1][0], spacing=5, afc=p[1][1], afd=p[1][2]))),
+    "cycloid":      (lambda i, e: (_arch(e)[0], 2*_calculated(i, e).rl), lambda p: arching.cycloid(*p)),
+    "plate":        (lambda i, e: (_calculated(i, e), _arch(e)), lambda p: p[0].get_plate(p[1][0], afc=p[1][1], afd=p[1][2])),
+}
+
+def run(inputs, stages=None, repeat=5):
+    """
+    Runs the stages over the inputs
+
+    Args:
+        inputs (list): (instrument, entry)
+        stages (list): (Optional) Stage names, default all STAGES
+        repeat (int): Timed passes per stage
+
+    Returns:
+        dict: Stage -> {calls, time (s per call), peak (bytes per call)}
+    """
+    results = {}
+    for name in stages or STAGES:
+        prepare, call = STAGES[name]
+
+        best = float("inf")
+        for _ in range(repeat):
+            prepared = [prepare(i, e) for i, e in inputs]
+            start = time.perf_counter()
+            for p in prepared:
+                call(p)
+            best = min(best, time.perf_counter() - start)
+
+        prepared = [prepare(i, e) for i, e in inputs]
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        for p in prepared:
+            call(p)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            "calls": len(inputs),
+            "time": best/len(inputs),
+            "peak": (peak-base)/len(inputs),
+        }
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Returns:
+        list: (stage, measure, value, baseline value) for measures more than threshold (relative) above the baseline
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        for measure in ("time", "peak"):
+            if b[measure] > 0 and r[measure] > b[measure]*(1 + threshold):
+                regressions.append((name, measure, r[measure], b[measure]))
+    return regressions
+
+def main(args):
+    catalog = Catalog(args.file)
+    entries = [(i, e) for i, _, e in catalog.entries()]
+    inputs = entries + synthetic(entries, args.synthetic, seed=args.seed)
+
+    stages = args.stages.split(",") if args.stages else None
+    unknown = [s for s in stages or [] if s not in STAGES]
+    if unknown:
+        print(f"bench: unknown stage {', '.join(unknown)}, expected one of {', '.join(STAGES)}", file=sys.stderr)
+        return 1
+
+    results = run(inputs, stages=stages, repeat=args.repeat)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["stages"]
+
+    print(f"{'stage':<14}{'calls':>8}{'us/call':>12}{'KiB/call':>12}{'change':>10}")
+    for name, r in results.items():
+        change = ""
+        if baseline and name in baseline and baseline[name]["time"] > 0:
+            change = f"{100*(r['time']/baseline[name]['time'] - 1):+.1f}%"
+        print(f"{name:<14}{r['calls']:>8}{1e6*r['time']:>12.2f}{r['peak']/1024:>12.2f}{change:>10}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "inputs": len(inputs),
+                "stages": results,
+            }, f, indent=4)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for name, measure, value, base in regressions:
+            print(f"bench: {name} {measure} regressed {100*(value/base - 1):.1f}% (threshold {100*args.threshold:.0f}%)", file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+def parser(prog="bench"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=f"Benchmark the stages {', '.join(STAGES)} over the catalog and synthetic variants"
+    )
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--stages', type=str, help="comma separated stages, default all")
+    parser.add_argument('--synthetic', type=int, default=100, help="synthetic variants per catalog entry")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help="timed passes per stage, the best is used")
+    parser.add_argument('--save', type=str, help="write the results as baseline to this file")
+    parser.add_argument('--baseline', type=str, help="compare with this baseline file")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="relative increase of time or allocation over the baseline that fails, default 0.25")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
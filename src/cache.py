@@ -0,0 +1,131 @@
+## Cache of calculated Violin geometry
+#
+
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+
+from violin import Violin
+
+# Layout of the stored state, part of the disk key and of the payload.
+# Raise it when Violin attributes or their types change.
+VERSION = 1
+
+class GeometryCache:
+    """
+    Calculated Violin geometry keyed by the normalized parameter tuple.
+
+    Holds at most maxsize instruments in memory, evicting the least
+    recently used. With a directory, geometry is also stored on disk and
+    survives between runs. A hit skips calculate_body_params,
+    calculate_corner_params and the outline calculation.
+    """
+
+    def __init__(self, maxsize=256, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._items = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(params):
+        """
+        Normalized parameter tuple, km is expanded to kmu and kml and h
+        defaults to 100 as in Violin. Values are rounded to 10 decimals
+        so 0.9 and 0.8999999999999999 are the same design.
+        """
+        params = dict(params)
+        if params.get("km") is not None:
+            params["kmu"] = params["kml"] = params["km"]
+        if params.get("h") is None:
+            params["h"] = 100
+        return tuple(round(float(params[p]), 10) for p in Violin.params)
+
+    def _file(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr((VERSION, key)).encode()).hexdigest() + ".pkl")
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._file(key), "rb") as f:
+                version, state = pickle.load(f)
+        except Exception:
+            # Missing, truncated or written by other code, a miss
+            return None
+        if version != VERSION or not isinstance(state, dict) or set(state) != set(Violin.__slots__):
+            return None
+        return state
+
+    def _store(self, key, state):
+        if self.directory is None:
+            return
+        file = self._file(key)
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((VERSION, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, file)
+
+    def _put(self, key, state):
+        self._items[key] = state
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def violin(self, **params) -> Violin:
+        """
+        Returns a calculated Violin, takes the same arguments as Violin
+        """
+        key = self.key(params)
+
+        state = self._items.get(key)
+        if state is not None:
+            self.hits += 1
+            self._items.move_to_end(key)
+        else:
+            state = self._load(key)
+            if state is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                instrument = Violin(**params)
+                instrument.calculate_body_params()
+                instrument.calculate_corner_params()
+                instrument.get_outline_records()
+                state = {a: getattr(instrument, a) for a in Violin.__slots__}
+                self._store(key, state)
+            self._put(key, state)
+
+        instrument = Violin.__new__(Violin)
+        for a, value in state.items():
+            setattr(instrument, a, value)
+        return instrument
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def info(self):
+        """
+        Returns:
+            dict: hits, disk_hits, misses, evictions, size and maxsize
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+        }
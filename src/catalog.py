@@ -0,0 +1,250 @@
+## Instrument catalog, data/instruments.json
+#
+#  {
+#      "<instrument>": {
+#          "<maker>": [ { "name": ..., "year": ..., <Violin parameters> }, ... ]
+#      }
+#  }
+#
+#  Lookups go through an SQLite index next to the file (<file>.index),
+#  rebuilt when the file's modification time or size changed, or in the
+#  temporary directory when the catalog directory is not writable.
+#
+
+import os
+import json
+import sqlite3
+from contextlib import closing, suppress
+
+# Layout of the index, part of its signature
+INDEX_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE meta (signature TEXT);
+CREATE TABLE instruments (seq INTEGER PRIMARY KEY, name TEXT, key TEXT);
+CREATE TABLE makers (seq INTEGER PRIMARY KEY, instrument TEXT, name TEXT, key TEXT);
+CREATE TABLE models (seq INTEGER PRIMARY KEY, instrument TEXT, maker TEXT, name TEXT, year TEXT, entry TEXT);
+CREATE INDEX instruments_key ON instruments (key);
+CREATE INDEX makers_key ON makers (instrument, key);
+CREATE INDEX models_maker ON models (instrument, maker);
+"""
+
+class Catalog:
+    """
+    Read only view of the instrument catalog.
+
+    The file is never written unless save() is called. Lookups are case
+    insensitive and read only the rows they need from an index of
+    instrument -> maker -> (name, year) kept on disk, so their cost does
+    not grow with the catalog. The file itself is only parsed to build
+    the index and for data, entries and unfiltered select.
+    """
+
+    def __init__(self, file="data/instruments.json", index=None):
+        """
+        Args:
+            file (str): Catalog file
+            index (str): (Optional) Index file, default <file>.index
+        """
+        self.file = file
+        self.index = index or f"{file}.index"
+        self._data = None
+        self._index_file = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            with open(self.file, "r") as jsonfile:
+                self._data = json.load(jsonfile)
+        return self._data
+
+    def save(self, file=None, indent=4):
+        """
+        Writes the catalog, formatted with the given indent. The file is
+        replaced at once, a failure leaves the previous one.
+        """
+        # Read before the file is replaced
+        data = self.data
+        file = file or self.file
+        tmp = f"{file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as jsonfile:
+                jsonfile.write(json.dumps(data, indent=indent))
+            os.replace(tmp, file)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+
+    def _signature(self):
+        st = os.stat(self.file)
+        return f"{INDEX_VERSION} {st.st_mtime_ns} {st.st_size}"
+
+    def _fresh(self, index, signature):
+        if not os.path.exists(index):
+            return False
+        try:
+            with closing(sqlite3.connect(index)) as db:
+                return db.execute("SELECT signature FROM meta").fetchone() == (signature,)
+        except sqlite3.Error:
+            return False
+
+    def _build(self, index, signature):
+        tmp = f"{index}.{os.getpid()}.tmp"
+        with suppress(FileNotFoundError):
+            os.remove(tmp)
+        try:
+            with closing(sqlite3.connect(tmp)) as db:
+                with db:
+                    db.executescript(_SCHEMA)
+                    db.execute("INSERT INTO meta VALUES (?)", (signature,))
+                    for instrument, makers in self.data.items():
+                        db.execute("INSERT INTO instruments (name, key) VALUES (?, ?)", (instrument, instrument.casefold()))
+                        for maker, models in makers.items():
+                            db.execute("INSERT INTO makers (instrument, name, key) VALUES (?, ?, ?)", (instrument, maker, maker.casefold()))
+                            db.executemany(
+                                "INSERT INTO models (instrument, maker, name, year, entry) VALUES (?, ?, ?, ?, ?)",
+                                ((instrument, maker, str(e['name']), str(e['year']), json.dumps(e)) for e in models)
+                            )
+            os.replace(tmp, index)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+
+    def _fallback(self):
+        # Index in the temporary directory, one per catalog path
+        import hashlib
+        import tempfile
+        return os.path.join(tempfile.gettempdir(), hashlib.sha1(os.path.abspath(self.file).encode()).hexdigest() + ".index")
+
+    def _ensure(self, index, signature):
+        # The index file, built if stale, None if it cannot be written
+        if self._fresh(index, signature):
+            return index
+        try:
+            self._build(index, signature)
+        except (OSError, sqlite3.Error):
+            return None
+        return index
+
+    def _index(self):
+        # Index file matching the catalog file, next to it or else in the
+        # temporary directory
+        if self._index_file is None:
+            signature = self._signature()
+            self._index_file = self._ensure(self.index, signature) or self._ensure(self._fallback(), signature)
+            if self._index_file is None:
+                raise OSError(f"Cannot write an index of {self.file}")
+        return self._index_file
+
+    def _query(self, sql, *args):
+        with closing(sqlite3.connect(self._index())) as db:
+            return db.execute(sql, args).fetchall()
+
+    def _instrument_key(self, instrument):
+        # The last of spellings differing in case, as a dict by casefold
+        rows = self._query("SELECT name FROM instruments WHERE key = ? ORDER BY seq DESC LIMIT 1", instrument.casefold())
+        return rows[0][0] if rows else None
+
+    def _maker_key(self, instrument, maker):
+        rows = self._query("SELECT name FROM makers WHERE instrument = ? AND key = ? ORDER BY seq DESC LIMIT 1", instrument, maker.casefold())
+        return rows[0][0] if rows else None
+
+    def _models(self, instrument, maker):
+        # (name, year, entry) of the maker in catalog order
+        return self._query("SELECT name, year, entry FROM models WHERE instrument = ? AND maker = ? ORDER BY seq", instrument, maker)
+
+    def instruments(self):
+        return [name for name, in self._query("SELECT name FROM instruments ORDER BY seq")]
+
+    def instrument(self, instrument):
+        """
+        Returns:
+            str: Catalog spelling of the instrument, None if not found
+        """
+        return self._instrument_key(instrument)
+
+    def makers(self, instrument):
+        """
+        Returns:
+            list: Makers of the instrument, None if the instrument is not found
+        """
+        instrument = self._instrument_key(instrument)
+        if instrument is None:
+            return None
+        return [name for name, in self._query("SELECT name FROM makers WHERE instrument = ? ORDER BY seq", instrument)]
+
+    def models(self, instrument, maker):
+        """
+        Returns:
+            list: Entries of the maker, None if instrument or maker is not found
+        """
+        instrument = self._instrument_key(instrument)
+        if instrument is None:
+            return None
+        maker = self._maker_key(instrument, maker)
+        if maker is None:
+            return None
+        return [json.loads(e) for _, _, e in self._models(instrument, maker)]
+
+    def _find(self, instrument, maker, model):
+        # Rows of the matching entries, with the catalog spellings
+        instrument = self._instrument_key(instrument)
+        if instrument is None:
+            return None, None, []
+        maker = self._maker_key(instrument, maker)
+        if maker is None:
+            return instrument, None, []
+
+        rows = self._models(instrument, maker)
+        found = [r for r in rows if r[0].casefold() == model.casefold()] or [r for r in rows if r[1] == model]
+        if not found:
+            found = [r for r in rows if model.casefold() in r[0].casefold() or r[1] in model]
+        return instrument, maker, found
+
+    def find(self, instrument, maker, model):
+        """
+        Finds entries by name or year. An exact (case insensitive) name or
+        year is returned if there is one, otherwise entries whose name
+        contains model, or whose year is part of model.
+
+        Returns:
+            list: Matching entries
+        """
+        _, _, found = self._find(instrument, maker, model)
+        return [json.loads(e) for _, _, e in found]
+
+    def entries(self):
+        """
+        Yields (instrument, maker, entry) for the whole catalog
+        """
+        for instrument, makers in self.data.items():
+            for maker, models in makers.items():
+                for entry in models:
+                    yield instrument, maker, entry
+
+    def select(self, instrument=None, maker=None, model=None):
+        """
+        Yields (instrument, maker, entry) of the entries matching the given
+        instrument, maker and model (see find), all if none is given
+        """
+        if not instrument:
+            for i, m, entry in self.entries():
+                if not maker or m.casefold() == maker.casefold():
+                    yield i, m, entry
+            return
+        key = self._instrument_key(instrument)
+        if key is None:
+            return
+        if maker and model is not None:
+            key, maker_key, found = self._find(instrument, maker, model)
+            for _, _, e in found:
+                yield key, maker_key, json.loads(e)
+            return
+        if maker:
+            rows = self._query("SELECT maker, entry FROM models WHERE instrument = ? AND maker = ? ORDER BY seq", key, self._maker_key(key, maker))
+        else:
+            rows = self._query("SELECT maker, entry FROM models WHERE instrument = ? ORDER BY seq", key)
+        for m, e in rows:
+            yield key, m, json.loads(e)
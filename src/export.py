@@ -0,0 +1,311 @@
+## DXF and G-code export of outlines and templates for CNC cutting
+#
+#  python src/main.py export [-t] [-f dxf|gcode] [-o file] [instrument] [maker] [model]
+#
+#  Profiles are written from the arc segments (arcs.py), so the DXF has
+#  true ARC entities and the G-code G2/G3 moves, no flattening. Parts are
+#  placed side by side along x and written one at a time, a whole catalog
+#  goes through in one pass.
+#
+
+import sys
+import math
+import argparse
+
+from writer import ChunkWriter
+from catalog import Catalog
+import render
+
+def profile(segments, lines=()):
+    """
+    Elements of a closed profile: ("arc", record) for each ARC record,
+    then ("line", p0, p1) for each line, starting at the end of the
+    previous element.
+
+    Args:
+        segments (ndarray): arcs.ARC records of one outline
+        lines (list): End points of lines following the arcs
+    """
+    for s in segments:
+        yield ("arc", s)
+    p0 = (segments[-1]["x1"], segments[-1]["y1"])
+    for p1 in lines:
+        yield ("line", p0, p1)
+        p0 = p1
+
+def outline_profile(instrument, offset=0):
+    """
+    Closed outline of a calculated instrument, clockwise, offset by
+    offset mm (outwards > 0, see Violin.get_offset_outline)
+    """
+    return list(profile(instrument.get_offset_outline(offset) if offset else instrument.get_outline()))
+
+def template_profile(instrument):
+    """
+    Closed template outline of a calculated instrument, clockwise,
+    see Violin.get_template_profile
+    """
+    return list(profile(*instrument.get_template_profile()))
+
+def _start(e):
+    return (e[1]["x0"], e[1]["y0"]) if e[0] == "arc" else e[1]
+
+def _direction(e):
+    # Unit tangent at the start of an element
+    if e[0] == "line":
+        dx, dy = e[2][0]-e[1][0], e[2][1]-e[1][1]
+        d = math.hypot(dx, dy)
+        return dx/d, dy/d
+    a = e[1]["a0"]
+    return (math.sin(a), -math.cos(a)) if e[1]["dir"] else (-math.sin(a), math.cos(a))
+
+class DxfWriter(ChunkWriter):
+    """
+    Streaming DXF (R12, ASCII) output in mm. Arcs are written as ARC
+    entities, template holes as CIRCLE entities.
+    """
+
+    def _entity(self, kind, layer, *groups):
+        self.write(f"0\n{kind}\n8\n{layer}\n")
+        self.write("".join(f"{code}\n{value:.6f}\n" for code, value in groups))
+
+    def begin(self):
+        self.write("0\nSECTION\n2\nHEADER\n9\n$INSUNITS\n70\n4\n9\n$MEASUREMENT\n70\n1\n0\nENDSEC\n")
+        self.write("0\nSECTION\n2\nENTITIES\n")
+        self.offset = (0, 0)
+
+    def end(self):
+        self.write("0\nENDSEC\n0\nEOF\n")
+        self.flush()
+
+    def part(self, label, offset):
+        """
+        Starts a part, following coordinates are moved by offset
+        """
+        self.write(f"999\n{label}\n")
+        self.offset = offset
+
+    def contour(self, elements, layer="OUTLINE"):
+        ox, oy = self.offset
+        for e in elements:
+            if e[0] == "arc":
+                s = e[1]
+                # DXF arcs go counterclockwise from start to end angle
+                a0, a1 = (s["a1"], s["a0"]) if s["dir"] else (s["a0"], s["a1"])
+                self._entity("ARC", layer, (10, s["cx"]+ox), (20, s["cy"]+oy), (30, 0), (40, s["r"]),
+                             (50, math.degrees(a0) % 360), (51, math.degrees(a1) % 360))
+            else:
+                (x0, y0), (x1, y1) = e[1], e[2]
+                self._entity("LINE", layer, (10, x0+ox), (20, y0+oy), (30, 0), (11, x1+ox), (21, y1+oy), (31, 0))
+
+    def sheet(self, index, width, height, spacing):
+        """
+        Starts a sheet, drawn on the SHEET layer beside the previous ones
+
+        Returns:
+            tuple: Origin of the sheet
+        """
+        x = index*(width + spacing)
+        corners = [(x, 0), (x + width, 0), (x + width, height), (x, height)]
+        for (x0, y0), (x1, y1) in zip(corners, corners[1:] + corners[:1]):
+            self._entity("LINE", "SHEET", (10, x0), (20, y0), (30, 0), (11, x1), (21, y1), (31, 0))
+        return x, 0
+
+    def holes(self, centers, r, layer="HOLES"):
+        ox, oy = self.offset
+        for c in centers:
+            self._entity("CIRCLE", layer, (10, c[0]+ox), (20, c[1]+oy), (30, 0), (40, r))
+
+class GcodeWriter(ChunkWriter):
+    """
+    Streaming G-code output in mm for a router.
+
+    Contours are cut in passes of step_down with cutter radius
+    compensation (G41/G42 with the D register of the tool), so the tool
+    diameter is set on the machine. The contour is approached and left
+    along its normal, lead must be larger than the tool radius. Holes are
+    drilled with canned cycles (G81).
+
+    Args:
+        sink: Text or binary file-like object
+        feed (float): Cutting feed (mm/min)
+        plunge (float): Plunge and drilling feed (mm/min)
+        depth (float): Cutting depth, the material thickness (mm)
+        step_down (float): Depth per pass (mm)
+        safe_z (float): Height for rapid moves (mm)
+        lead (float): Length of lead in and lead out (mm)
+        side (str): Side of the (clockwise) contour to cut on, outside keeps the part, inside the hole
+        tool (int): Tool and compensation register
+    """
+
+    def __init__(self, sink, chunk_size=1<<16, feed=1000, plunge=300, depth=6, step_down=2, safe_z=5, lead=5, side="outside", tool=1):
+        if side not in ("outside", "inside"):
+            raise ValueError(f"side must be outside or inside, not {side}")
+        super().__init__(sink, chunk_size=chunk_size)
+        self.feed = feed
+        self.plunge = plunge
+        self.depth = depth
+        self.step_down = step_down
+        self.safe_z = safe_z
+        self.lead = lead
+        self.side = side
+        self.tool = tool
+        self.offset = (0, 0)
+
+    def _xy(self, p):
+        return f"X{p[0]+self.offset[0]:.4f} Y{p[1]+self.offset[1]:.4f}"
+
+    def begin(self):
+        self.write("%\nG21 G90 G17 G40 G49 G80\n")
+        self.write(f"T{self.tool} M6\nG0 Z{self.safe_z:.4f}\nM3\n")
+
+    def end(self):
+        self.write(f"G0 Z{self.safe_z:.4f}\nM5\nM30\n%\n")
+        self.flush()
+
+    def part(self, label, offset):
+        """
+        Starts a part, following coordinates are moved by offset
+        """
+        self.write(f"({label.replace('(', '[').replace(')', ']')})\n")
+        self.offset = offset
+
+    def sheet(self, index, width, height, spacing):
+        """
+        Starts a sheet, after the first one the program stops for the sheet change
+
+        Returns:
+            tuple: Origin of the sheet
+        """
+        if index > 0:
+            self.write(f"G0 Z{self.safe_z:.4f}\nM5\nM0 (sheet {index+1})\nM3\n")
+        return 0, 0
+
+    def _passes(self):
+        n = max(math.ceil(self.depth/self.step_down - 1e-9), 1)
+        return [self.depth*(i+1)/n for i in range(n)]
+
+    def contour(self, elements, layer=None):
+        elements = list(elements)
+        start = _start(elements[0])
+        tx, ty = _direction(elements[0])
+        # Left of travel is the outside of a clockwise contour
+        s = 1 if self.side == "outside" else -1
+        approach = (start[0] - s*ty*self.lead, start[1] + s*tx*self.lead)
+        compensation = "G41" if self.side == "outside" else "G42"
+
+        self.write(f"G0 {self._xy(approach)}\n")
+        for z in self._passes():
+            self.write(f"G1 Z{-z:.4f} F{self.plunge}\n")
+            self.write(f"{compensation} D{self.tool} G1 {self._xy(start)} F{self.feed}\n")
+            for e in elements:
+                if e[0] == "arc":
+                    a = e[1]
+                    self.write(f"{'G2' if a['dir'] else 'G3'} {self._xy((a['x1'], a['y1']))} "
+                               f"I{a['cx']-a['x0']:.4f} J{a['cy']-a['y0']:.4f}\n")
+                else:
+                    self.write(f"G1 {self._xy(e[2])}\n")
+            self.write(f"G40 G1 {self._xy(approach)}\n")
+        self.write(f"G0 Z{self.safe_z:.4f}\n")
+
+    def holes(self, centers, r=None, layer=None):
+        """
+        Drills the holes through with G81, the drill is chosen for the hole
+        size on the machine
+        """
+        centers = list(centers)
+        if not centers:
+            return
+        self.write(f"G98 G81 {self._xy(centers[0])} Z{-self.depth:.4f} R{self.safe_z:.4f} F{self.plunge}\n")
+        for c in centers[1:]:
+            self.write(f"{self._xy(c)}\n")
+        self.write("G80\n")
+
+def write_parts(writer, parts, template=False, gap=20, offset=0):
+    """
+    Writes instruments side by side
+
+    Args:
+        writer (DxfWriter or GcodeWriter): Output
+        parts: (label, type, instrument) with a calculated instrument, type is the instrument type for the template holes
+        template (bool): Write the template with its holes instead of the outline
+        gap (float): Space between parts (mm)
+        offset (float): Offset of the outline (mm), e.g. the overhang for the plates
+
+    Returns:
+        int: Number of parts
+    """
+    hole_r = 1 # mm, as in Violin.write_template
+    # Outlines grown outwards keep to the positive quadrant
+    margin = 0 if template else max(offset, 0)
+    x = 0
+    n = 0
+    writer.begin()
+    for label, type, instrument in parts:
+        writer.part(label, (x + margin, margin))
+        if template:
+            writer.contour(template_profile(instrument), layer="TEMPLATE")
+            writer.holes(instrument.get_template_holes(type), hole_r)
+            x += instrument.get_template_profile()[1][0][0]
+        else:
+            writer.contour(outline_profile(instrument, offset), layer="OUTLINE")
+            x += 2*instrument.rl + 2*margin
+        x += gap
+        n += 1
+    writer.end()
+    return n
+
+def main(args):
+    catalog = Catalog(args.file)
+    entries = catalog.select(args.instrument, args.maker, args.model)
+    cache = render.process_cache(args.cache_dir)
+    parts = ((f"{i} {m} {e['name']} {e['year']}", i, render.violin_from_entry(e, cache=cache)) for i, m, e in entries)
+
+    file = args.output or f"out.{'nc' if args.format == 'gcode' else 'dxf'}"
+    try:
+        if args.format == "gcode":
+            writer = GcodeWriter.open(file, feed=args.feed, plunge=args.plunge, depth=args.depth, step_down=args.step_down,
+                                      safe_z=args.safe_z, lead=args.lead, side=args.side, tool=args.tool)
+        else:
+            writer = DxfWriter.open(file)
+    except OSError as e:
+        print(f"export: {e}", file=sys.stderr)
+        return 1
+
+    with writer:
+        n = write_parts(writer, parts, template=args.template, gap=args.gap, offset=args.offset)
+
+    if n == 0:
+        print("export: no matching instruments", file=sys.stderr)
+        return 1
+    print(f"{n} parts written to {file}", file=sys.stderr)
+    return 0
+
+def parser(prog="export"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Export outlines or templates as DXF or G-code, all matching catalog entries side by side"
+    )
+    parser.add_argument('instrument', nargs='?')
+    parser.add_argument('maker', nargs='?')
+    parser.add_argument('model', nargs='?')
+    parser.add_argument('-t', '--template', action='store_true')
+    parser.add_argument('-f', '--format', choices=["dxf", "gcode"], default="dxf")
+    parser.add_argument('-o', '--output', type=str, help="output file, default out.dxf or out.nc")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--gap', type=float, default=20, help="space between parts in mm")
+    parser.add_argument('--offset', type=float, default=0, help="offset of the outline in mm, outwards > 0 (overhang), inwards < 0")
+    parser.add_argument('--feed', type=float, default=1000, help="cutting feed in mm/min")
+    parser.add_argument('--plunge', type=float, default=300, help="plunge and drilling feed in mm/min")
+    parser.add_argument('--depth', type=float, default=6, help="material thickness in mm")
+    parser.add_argument('--step_down', type=float, default=2, help="depth per pass in mm")
+    parser.add_argument('--safe_z', type=float, default=5)
+    parser.add_argument('--lead', type=float, default=5, help="lead in length in mm, larger than the tool radius")
+    parser.add_argument('--side', choices=["outside", "inside"], default="outside",
+                        help="outside cuts out the part (template), inside the hole (mold)")
+    parser.add_argument('--tool', type=int, default=1, help="tool and cutter compensation register")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
@@ -1,79 +1,121 @@
 import math
 
+import numpy as np
+
 def pyth_add(a, b):
     return math.sqrt(math.pow(a,2) + math.pow(b,2))
 
 def pyth_sub(a, b):
     return math.sqrt(math.pow(a,2) - math.pow(b,2))
 
-def arc_abs_to_rel(p0, p1, r, dir=True):
-    return svg.a(r,r,0,False,dir,p1[0]-p0[0], p1[1]-p0[1])
-
 def line_circle_intersect(ccenter, cradius, p0, p1):
-    # setting circle center to origo
-    a = (p0[0], p0[1])
-    b = (p1[0], p1[1])
-
-    # setting line to y = mx + c
-    m = (b[1]-a[1]) / (b[0]-a[0])
-    c = a[1]-m*a[0]
+    # line as p0 + t*(p1-p0), vertical lines need no special case
+    dx, dy = p1[0]-p0[0], p1[1]-p0[1]
+    fx, fy = p0[0]-ccenter[0], p0[1]-ccenter[1]
 
-    h = ccenter[0]
-    k = ccenter[1]
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    discriminant = b*b - a*(fx*fx + fy*fy - cradius*cradius)
 
-    A = 1 + math.pow(m,2)
-    B = 2 * (m * (c - k) - h)
-    C = math.pow(h,2) + math.pow(c-k,2) - math.pow(cradius,2)
-
-    discriminant = math.pow(B,2) - 4 * A * C
-    
     if discriminant < 0:
         return []
     elif discriminant == 0:
-        x = -B / (2 * A)
-        y = m * x + c
-        return [(x, y)]
-    else:   
+        t = -b / a
+        return [(p0[0] + t*dx, p0[1] + t*dy)]
+    else:
         sqrt_discriminant = math.sqrt(discriminant)
-        x1 = (-B + sqrt_discriminant) / (2 * A)
-        x2 = (-B - sqrt_discriminant) / (2 * A)
-        y1 = m * x1 + c
-        y2 = m * x2 + c
-        return [(x1, y1), (x2, y2)]
+        points = [(p0[0] + t*dx, p0[1] + t*dy) for t in ((-b + sqrt_discriminant) / a, (-b - sqrt_discriminant) / a)]
+        # larger x first
+        return sorted(points, reverse=True)
 
 def circle_circle_intersect(c0, r0, c1, r1):
-    # circle 1: c0=(x0, y0), radius r0
-    # circle 2: c1=(x1, y1), radius r1
-
-    x0,y0 = c0
-    x1,y1 = c1
-
-    d=math.sqrt((x1-x0)**2 + (y1-y0)**2)
-    
-    # non intersecting
-    if d > r0 + r1 :
-        r0 = d-r1
-    # One circle within other
-    elif d < abs(r0-r1):
-        r0 = d-r1
-    # coincident circles
-    elif d == 0 and r0 == r1:
+    """
+    Intersections of two circles, circle_circle_intersections with
+    touch=True for one pair: circles that don't meet are moved to touch,
+    r0 becomes d - r1.
+
+    Returns:
+        list: No point for concentric circles, one where they touch, else
+            the point right of the line from c0 to c1 and the one left of it
+    """
+    right, left, valid = circle_circle_intersections(c0, r0, c1, r1, touch=True)
+    if not valid:
         return []
-    
-    a=(math.pow(r0,2)-math.pow(r1,2)+math.pow(d,2))/(2*d)
-    x2=x0+a*(x1-x0)/d   
-    y2=y0+a*(y1-y0)/d 
-      
-    # single intersect 
-    if d == r0+r1 or abs(r0) < abs(a):
-        return [(x2,y2)]
-    else:
-        h=math.sqrt(math.pow(r0,2)-math.pow(a,2))
-        x3=x2+h*(y1-y0)/d     
-        y3=y2-h*(x1-x0)/d 
+    right, left = (float(right[0]), float(right[1])), (float(left[0]), float(left[1]))
+    return [right] if right == left else [right, left]
+
+
+def line_circle_intersections(c, r, p0, p1, tol=1e-9):
+    """
+    Intersections of N lines with N circles, as arrays.
+
+    The line through p0 and p1 is p0 + t*(p1-p0), so vertical lines need
+    no special case. A line passing the circle closer than tol*r is taken
+    as tangent and touches it in one point, returned twice.
+
+    Args:
+        c (tuple): Circle centers (x, y)
+        r: Circle radii
+        p0, p1 (tuple): Two distinct points (x, y) on each line
+        tol (float): Relative tolerance of the tangency
+
+    Returns:
+        tuple: Intersections (x, y) at the larger t
+        tuple: Intersections (x, y) at the smaller t
+        ndarray: Mask of the lines meeting their circle, the points are NaN elsewhere
+    """
+    dx, dy = np.subtract(p1[0], p0[0]), np.subtract(p1[1], p0[1])
+    fx, fy = np.subtract(p0[0], c[0]), np.subtract(p0[1], c[1])
+    r = np.asarray(r, dtype=float)
+
+    a = dx*dx + dy*dy
+    b = fx*dx + fy*dy
+    # Squared distance of the line from the center is (f.f - b^2/a),
+    # the discriminant is a times r^2 minus that
+    discriminant = b*b - a*(fx*fx + fy*fy - r*r)
+    valid = (a > 0) & (discriminant >= -2*tol*a*r*r)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        s = np.where(valid, np.sqrt(np.maximum(discriminant, 0)), np.nan)
+        t1, t2 = (-b + s)/a, (-b - s)/a
+
+    x0, y0 = np.asarray(p0[0], dtype=float), np.asarray(p0[1], dtype=float)
+    return (x0 + t1*dx, y0 + t1*dy), (x0 + t2*dx, y0 + t2*dy), valid
+
+def circle_circle_intersections(c0, r0, c1, r1, tol=1e-9, touch=False):
+    """
+    Intersections of N pairs of circles, as arrays.
+
+    Circles missing each other by less than about tol*(r0+r1) are taken
+    as tangent and touch in one point, returned twice.
+
+    Args:
+        c0, c1 (tuple): Circle centers (x, y)
+        r0, r1: Circle radii
+        tol (float): Relative tolerance of the tangency
+        touch (bool): Where the circles don't meet, use r0 = d - r1 so they
+            touch (as circle_circle_intersect does) instead of masking them
+
+    Returns:
+        tuple: Intersections (x, y) right of the line from c0 to c1
+        tuple: Intersections (x, y) left of it
+        ndarray: Mask of the circles meeting, the points are NaN elsewhere
+    """
+    ex, ey = np.subtract(c1[0], c0[0]), np.subtract(c1[1], c0[1])
+    r0, r1 = np.asarray(r0, dtype=float), np.asarray(r1, dtype=float)
+    d = np.hypot(ex, ey)
+
+    apart = (d > r0 + r1) | (d < np.abs(r0 - r1))
+    if touch:
+        r0 = np.where(apart, d - r1, r0)
 
-        x4=x2-h*(y1-y0)/d
-        y4=y2+h*(x1-x0)/d
-        
-        return [(x3, y3), (x4, y4)]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ex, ey = ex/d, ey/d
+        # Distance of the chord from c0 along c0 -> c1 and half its length
+        a = (r0*r0 - r1*r1 + d*d)/(2*d)
+        hh = r0*r0 - a*a
+        valid = (d > 0) & ((hh >= -2*tol*np.abs(r0*r1)) | (touch & apart))
+        h = np.where(valid, np.sqrt(np.maximum(hh, 0)), np.nan)
 
+    x2, y2 = c0[0] + a*ex, c0[1] + a*ey
+    return (x2 + h*ey, y2 - h*ex), (x2 - h*ey, y2 + h*ex), valid
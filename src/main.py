@@ -1,65 +1,27 @@
-import json
+import sys
+import importlib
 import argparse
-import violin
-from svg import Svg
+import catalog
 
-def load_instruments(file="data/instruments.json"):
-    instruments = None
-    with open(file, "r") as jsonfile:
-        jsonstr = jsonfile.read()
-        instruments = json.loads(jsonstr)
-    return instruments
+def main(args):
+    instruments = catalog.Catalog()
 
-def save_instruments(instruments, file="data/instruments.json", indent=None):
-    if instruments is None:
-        return 1
-    with open(file, "w") as jsonfile:
-        jsonfile.write(json.dumps(instruments, indent=indent))
+    if args.tidy:
+        instruments.save(indent=4)
 
-    return 0
+    selection = None
+    if args.instrument and args.maker and args.model is not None:
+        selection = instruments.find(args.instrument, args.maker, args.model)
 
+    if selection is not None and len(selection) == 1:
+        # Geometry and numpy are only loaded to render, listings stay fast
+        import render
+        from cache import GeometryCache
+        from svg import Svg, SvgWriter
+
+        cache = GeometryCache(directory=args.cache_dir) if args.cache_dir else None
+        instrument = render.violin_from_entry(selection[0], cache=cache)
 
-def main(args):
-    # json cleanup each time :)
-    data = load_instruments()
-    save_instruments(data, indent=4)
-
-    #TODO: make this case insensitive
-    selection = data[args.instrument] if args.instrument and args.instrument.casefold() in [x.casefold() for x in data.keys()] else data   
-    selection = selection[args.maker] if selection and args.maker and args.maker.casefold() in [x.casefold() for x in selection.keys()] else selection
-    
-    if args.model:
-        fltr = lambda x: args.model.casefold() in x['name'].casefold() or str(x['year']) in args.model
-        selection = [x for x in filter(fltr, selection)]
-
-    if (args.model is not None) and len(selection) == 1:
-        
-        if 'km' in selection[0]:
-            kmu = selection[0]['km']
-            kml = selection[0]['km']
-        else:
-            kmu = selection[0]['kmu']
-            kml = selection[0]['kml']
-
-        instrument = violin.Violin(
-            h=selection[0]['h'],
-            kc=selection[0]['kc'],
-            ku=selection[0]['ku'],
-            kmu=kmu,
-            kml=kml,
-            kw=selection[0]['kw'],
-            b1=selection[0]['b1'],
-            b2=selection[0]['b2'],
-            bu=selection[0]['bu'],
-            bl=selection[0]['bl'],
-            cu1=selection[0]['cu1'],
-            cu2=selection[0]['cu2'],
-            cl1=selection[0]['cl1'],
-            cl2=selection[0]['cl2']
-        )
-        instrument.calculate_body_params()
-        instrument.calculate_corner_params()
-        
         height, width = instrument.get_dimensions()
 
         transpose = [0,0]
@@ -79,44 +41,47 @@ def main(args):
 
             image = f"<image href=\"{args.image}\" width=\"{image_size}\" height=\"{image_size}\" x=\"{image_dx}\" y=\"{image_dy}\"/> \n" 
 
-        svgstr = f"<svg xmlns=\"http://www.w3.org/2000/svg\" width=\"{width}\" height=\"{height}\">\n"
-        svgstr += image
-
         color = args.color if args.color else "black"
 
-        if args.template:
-            svgstr += instrument.get_template(color=color, move=transpose, type=args.instrument) + "\n"
-        else:
-            svgstr += instrument.get_outline_path(color=color, move=transpose) + "\n"
-            if "af" in selection[0]:
-                afc = selection[0]['afc'] if 'afc' in selection[0] else None
-                afd = selection[0]['afd'] if 'afd' in selection[0] else None
-                svgstr += instrument.get_arches_path_on_outline(selection[0]["af"], afc=afc, afd=afd, move=transpose)
-                svgstr += "\n"
-            if "ab" in selection[0]:
-                svgstr += instrument.get_arches_path_on_outline(-selection[0]["ab"], color="yellow", long_color="cyan", move=transpose)
-                svgstr += "\n"
-
-        if args.circles:
-            svgstr += instrument.get_circles_svg(move=transpose)
-        
-        svgstr += "</svg>\n"
-        with open("out.svg", "w") as fout:
-            fout.write(svgstr)
+        with SvgWriter.open("out.svg") as writer:
+            render.write_svg(writer, instrument, selection[0], type=instruments.instrument(args.instrument), template=args.template, 
+                             circles=args.circles, color=color, transpose=transpose, image=image, offsets=args.offsets)
         
         print(instrument.get_dimensions_mm())
 
 
+    elif selection:
+        for i in selection:
+            print(f"{i['name']} {i['year']}")
+    elif args.maker is not None and instruments.models(args.instrument, args.maker) is not None:
+        for i in instruments.models(args.instrument, args.maker):
+            print(f"{i['name']} {i['year']}")
+    elif args.instrument is not None and instruments.makers(args.instrument) is not None:
+        for i in instruments.makers(args.instrument):
+            print(i)
     else:
-        if args.maker is not None:
-            for i in selection:
-                print(f"{i['name']} {i['year']}")
-        else:
-            for i in selection.keys():
-                print(i)
+        for i in instruments.instruments():
+            print(i)
 
 if __name__ == '__main__':
 
+    # Subcommands, each module has parser() and main(args)
+    commands = {
+        'sweep': 'sweep',
+        'fit': 'solver',
+        'export': 'export',
+        'stl': 'stl',
+        'bench': 'bench',
+        'serve': 'server',
+        'render': 'render',
+        'watch': 'watch',
+        'mass': 'mass',
+        'nest': 'nesting',
+    }
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        command = importlib.import_module(commands[sys.argv[1]])
+        sys.exit(command.main(command.parser(prog=f"FourCircle {sys.argv[1]}").parse_args(sys.argv[2:])))
+
     parser = argparse.ArgumentParser(
         prog='FourCircle'
     )
@@ -126,8 +91,12 @@ if __name__ == '__main__':
     parser.add_argument('model', nargs='?')
     parser.add_argument('-t', '--template', action='store_true')
     parser.add_argument('-c','--circles', action='store_true')
+    parser.add_argument('--tidy', action='store_true', help="rewrite the catalog file formatted")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
     parser.add_argument('-i', '--image', type=str)
     parser.add_argument('--color', type=str)
+    parser.add_argument('--offsets', type=lambda v: [float(d) for d in v.split(",")], default=[],
+                        help="comma separated offset lines in mm, outwards > 0 (overhang), inwards < 0 (linings, purfling), exact with round corners")
     parser.add_argument('--image_dx', type=float)
     parser.add_argument('--image_dy', type=float)
     parser.add_argument('--image_resize', type=float)
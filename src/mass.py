@@ -0,0 +1,110 @@
+## Volume and mass of the arched plates
+#
+#  python src/main.py mass [--plate top|back] [--thickness mm | --zones 0:3.2,0.3:2.6,0.8:3] [--density g/cm3] [instrument] [maker] [model]
+#
+#  The top uses the front arching (af, afc, afd), the back the back
+#  arching (ab) of the catalog entries, entries without it are skipped.
+#  Zones give the thickness from a relative arch height on (0 at the
+#  edge, 1 at the top), see arching.zones. The plates of all matching
+#  entries are integrated at once, see ViolinBatch.get_plate.
+#
+
+import sys
+import argparse
+
+import numpy as np
+
+import render
+from batch import ViolinBatch
+from arching import zones
+from catalog import Catalog
+
+# g/cm3, spruce and maple
+DENSITY = {"top": 0.40, "back": 0.60}
+
+def parse_zones(spec):
+    """
+    Args:
+        spec (str): level:thickness,level:thickness,...
+
+    Returns:
+        list: (level, thickness)
+    """
+    try:
+        levels = [tuple(float(v) for v in z.split(":")) for z in spec.split(",")]
+    except ValueError:
+        levels = None
+    if not levels or any(len(l) != 2 for l in levels):
+        raise ValueError(f"Invalid zones '{spec}', expected level:thickness,...")
+    if any(t <= 0 for _, t in levels):
+        raise ValueError(f"Invalid zones '{spec}', thicknesses must be positive")
+    return levels
+
+def arch(entry, plate):
+    """
+    Returns:
+        tuple: (h, afc, afd) of the plate, None if the entry has no arching for it
+    """
+    if plate == "top":
+        return (entry["af"], entry.get("afc"), entry.get("afd")) if "af" in entry else None
+    return (-entry["ab"], None, None) if "ab" in entry else None
+
+def main(args):
+    if args.thickness <= 0:
+        print(f"mass: thickness must be positive, got {args.thickness}", file=sys.stderr)
+        return 1
+    if args.density is not None and args.density <= 0:
+        print(f"mass: density must be positive, got {args.density}", file=sys.stderr)
+        return 1
+    try:
+        thickness = zones(parse_zones(args.zones)) if args.zones else args.thickness
+    except ValueError as e:
+        print(f"mass: {e}", file=sys.stderr)
+        return 1
+    density = args.density or DENSITY[args.plate]
+
+    catalog = Catalog(args.file)
+    labels, violins, arches = [], [], []
+    skipped = 0
+    for instrument, maker, entry in catalog.select(args.instrument, args.maker, args.model):
+        a = arch(entry, args.plate)
+        if a is None:
+            skipped += 1
+            continue
+        labels.append(f"{instrument} {maker} {entry.get('name')} {entry.get('year')}")
+        violins.append(render.violin_from_entry(entry, calculate=False))
+        arches.append(a)
+
+    if not labels:
+        print(f"mass: no matching instruments with {'af' if args.plate == 'top' else 'ab'}", file=sys.stderr)
+        return 1
+
+    # All plates at once, None (no center arch) becomes NaN
+    h, afc, afd = (np.array(values, dtype=float) for values in zip(*arches))
+    p = ViolinBatch.from_violins(violins).calculate().get_plate(h, thickness=thickness, density=density, afc=afc, afd=afd)
+
+    width = max(len(label) for label in labels)
+    print(f"{'instrument':<{width}}{'area cm2':>12}{'surface cm2':>13}{'volume cm3':>12}{'mass g':>10}")
+    for k, label in enumerate(labels):
+        print(f"{label:<{width}}{p['area'][k]/100:>12.1f}{p['surface'][k]/100:>13.1f}{p['volume'][k]/1000:>12.2f}{p['mass'][k]:>10.1f}")
+    if skipped:
+        print(f"mass: {skipped} instruments without {'af' if args.plate == 'top' else 'ab'} skipped", file=sys.stderr)
+    return 0
+
+def parser(prog="mass"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Volume and mass of the arched top or back plates of the matching catalog entries"
+    )
+    parser.add_argument('instrument', nargs='?')
+    parser.add_argument('maker', nargs='?')
+    parser.add_argument('model', nargs='?')
+    parser.add_argument('--plate', choices=["top", "back"], default="top")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--thickness', type=float, default=3, help="uniform thickness in mm")
+    parser.add_argument('--zones', type=str, help="graduation level:thickness,... by relative arch height")
+    parser.add_argument('--density', type=float, help="g/cm3, default 0.40 for the top and 0.60 for the back")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
@@ -0,0 +1,353 @@
+## Nesting of templates, outlines and arch templates on sheets for cutting
+#
+#  python src/main.py nest [-f dxf|gcode] [-o file] [--sheet 600x400] [--gap 3] [--parts template,outline,arches] [--arch_spacing mm] [instrument] [maker] [model]
+#
+#  Every part is turned so the smallest rectangle around its convex hull
+#  is axis aligned, then the rectangles (grown by the gap) are packed with
+#  MaxRects: each sheet keeps the maximal free rectangles, a part goes
+#  into the one leaving the shortest side over, upright or turned by 90
+#  degrees, on the first sheet it fits. Parts are placed largest first.
+#  All sheets go to one file, side by side in DXF and one after another
+#  with a pause for the sheet change in G-code.
+#
+
+import sys
+import math
+import argparse
+
+import numpy as np
+
+import arcs
+import render
+from catalog import Catalog
+from export import DxfWriter, GcodeWriter, outline_profile, template_profile
+
+PARTS = ("template", "outline", "arches")
+
+def arch_profile(x, y, margin=10):
+    """
+    Closed profile of an arch template, a board with the arch cut into its
+    lower edge, clockwise
+
+    Args:
+        x (ndarray): Arch x, from 0 to the width
+        y (ndarray): Arch heights, from 0 at both ends
+        margin (float): Board beside and above the arch (mm)
+
+    Returns:
+        list: ("line", p0, p1) elements, see export.profile
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.abs(np.asarray(y, dtype=float))
+    w, top = x[-1], y.max() + margin
+    points = [(-margin, 0), (-margin, top), (w + margin, top), (w + margin, 0)]
+    points += list(zip(x[::-1].tolist(), y[::-1].tolist()))
+    return [("line", p0, p1) for p0, p1 in zip(points, points[1:] + points[:1])]
+
+def instrument_parts(label, type, instrument, entry, kinds=PARTS, arch_spacing=None):
+    """
+    Parts of a calculated instrument
+
+    Args:
+        label (str): Label prefix
+        type (str): Instrument type for the template holes
+        entry (dict): instruments.json entry, used for the arching (af, afc, afd, ab)
+        kinds (list): Parts to include, see PARTS
+        arch_spacing (float): (Optional) Cross arch templates every arch_spacing mm instead of the five of Violin.get_arching
+
+    Yields:
+        tuple: (label, elements, hole centers)
+    """
+    if "template" in kinds:
+        yield f"{label} template", template_profile(instrument), instrument.get_template_holes(type)
+    if "outline" in kinds:
+        yield f"{label} outline", outline_profile(instrument), []
+    if "arches" in kinds:
+        for plate, h, afc, afd in (("top", entry.get("af"), entry.get("afc"), entry.get("afd")), ("back", entry.get("ab"), None, None)):
+            if h is None:
+                continue
+            _, _, arches, long = instrument.get_arching(h, afc, afd)
+            if arch_spacing:
+                for y, _, (x, z) in instrument.get_arching_sections(h, spacing=arch_spacing, afc=afc, afd=afd):
+                    yield f"{label} {plate} arch at {y:g} mm", arch_profile(x, z), []
+            else:
+                for k, (x, y) in enumerate(arches):
+                    yield f"{label} {plate} arch {k+1}", arch_profile(x, y), []
+            yield f"{label} {plate} long arch", arch_profile(*long), []
+
+def rotate(elements, angle):
+    """
+    Elements of a profile turned by angle (radians, counterclockwise) about the origin
+    """
+    c, s = math.cos(angle), math.sin(angle)
+    turn = lambda p: (c*p[0] - s*p[1], s*p[0] + c*p[1])
+
+    records = np.array([e[1] for e in elements if e[0] == "arc"], dtype=arcs.ARC)
+    turned = records.copy()
+    for fx, fy in (("cx", "cy"), ("x0", "y0"), ("x1", "y1")):
+        turned[fx] = c*records[fx] - s*records[fy]
+        turned[fy] = s*records[fx] + c*records[fy]
+    turned["a0"] += angle
+    turned["a1"] += angle
+
+    result = []
+    k = 0
+    for e in elements:
+        if e[0] == "arc":
+            result.append(("arc", turned[k]))
+            k += 1
+        else:
+            result.append(("line", turn(e[1]), turn(e[2])))
+    return result
+
+def points(elements, tolerance=0.1):
+    """
+    Points of a profile, the arcs flattened within tolerance
+
+    Returns:
+        ndarray: x
+        ndarray: y
+    """
+    records = np.array([e[1] for e in elements if e[0] == "arc"], dtype=arcs.ARC)
+    x, y = arcs.flatten(records, tolerance) if len(records) else (np.empty(0), np.empty(0))
+    lines = np.array([e[1] for e in elements if e[0] == "line"], dtype=float).reshape(-1, 2)
+    return np.concatenate((x, lines[:,0])), np.concatenate((y, lines[:,1]))
+
+def hull(x, y):
+    """
+    Convex hull by the monotone chain
+
+    Returns:
+        ndarray: Hull points counterclockwise, shape (H, 2)
+    """
+    p = np.unique(np.column_stack((x, y)), axis=0)
+    if len(p) < 3:
+        return p
+
+    def chain(points):
+        h = []
+        for q in points:
+            while len(h) >= 2 and (h[-1][0]-h[-2][0])*(q[1]-h[-2][1]) - (h[-1][1]-h[-2][1])*(q[0]-h[-2][0]) <= 0:
+                h.pop()
+            h.append(q)
+        return h[:-1]
+
+    pl = p.tolist()
+    return np.array(chain(pl) + chain(pl[::-1]))
+
+def min_area_rect(h):
+    """
+    Turn of the smallest rectangle around a convex hull, it has a side on
+    one of the hull edges
+
+    Args:
+        h (ndarray): Hull points, shape (H, 2)
+
+    Returns:
+        float: Angle (radians) turning the rectangle axis aligned
+        float: Width after the turn
+        float: Height after the turn
+    """
+    edges = np.roll(h, -1, axis=0) - h
+    angles = -np.arctan2(edges[:,1], edges[:,0])
+    c, s = np.cos(angles)[:, None], np.sin(angles)[:, None]
+    x = c*h[:,0] - s*h[:,1]
+    y = s*h[:,0] + c*h[:,1]
+    w = x.max(axis=1) - x.min(axis=1)
+    ht = y.max(axis=1) - y.min(axis=1)
+    i = np.argmin(w*ht)
+    return angles[i], w[i], ht[i]
+
+class MaxRects:
+    """
+    Free space of a sheet as the list of maximal free rectangles
+
+    Args:
+        width (float): Sheet width
+        height (float): Sheet height
+    """
+
+    def __init__(self, width, height):
+        self.free = np.array([[0, 0, width, height]], dtype=float)
+
+    def find(self, w, h):
+        """
+        Best short side fit, upright or turned
+
+        Returns:
+            tuple: (leftover short side, x, y, turned), None if the rectangle fits nowhere
+        """
+        best = None
+        for turned, (rw, rh) in enumerate(((w, h), (h, w))):
+            dw, dh = self.free[:,2] - rw, self.free[:,3] - rh
+            short = np.where((dw >= 0) & (dh >= 0), np.minimum(dw, dh), np.inf)
+            i = np.argmin(short)
+            if np.isfinite(short[i]) and (best is None or short[i] < best[0]):
+                best = (short[i], self.free[i,0], self.free[i,1], bool(turned))
+        return best
+
+    def place(self, x, y, w, h):
+        """
+        Removes the rectangle from the free space
+        """
+        f = self.free
+        hit = (f[:,0] < x+w) & (f[:,0]+f[:,2] > x) & (f[:,1] < y+h) & (f[:,1]+f[:,3] > y)
+        split = [f[~hit]]
+        for fx, fy, fw, fh in f[hit]:
+            split.append(np.array([
+                [fx, fy, x - fx, fh],
+                [x + w, fy, fx + fw - x - w, fh],
+                [fx, fy, fw, y - fy],
+                [fx, y + h, fw, fy + fh - y - h],
+            ]))
+        f = np.concatenate(split)
+        f = f[(f[:,2] > 1e-9) & (f[:,3] > 1e-9)]
+
+        # Drop the rectangles within others
+        x0, y0, x1, y1 = f[:,0], f[:,1], f[:,0]+f[:,2], f[:,1]+f[:,3]
+        within = ((x0[:,None] >= x0) & (y0[:,None] >= y0) & (x1[:,None] <= x1) & (y1[:,None] <= y1))
+        np.fill_diagonal(within, False)
+        # Of equal rectangles the first one stays
+        equal = within & within.T
+        within &= ~np.triu(equal)
+        self.free = f[~within.any(axis=1)]
+
+def nest(parts, width, height, gap=3, tolerance=0.1):
+    """
+    Places parts on sheets
+
+    Args:
+        parts: (label, elements, holes)
+        width (float): Sheet width (mm)
+        height (float): Sheet height (mm)
+        gap (float): Smallest distance between parts, half of it to the sheet edges (mm)
+        tolerance (float): Flattening of the arcs for the hulls (mm)
+
+    Returns:
+        list: (sheet, label, elements, holes, offset), elements and holes turned, offset from the sheet origin
+    """
+    prepared = []
+    for label, elements, holes in parts:
+        h = hull(*points(elements, tolerance))
+        angle, w, ht = min_area_rect(h)
+        prepared.append((w*ht, label, elements, holes, h, angle, w + 2*tolerance, ht + 2*tolerance))
+    prepared.sort(key=lambda p: -p[0])
+
+    sheets = []
+    placed = []
+    for _, label, elements, holes, h, angle, w, ht in prepared:
+        for sheet, free in enumerate(sheets):
+            fit = free.find(w + gap, ht + gap)
+            if fit is not None:
+                break
+        else:
+            free = MaxRects(width, height)
+            fit = free.find(w + gap, ht + gap)
+            if fit is None:
+                raise ValueError(f"{label} ({w:.0f} x {ht:.0f} mm) does not fit on the sheet")
+            sheets.append(free)
+            sheet = len(sheets) - 1
+
+        _, x, y, turned = fit
+        if turned:
+            angle += math.pi/2
+            w, ht = ht, w
+        free.place(x, y, w + gap, ht + gap)
+
+        c, s = math.cos(angle), math.sin(angle)
+        hx, hy = c*h[:,0] - s*h[:,1], s*h[:,0] + c*h[:,1]
+        offset = (x + gap/2 + tolerance - hx.min(), y + gap/2 + tolerance - hy.min())
+        turned_holes = [(c*p[0] - s*p[1], s*p[0] + c*p[1]) for p in holes]
+        placed.append((sheet, label, rotate(elements, angle), turned_holes, offset))
+    return placed
+
+def write_nested(writer, placed, width, height, spacing=50):
+    """
+    Writes nested parts, see nest
+
+    Args:
+        writer (DxfWriter or GcodeWriter): Output
+        placed (list): Placed parts from nest
+        spacing (float): Space between the sheets in DXF (mm)
+
+    Returns:
+        int: Number of sheets
+    """
+    hole_r = 1 # mm, as in Violin.write_template
+    writer.begin()
+    sheet = -1
+    for s, label, elements, holes, (ox, oy) in sorted(placed, key=lambda p: p[0]):
+        if s != sheet:
+            sheet = s
+            x, y = writer.sheet(sheet, width, height, spacing)
+        writer.part(label, (x + ox, y + oy))
+        writer.contour(elements, layer="PARTS")
+        writer.holes(holes, hole_r)
+    writer.end()
+    return sheet + 1
+
+def main(args):
+    kinds = args.parts.split(",")
+    unknown = [k for k in kinds if k not in PARTS]
+    if unknown:
+        print(f"nest: unknown part {', '.join(unknown)}, expected one of {', '.join(PARTS)}", file=sys.stderr)
+        return 1
+    try:
+        width, height = (float(v) for v in args.sheet.lower().split("x"))
+    except ValueError:
+        print(f"nest: invalid sheet size '{args.sheet}', expected widthxheight in mm", file=sys.stderr)
+        return 1
+
+    if args.arch_spacing is not None and args.arch_spacing <= 0:
+        print("nest: arch_spacing must be positive", file=sys.stderr)
+        return 1
+
+    catalog = Catalog(args.file)
+    cache = render.process_cache(args.cache_dir)
+    parts = []
+    for i, m, e in catalog.select(args.instrument, args.maker, args.model):
+        instrument = render.violin_from_entry(e, cache=cache)
+        parts += instrument_parts(f"{i} {m} {e['name']} {e['year']}", i, instrument, e, kinds, args.arch_spacing)
+    if not parts:
+        print("nest: no matching instruments", file=sys.stderr)
+        return 1
+
+    try:
+        placed = nest(parts, width, height, gap=args.gap)
+    except ValueError as e:
+        print(f"nest: {e}", file=sys.stderr)
+        return 1
+
+    file = args.output or f"nested.{'nc' if args.format == 'gcode' else 'dxf'}"
+    try:
+        writer = GcodeWriter.open(file, depth=args.depth) if args.format == "gcode" else DxfWriter.open(file)
+    except OSError as e:
+        print(f"nest: {e}", file=sys.stderr)
+        return 1
+    with writer:
+        sheets = write_nested(writer, placed, width, height)
+
+    print(f"{len(placed)} parts on {sheets} sheets written to {file}", file=sys.stderr)
+    return 0
+
+def parser(prog="nest"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Nest templates, outlines and arch templates of all matching catalog entries on sheets"
+    )
+    parser.add_argument('instrument', nargs='?')
+    parser.add_argument('maker', nargs='?')
+    parser.add_argument('model', nargs='?')
+    parser.add_argument('-f', '--format', choices=["dxf", "gcode"], default="dxf")
+    parser.add_argument('-o', '--output', type=str, help="output file, default nested.dxf or nested.nc")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--sheet', type=str, default="600x400", help="sheet size widthxheight in mm")
+    parser.add_argument('--gap', type=float, default=3, help="smallest distance between parts in mm, the kerf and a web")
+    parser.add_argument('--parts', type=str, default=",".join(PARTS), help="comma separated parts, default all")
+    parser.add_argument('--arch_spacing', type=float, help="cross arch templates every arch_spacing mm along the body, default the five of the arching sheet")
+    parser.add_argument('--depth', type=float, default=6, help="material thickness in mm (G-code)")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
@@ -0,0 +1,124 @@
+## Opt-in per stage timing of the Violin pipeline
+#
+#  VIOLINMAKER_PROFILE=1 python src/main.py ...         table on stderr at exit
+#  VIOLINMAKER_PROFILE=json python src/main.py ...      JSON on stderr at exit
+#  VIOLINMAKER_PROFILE=stats.json python src/main.py ...  JSON written to the file
+#
+#  or from code: profiling.enable(), ..., profiling.report()
+#
+#  Worker processes start with their own counters, they return stats()
+#  and the parent adds them with merge().
+#
+#  Stages are timed inclusive. serialization is timed once per document
+#  (render.write_svg, SvgWriter.to_string), the geometry stages run while
+#  writing it are counted in both. When disabled a stage costs one flag
+#  test per call.
+#
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+
+_enabled = False
+_output = None
+_registered = False
+_stats = {}
+
+def stage(name):
+    """
+    Decorator counting calls and time of a function under a stage name
+    """
+    def decorator(f):
+        # calls, nanoseconds, running, a stage called within itself is
+        # only counted once
+        counter = _stats.setdefault(name, [0, 0, False])
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _enabled or counter[2]:
+                return f(*args, **kwargs)
+            counter[2] = True
+            start = time.perf_counter_ns()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time.perf_counter_ns() - start
+                counter[2] = False
+        return wrapper
+    return decorator
+
+def enable(output=None):
+    """
+    Starts counting
+
+    Args:
+        output (str): (Optional) Report at exit: "table" or "json" on stderr, or a .json file name
+    """
+    global _enabled, _output, _registered
+    _enabled = True
+    _output = output
+    if output and not _registered:
+        atexit.register(_report_at_exit)
+        _registered = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    for counter in _stats.values():
+        counter[0] = counter[1] = 0
+
+def stats():
+    """
+    Returns:
+        dict: Stage -> {calls, seconds}
+    """
+    return {name: {"calls": c[0], "seconds": c[1]*1e-9} for name, c in _stats.items()}
+
+def merge(other):
+    """
+    Adds counters, e.g. the stats() of a worker process
+
+    Args:
+        other (dict): Stage -> {calls, seconds}
+    """
+    for name, v in other.items():
+        counter = _stats.setdefault(name, [0, 0, False])
+        counter[0] += v["calls"]
+        counter[1] += round(v["seconds"]*1e9)
+
+def report(format="table", file=None):
+    """
+    Writes the counters of the stages that were called
+
+    Args:
+        format (str): table or json
+        file: Output, default stderr
+    """
+    file = file or sys.stderr
+    s = {name: v for name, v in stats().items() if v["calls"]}
+    if format == "json":
+        file.write(json.dumps(s, indent=4) + "\n")
+        return
+
+    file.write(f"{'stage':<16}{'calls':>10}{'seconds':>12}{'us/call':>12}\n")
+    for name, v in sorted(s.items(), key=lambda i: -i[1]["seconds"]):
+        file.write(f"{name:<16}{v['calls']:>10}{v['seconds']:>12.4f}{1e6*v['seconds']/v['calls']:>12.2f}\n")
+
+def _report_at_exit():
+    if _output is None:
+        return
+    if _output.endswith(".json"):
+        with open(_output, "w") as f:
+            report("json", f)
+    else:
+        report("json" if _output == "json" else "table")
+
+_env = os.environ.get("VIOLINMAKER_PROFILE", "")
+if _env and _env != "0":
+    enable(_env if _env in ("json", "table") or _env.endswith(".json") else "table")
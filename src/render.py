@@ -0,0 +1,226 @@
+## Rendering of instruments to SVG documents
+#
+#  python src/main.py render [-o dir] [-j jobs] [--sheets outline,template,arching] [instrument] [maker] [model]
+#
+#  renders all matching catalog entries, one file per sheet
+#
+
+import os
+import re
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import violin
+import profiling
+from cache import GeometryCache
+from svg import Svg, SvgWriter
+
+def violin_from_entry(entry, calculate=True, cache=None) -> violin.Violin:
+    """
+    Creates a Violin from an instruments.json entry
+
+    Args:
+        entry (dict): Instrument parameters, with either km or kmu and kml
+        calculate (bool): Calculate body and corner parameters
+        cache (GeometryCache): (Optional) Take the calculated geometry from this cache
+
+    Returns:
+        Violin: The instrument
+    """
+    if 'km' in entry:
+        kmu = entry['km']
+        kml = entry['km']
+    else:
+        kmu = entry['kmu']
+        kml = entry['kml']
+    # h may be missing, Violin then uses its default
+    params = {p: entry[p] for p in violin.Violin.params if p not in ("h", "kmu", "kml")}
+    params.update(h=entry.get('h'), kmu=kmu, kml=kml)
+
+    if cache is not None and calculate:
+        return cache.violin(**params)
+
+    instrument = violin.Violin(**params)
+    if calculate:
+        instrument.calculate_body_params()
+        instrument.calculate_corner_params()
+
+    return instrument
+
+def get_svg(instrument, entry={}, type="violin", template=False, circles=False, color="black", transpose=[0,0], image="", offsets=()):
+    """
+    Renders a calculated instrument as a complete SVG document string,
+    see write_svg
+    """
+    return SvgWriter.to_string(write_svg, instrument, entry=entry, type=type, template=template, 
+                               circles=circles, color=color, transpose=transpose, image=image, offsets=offsets)
+
+@profiling.stage("serialization")
+def write_svg(writer, instrument, entry={}, type="violin", template=False, circles=False, color="black", transpose=[0,0], image="", offsets=()):
+    """
+    Writes a calculated instrument as a complete SVG document
+
+    Args:
+        writer (SvgWriter): Output
+        instrument (Violin): Calculated instrument
+        entry (dict): instruments.json entry, used for the arching (af, afc, afd, ab)
+        type (str): Instrument type for the template holes
+        template (bool): Render the template instead of the outline
+        circles (bool): Add the construction circles
+        color (str): Outline color
+        transpose (list): Margin around the instrument in mm
+        image (str): Optional <image> element placed under the drawing
+        offsets (list): Offset lines drawn with the outline (mm, outwards > 0), the margin grows by the largest
+    """
+    grow = max([0] + [d for d in offsets if d > 0])
+    transpose = [t + grow for t in transpose]
+    height, width = instrument.get_dimensions()
+    width += 2*transpose[0]*Svg._px2mm
+    height += 2*transpose[1]*Svg._px2mm
+
+    writer.begin(width, height)
+    writer.write(image)
+
+    if template:
+        instrument.write_template(writer, color=color, move=transpose, type=type)
+        writer.write("\n")
+    else:
+        instrument.write_outline_path(writer, color=color, move=transpose)
+        writer.write("\n")
+        if offsets:
+            instrument.write_offset_paths(writer, offsets, move=transpose)
+        if "af" in entry:
+            afc = entry['afc'] if 'afc' in entry else None
+            afd = entry['afd'] if 'afd' in entry else None
+            instrument.write_arches_path_on_outline(writer, entry["af"], afc=afc, afd=afd, move=transpose)
+            writer.write("\n")
+        if "ab" in entry:
+            instrument.write_arches_path_on_outline(writer, -entry["ab"], color="yellow", long_color="cyan", move=transpose)
+            writer.write("\n")
+
+    if circles:
+        instrument.write_circles(writer, move=transpose)
+
+    writer.end()
+
+SHEETS = ("outline", "template", "arching")
+
+def file_name(*parts):
+    """
+    File name of the parts, lower case with runs of other characters than
+    letters and digits replaced by _
+    """
+    return "_".join(re.sub(r"[^a-z0-9]+", "_", str(p).casefold()).strip("_") for p in parts)
+
+_caches = {}
+
+def process_cache(directory=None):
+    """
+    Geometry cache of this process, one per cache directory, kept by the
+    pool workers from job to job
+
+    Args:
+        directory (str): (Optional) Directory of the disk store, see GeometryCache
+    """
+    if directory not in _caches:
+        _caches[directory] = GeometryCache(directory=directory)
+    return _caches[directory]
+
+def render_entry(instrument, maker, entry, directory, sheets=SHEETS, cache=None):
+    """
+    Writes the sheets of a catalog entry, the arching sheet only when the
+    entry has arching (af or ab)
+
+    Args:
+        cache (GeometryCache): (Optional) Take the calculated geometry from this cache
+
+    Returns:
+        list: Written files
+    """
+    v = violin_from_entry(entry, cache=cache)
+    name = file_name(instrument, maker, entry['name'], entry['year'])
+    files = []
+    for sheet in sheets:
+        if sheet == "arching" and "af" not in entry and "ab" not in entry:
+            continue
+        file = os.path.join(directory, f"{name}_{sheet}.svg")
+        # Opened outside the try, a file that could not be opened is not removed
+        writer = SvgWriter.open(file)
+        try:
+            with writer:
+                write_svg(writer, v, entry if sheet == "arching" else {}, type=instrument, template=sheet == "template")
+        except Exception:
+            # No partly written sheets
+            os.remove(file)
+            raise
+        files.append(file)
+    return files
+
+def render_job(job):
+    # Worker: (instrument, maker, entry, directory, sheets, cache_dir) -> (label, files, error, seconds, stats)
+    # The profiling counters are reset per job, stats are this job's only
+    instrument, maker, entry, directory, sheets, cache_dir = job
+    label = f"{instrument} {maker} {entry.get('name')} {entry.get('year')}"
+    profiling.reset()
+    start = time.perf_counter()
+    try:
+        files, error = render_entry(instrument, maker, entry, directory, sheets, cache=process_cache(cache_dir)), None
+    except Exception as e:
+        # A parameter set without valid geometry (math domain error, ...)
+        files, error = [], f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    return label, files, error, seconds, profiling.stats()
+
+def main(args):
+    from catalog import Catalog
+
+    sheets = args.sheets.split(",")
+    unknown = [s for s in sheets if s not in SHEETS]
+    if unknown:
+        print(f"render: unknown sheet {', '.join(unknown)}, expected one of {', '.join(SHEETS)}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    catalog = Catalog(args.file)
+    jobs = [(i, m, e, args.output, sheets, args.cache_dir) for i, m, e in catalog.select(args.instrument, args.maker, args.model)]
+    if not jobs:
+        print("render: no matching instruments", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    files = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        for label, written, error, seconds, stats in pool.map(render_job, jobs):
+            profiling.merge(stats)
+            if error is None:
+                files += len(written)
+                print(f"{label}: {len(written)} files, {1000*seconds:.1f} ms", file=sys.stderr)
+            else:
+                failed.append(label)
+                print(f"{label}: failed, {error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(jobs)-len(failed)} of {len(jobs)} instruments, {files} files in {elapsed:.2f} s "
+          f"({len(jobs)/elapsed:.1f} instruments/s)", file=sys.stderr)
+    return 1 if failed else 0
+
+def parser(prog="render"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Render outline, template and arching sheets of all matching catalog entries"
+    )
+    parser.add_argument('instrument', nargs='?')
+    parser.add_argument('maker', nargs='?')
+    parser.add_argument('model', nargs='?')
+    parser.add_argument('-o', '--output', type=str, default="out", help="output directory")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('-j', '--jobs', type=int, help="processes, default the number of cores")
+    parser.add_argument('--sheets', type=str, default=",".join(SHEETS), help="comma separated sheets, default all")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
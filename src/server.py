@@ -0,0 +1,261 @@
+## Local HTTP render service
+#
+#  python src/main.py serve [--port 8000] [-j jobs]
+#
+#  GET /catalog                              instruments, makers and models
+#  GET /catalog/<instrument>/<maker>         entries of a maker
+#  GET /render?instrument=&maker=&model=     SVG of a catalog entry
+#  GET /render?kc=&ku=&...                   SVG of ad-hoc parameters (and af, afc, afd, ab)
+#
+#  /render options: view=outline|template, circles=1, type=violin|cello
+#  (template holes of ad-hoc parameters)
+#
+#  Only bound to 127.0.0.1. Rendered documents are cached by their
+#  normalized request and sent with an ETag, renders run in a process
+#  pool so the event loop keeps serving while they are calculated.
+#
+
+import sys
+import json
+import signal
+import asyncio
+import hashlib
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from urllib.parse import urlsplit, parse_qsl, unquote
+
+import render
+from cache import GeometryCache
+from catalog import Catalog
+from violin import Violin
+
+ARCH_PARAMS = ("af", "afc", "afd", "ab")
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+def render_svg(entry, type, template, circles):
+    """
+    Renders an instruments.json entry, runs in the worker processes which
+    keep their own geometry cache
+    """
+    instrument = render.violin_from_entry(entry, cache=render.process_cache())
+    return render.get_svg(instrument, entry, type=type, template=template, circles=circles)
+
+class RenderServer:
+    """
+    Args:
+        catalog (Catalog): Instrument catalog
+        jobs (int): (Optional) Render processes, default the number of cores
+        cache_size (int): Rendered documents kept in memory
+    """
+
+    def __init__(self, catalog, jobs=None, cache_size=256):
+        self.catalog = catalog
+        self.pool = ProcessPoolExecutor(max_workers=jobs)
+        self.cache_size = cache_size
+        self._documents = OrderedDict()
+        self._pending = {}
+
+    def _entry(self, query):
+        if "instrument" in query or "maker" in query or "model" in query:
+            try:
+                found = self.catalog.find(query["instrument"], query["maker"], query["model"])
+            except KeyError as e:
+                raise HttpError(400, f"missing {e.args[0]}")
+            if len(found) != 1:
+                raise HttpError(404, f"{len(found)} instruments matching")
+            return found[0], self.catalog.instrument(query["instrument"])
+
+        entry = {}
+        for p in Violin.params + ("km",) + ARCH_PARAMS:
+            if p in query:
+                try:
+                    entry[p] = float(query[p])
+                except ValueError:
+                    raise HttpError(400, f"{p} is not a number")
+        missing = [p for p in Violin.params if p not in entry and not (p in ("kmu", "kml") and "km" in entry)]
+        if missing:
+            raise HttpError(400, f"missing {', '.join(missing)}")
+        return entry, query.get("type", "violin")
+
+    def _key(self, entry, type, template, circles):
+        params = GeometryCache.key({p: entry.get(p) for p in Violin.params} | {"km": entry.get("km")})
+        arches = tuple(entry.get(p) for p in ARCH_PARAMS)
+        return (params, arches, type, template, circles)
+
+    async def render(self, query):
+        """
+        Returns:
+            bytes: SVG document
+            str: ETag
+        """
+        view = query.get("view", "outline")
+        if view not in ("outline", "template"):
+            raise HttpError(400, f"view must be outline or template, not {view}")
+        entry, type = self._entry(query)
+        if type not in Violin._closs:
+            raise HttpError(400, f"type must be one of {', '.join(Violin._closs)}")
+        template = view == "template"
+        circles = query.get("circles", "0") not in ("0", "", "false")
+
+        key = self._key(entry, type, template, circles)
+        if key in self._documents:
+            self._documents.move_to_end(key)
+            return self._documents[key]
+
+        # Identical requests arriving during a render wait for the same one
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.pool, render_svg, entry, type, template, circles)
+            self._pending[key] = future
+            future.add_done_callback(lambda f: self._pending.pop(key, None))
+        try:
+            svg = await asyncio.shield(future)
+        except BrokenExecutor:
+            raise
+        except Exception as e:
+            # Parameters without a valid geometry, e.g. a math domain error
+            raise HttpError(422, f"cannot render: {e}")
+
+        body = svg.encode()
+        document = (body, '"' + hashlib.sha1(body).hexdigest() + '"')
+        self._documents[key] = document
+        while len(self._documents) > self.cache_size:
+            self._documents.popitem(last=False)
+        return document
+
+    def catalog_index(self, parts):
+        data = self.catalog.data
+        if not parts:
+            return {i: {m: [{"name": e["name"], "year": e["year"]} for e in models] for m, models in makers.items()}
+                    for i, makers in data.items()}
+        if len(parts) == 2:
+            models = self.catalog.models(*parts)
+            if models is None:
+                raise HttpError(404, "unknown instrument or maker")
+            return models
+        raise HttpError(404, "not found")
+
+    async def respond(self, method, target, headers):
+        """
+        Returns:
+            int: Status
+            dict: Headers
+            bytes: Body
+        """
+        if method not in ("GET", "HEAD"):
+            raise HttpError(405, "only GET is supported")
+
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        parts = [unquote(p) for p in url.path.split("/") if p]
+
+        if parts and parts[0] == "catalog":
+            body = json.dumps(self.catalog_index(parts[1:])).encode()
+            return 200, {"Content-Type": "application/json"}, body
+
+        if parts == ["render"]:
+            body, etag = await self.render(query)
+            if etag in [t.strip() for t in headers.get("if-none-match", "").split(",")]:
+                return 304, {"ETag": etag}, b""
+            return 200, {"Content-Type": "image/svg+xml", "ETag": etag, "Cache-Control": "no-cache"}, body
+
+        raise HttpError(404, "not found")
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                try:
+                    method, target, version = request.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1")
+                    if line in ("\r\n", "\n", ""):
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                if "content-length" in headers:
+                    await reader.readexactly(int(headers["content-length"]))
+
+                try:
+                    status, response_headers, body = await self.respond(method, target, headers)
+                except HttpError as e:
+                    status, response_headers = e.status, {"Content-Type": "application/json"}
+                    body = json.dumps({"error": str(e)}).encode()
+                except Exception as e:
+                    status, response_headers = 500, {"Content-Type": "application/json"}
+                    body = json.dumps({"error": repr(e)}).encode()
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                response_headers["Content-Length"] = str(len(body))
+                response_headers["Connection"] = "keep-alive" if keep_alive else "close"
+                head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in response_headers.items()) + "\r\n"
+                writer.write(head.encode("latin-1") + (body if method != "HEAD" else b""))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def shutdown(self):
+        """
+        Stops the render workers, pending renders are cancelled
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def serve(self, port=8000):
+        server = await asyncio.start_server(self.handle, "127.0.0.1", port)
+        print(f"serving on http://127.0.0.1:{port}", file=sys.stderr)
+        # SIGTERM would end this process only, the workers stopped with it
+        loop = asyncio.get_running_loop()
+        serving = asyncio.current_task()
+        def terminate():
+            self.shutdown()
+            serving.cancel()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, terminate)
+        except NotImplementedError:
+            pass
+        async with server:
+            await server.serve_forever()
+
+def main(args):
+    server = RenderServer(Catalog(args.file), jobs=args.jobs, cache_size=args.cache_size)
+    try:
+        asyncio.run(server.serve(args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        server.pool.shutdown(cancel_futures=True)
+    return 0
+
+def parser(prog="serve"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Serve the catalog and rendered SVG over HTTP on 127.0.0.1"
+    )
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('-j', '--jobs', type=int, help="render processes, default the number of cores")
+    parser.add_argument('--cache_size', type=int, default=256, help="rendered documents kept in memory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
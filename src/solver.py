@@ -0,0 +1,252 @@
+## Fitting four circle parameters to measured dimensions
+#
+#  python src/main.py fit [-b instrument maker model] length=356 lower_bout=206 center_bout=112 upper_bout=166 ...
+#
+
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from batch import ViolinBatch
+from catalog import Catalog
+from violin import Violin
+
+# Measured dimensions in mm, corner widths are measured across the body
+# between the corner tips and corner heights from the lower end of the body
+MEASURES = {
+    "length":               lambda b: b.h,
+    "upper_bout":           lambda b: 2*b.rl*b.ku,
+    "center_bout":          lambda b: b.rl*b.kw,
+    "lower_bout":           lambda b: 2*b.rl,
+    "upper_corner_width":   lambda b: 2*(b.rl-b.du1[0]),
+    "upper_corner_height":  lambda b: b.du1[1],
+    "lower_corner_width":   lambda b: 2*(b.rl-b.dl1[0]),
+    "lower_corner_height":  lambda b: b.dl1[1],
+    "upper_bout_height":    lambda b: b.cu[1],
+    "center_bout_height":   lambda b: b.cc[1],
+    "lower_bout_height":    lambda b: b.cl[1],
+}
+
+# Starting point when no initial parameters are given (Guarneri Ole Bull)
+DEFAULTS = {
+    "h": 350, "kc": 0.8, "ku": 0.8, "kmu": 0.65, "kml": 0.65, "kw": 0.98,
+    "b1": 0.95, "b2": 0.78, "bu": 0.75, "bl": 1, "cu1": -0.1, "cu2": 0.66, "cl1": 0.17, "cl2": 0.66
+}
+
+class Fit:
+    """
+    Result of fit(), params can be passed directly to Violin
+    """
+
+    def __init__(self, params, measures, targets, iterations, converged):
+        self.params = params
+        self.measures = measures
+        self.residuals = {k: measures[k]-targets[k] for k in targets}
+        self.iterations = iterations
+        self.converged = converged
+
+    def violin(self):
+        return Violin(**self.params)
+
+def measure(params):
+    """
+    Calculates all MEASURES for a batch of parameter sets
+
+    Returns:
+        dict: Measure name -> array, NaN for invalid parameter sets
+    """
+    b = ViolinBatch(**params).calculate()
+    invalid = ~b.valid
+    measures = {}
+    with np.errstate(invalid="ignore"):
+        for k, f in MEASURES.items():
+            m = np.array(f(b), dtype=float)
+            m[invalid] = np.nan
+            measures[k] = m
+    return measures
+
+def undefined(params):
+    """
+    Returns:
+        str: The first derived value (see Violin.derived) that a single
+        parameter set leaves undefined, None if the geometry is valid
+    """
+    b = ViolinBatch(**{p: [v] for p, v in params.items()}).calculate()
+    for d in Violin.derived:
+        if not np.all(np.isfinite(getattr(b, d))):
+            return d
+    return None
+
+def fit(targets, initial=None, free=None, weights=None, regularization=1e-6, max_iter=100, atol=1e-5, tol=1e-10, ftol=1e-9):
+    """
+    Finds Violin parameters matching target dimensions.
+
+    Levenberg-Marquardt over the body and corner equations. The Jacobian
+    is a forward finite difference evaluated as one ViolinBatch, and the
+    damping candidates of each iteration are evaluated as a second one.
+    When there are fewer targets than free parameters, the solution
+    closest to the initial parameters is preferred.
+
+    Args:
+        targets (dict): Measure name -> target value in mm, see MEASURES
+        initial (dict): (Optional) Starting parameters, an instruments.json entry can be used
+        free (list): (Optional) Parameters to adjust, default all but h
+        weights (dict): (Optional) Measure name -> weight, default 1
+        regularization (float): Weight of the distance to the initial parameters
+        max_iter (int): Maximum number of iterations, at least 1
+        atol (float): Stop when all targets are met within this (mm)
+        tol (float): Stop when the step is smaller than this
+        ftol (float): Stop when the relative cost reduction is smaller than this
+
+    Returns:
+        Fit: Fitted parameters and remaining residuals
+    """
+    unknown = [k for k in targets if k not in MEASURES]
+    if unknown:
+        raise ValueError(f"Unknown measure {', '.join(unknown)}, expected one of {', '.join(MEASURES)}")
+
+    if max_iter < 1:
+        raise ValueError(f"max_iter must be at least 1, got {max_iter}")
+
+    params = dict(DEFAULTS)
+    if initial is not None:
+        if "km" in initial:
+            params["kmu"] = params["kml"] = initial["km"]
+        params.update({p: initial[p] for p in ViolinBatch.params if p in initial})
+    # Parameters taken from the targets, and how
+    derived = {}
+    if "length" in targets:
+        params["h"] = targets["length"]
+        derived["h"] = "length"
+    # Bout width ratios are known directly from the widths
+    if "lower_bout" in targets and "upper_bout" in targets:
+        params["ku"] = targets["upper_bout"]/targets["lower_bout"]
+        derived["ku"] = "upper_bout/lower_bout"
+    if "lower_bout" in targets and "center_bout" in targets:
+        params["kw"] = 2*targets["center_bout"]/targets["lower_bout"]
+        derived["kw"] = "2*center_bout/lower_bout"
+
+    free = list(free) if free is not None else [p for p in ViolinBatch.params if p != "h"]
+    unknown = [p for p in free if p not in DEFAULTS]
+    if unknown:
+        raise ValueError(f"Unknown parameter {', '.join(unknown)}, expected one of {', '.join(DEFAULTS)}")
+    keys = list(targets)
+    t = np.array([targets[k] for k in keys], dtype=float)
+    w = np.array([(weights or {}).get(k, 1) for k in keys], dtype=float)
+    p0 = np.array([params[p] for p in free], dtype=float)
+    s = np.sqrt(regularization)
+
+    def evaluate(P):
+        batch = dict(params)
+        batch.update({name: P[:,i] for i, name in enumerate(free)})
+        measures = measure(batch)
+        return np.column_stack([measures[k] for k in keys]), measures
+
+    def cost(P, M):
+        r = (M-t)*w
+        c = np.sum(r*r, axis=1) + regularization*np.sum((P-p0)**2, axis=1)
+        return np.where(np.isfinite(c), c, np.inf)
+
+    p = p0.copy()
+    M, _ = evaluate(p[None])
+    if not np.all(np.isfinite(M)):
+        origin = ", ".join(f"{p}={params[p]:.6g} from {how}" for p, how in derived.items())
+        raise ValueError(f"The starting parameters don't give a valid geometry, {undefined(params)} is undefined"
+                         + (f" ({origin})" if origin else ""))
+    c = cost(p[None], M)[0]
+
+    lam = 1e-3
+    lambdas = 10.0**np.arange(-2, 4)
+    converged = False
+    n = len(free)
+    for iteration in range(1, max_iter+1):
+        # Jacobian, base point in the first row
+        eps = 1e-7*np.maximum(1, np.abs(p))
+        P = np.vstack((p, p + np.diag(eps)))
+        M, _ = evaluate(P)
+        if np.max(np.abs(M[0]-t)) < atol:
+            converged = True
+            break
+        J = (M[1:]-M[0]).T / eps * w[:,None]
+        r = (M[0]-t)*w
+
+        Ja = np.vstack((J, s*np.eye(n)))
+        ra = np.concatenate((r, s*(p-p0)))
+        g = Ja.T @ ra
+        H = Ja.T @ Ja
+        D = np.diag(np.diag(H)) + 1e-12*np.eye(n)
+
+        # Damping candidates
+        steps = np.array([np.linalg.solve(H + lam*l*D, -g) for l in lambdas])
+        P = p + steps
+        C = cost(P, evaluate(P)[0])
+        best = np.argmin(C)
+
+        if C[best] < c:
+            step, reduction = steps[best], c-C[best]
+            p, c = P[best], C[best]
+            lam = max(lam*lambdas[best]/10, 1e-12)
+            if np.max(np.abs(step)) < tol or reduction < ftol*c:
+                converged = True
+                break
+        else:
+            lam *= 1e4
+            if lam > 1e12:
+                # No step reduces the cost while targets are still missed,
+                # the closest match found
+                break
+
+    result = dict(params)
+    result.update({name: float(p[i]) for i, name in enumerate(free)})
+    _, measures = evaluate(p[None])
+    return Fit(result, {k: float(v[0]) for k,v in measures.items()}, targets, iteration, converged)
+
+def main(args):
+    initial = None
+    if args.base:
+        found = Catalog(args.file).find(*args.base)
+        if len(found) != 1:
+            print(f"fit: {len(found)} instruments matching {' '.join(args.base)}", file=sys.stderr)
+            return 1
+        initial = found[0]
+
+    targets = {}
+    for t in args.targets:
+        name, _, value = t.partition("=")
+        try:
+            targets[name] = float(value)
+        except ValueError:
+            print(f"fit: expected measure=mm, got {t}", file=sys.stderr)
+            return 1
+
+    free = args.free.split(",") if args.free else None
+    try:
+        result = fit(targets, initial=initial, free=free)
+    except ValueError as e:
+        print(f"fit: {e}", file=sys.stderr)
+        return 1
+
+    print(json.dumps({p: round(v, 6) for p,v in result.params.items()}, indent=4))
+    for k, r in result.residuals.items():
+        print(f"{k}: {result.measures[k]:.3f} ({r:+.3g})", file=sys.stderr)
+    if not result.converged:
+        print(f"fit: not converged after {result.iterations} iterations", file=sys.stderr)
+
+    return 0
+
+def parser(prog="fit"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=f"Fit Violin parameters to measurements in mm. Measures: {', '.join(MEASURES)}"
+    )
+    parser.add_argument('targets', nargs='+', metavar='measure=mm')
+    parser.add_argument('-b', '--base', nargs=3, metavar=('INSTRUMENT', 'MAKER', 'MODEL'),
+                        help="catalog entry used as starting point")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--free', type=str, help="comma separated parameters to adjust, default all but h")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
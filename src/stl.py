@@ -0,0 +1,248 @@
+## Binary STL export of the arched plates
+#
+#  python src/main.py stl [--plate top|back] [--resolution mm] [--thickness mm | --zones 0:3.2,0.3:2.6,0.8:3] [--flat] [-o file] instrument maker model
+#
+#  The plate is meshed on a regular grid over the outline, the outer
+#  surface is the arching height field (arching.surface), the back is
+#  arched downwards (h = -ab) as in render and mass. Grid points outside
+#  the outline next to the plate are moved onto the outline, so the edge
+#  follows the arcs instead of the grid. Rows are meshed in
+#  blocks and written as NumPy record buffers, the mesh is never held in
+#  memory as a whole.
+#
+
+import sys
+import struct
+import argparse
+
+import numpy as np
+
+import arcs
+import render
+from arching import surface, zones
+from catalog import Catalog
+from mass import arch, parse_zones
+
+FACET = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("v", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+class StlWriter:
+    """
+    Streaming binary STL output. The triangle count in the header is
+    written by end(), so the sink has to be seekable.
+    """
+
+    def __init__(self, sink, header=b"FourCircle"):
+        self.sink = sink
+        self.header = header
+        self.count = 0
+
+    @classmethod
+    def open(cls, file, header=b"FourCircle"):
+        return cls(open(file, "wb", buffering=0), header=header)
+
+    def close(self):
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def begin(self):
+        self.start = self.sink.tell()
+        self.sink.write(self.header[:80].ljust(80, b" ") + struct.pack("<I", 0))
+        self.count = 0
+
+    def end(self):
+        end = self.sink.tell()
+        self.sink.seek(self.start + 80)
+        self.sink.write(struct.pack("<I", self.count))
+        self.sink.seek(end)
+
+    def triangles(self, v):
+        """
+        Writes triangles, counterclockwise seen from outside
+
+        Args:
+            v (ndarray): Vertices, shape (N, 3, 3)
+        """
+        facets = np.zeros(len(v), dtype=FACET)
+        facets["v"] = v
+        n = np.cross(v[:,1]-v[:,0], v[:,2]-v[:,0])
+        length = np.linalg.norm(n, axis=1, keepdims=True)
+        facets["normal"] = np.divide(n, length, out=np.zeros_like(n), where=length > 0)
+        self.sink.write(facets.tobytes())
+        self.count += len(v)
+
+def _quads(a, b, c, d):
+    # Two triangles per quad a, b, c, d (counterclockwise), shape (N, 3)
+    return np.concatenate((np.stack((a, b, c), axis=1), np.stack((a, c, d), axis=1)))
+
+def plate(v, h, thickness=3, flat=False, resolution=0.5, afc=None, afd=None, rows=64):
+    """
+    Triangles of a closed plate mesh, block by block.
+
+    The outer surface is arching.surface(v, h), the inner surface is
+    thickness vertically inside of it, below for the top and above for
+    the back, or the plane at thickness from the edge (flat). A
+    graduation map gives the thickness by position and relative arch
+    height, see arching.zones.
+
+    Args:
+        v (Violin): Calculated instrument
+        h (float): Arch height, negative for the back
+        thickness: Thickness (mm), a number or a function thickness(x, y, s)
+            of arrays of positions (mm) and relative arch height s
+        flat (bool): Flat inner surface, thickness has to be a number
+        resolution (float): Grid spacing (mm)
+        afc (float): (Optional) Height of the flatter center arch, see arching.circle_arch
+        afd (float): (Optional) Offset of the flatter center arch
+        rows (int): Grid rows per block
+
+    Yields:
+        ndarray: Triangles, shape (N, 3, 3)
+    """
+    if flat and callable(thickness):
+        raise ValueError("A flat inner surface needs a uniform thickness")
+    inwards = -1 if h > 0 else 1
+    height, width = v.get_dimensions_mm()
+    # One cell of margin, so no cell at the grid border is part of the plate
+    x = np.arange(-resolution, width + 2*resolution, resolution)
+    y = np.arange(-resolution, height + 2*resolution, resolution)
+    outline = v.get_outline()
+    ny = len(y) - 1
+
+    for r0 in range(0, ny, rows):
+        r1 = min(r0 + rows, ny)
+        # Vertex rows of the cells r0-1 .. r1, the neighbours are needed for the walls
+        v0, v1 = max(r0-1, 0), min(r1+2, len(y))
+        z = surface(v, h, x, y[v0:v1], afc=afc, afd=afd)
+        inside = ~np.isnan(z)
+
+        # Cell rows v0 .. v1-2, the cell (i, j) has the vertices (i, j) to (i+1, j+1)
+        cells = inside[:-1,:-1] | inside[1:,:-1] | inside[:-1,1:] | inside[1:,1:]
+
+        X = np.broadcast_to(x, z.shape).copy()
+        Y = np.broadcast_to(y[v0:v1, None], z.shape).copy()
+        used = np.zeros(z.shape, dtype=bool)
+        used[:-1,:-1] |= cells; used[1:,:-1] |= cells; used[:-1,1:] |= cells; used[1:,1:] |= cells
+        snap = used & ~inside
+        X[snap], Y[snap] = arcs.nearest(outline, X[snap], Y[snap])
+        z[snap] = 0
+
+        outer = np.stack((X, Y, z), axis=-1)
+        inner = outer.copy()
+        if flat:
+            inner[..., 2] = inwards*thickness
+        elif callable(thickness):
+            t = np.zeros(z.shape)
+            t[used] = thickness(X[used], Y[used], z[used]/h)
+            inner[..., 2] = z + inwards*t
+        else:
+            inner[..., 2] = z + inwards*thickness
+        # Meshed as the upper and the lower surface
+        top, bottom = (outer, inner) if h > 0 else (inner, outer)
+
+        # Cells of this block
+        k = r0 - v0
+        i, j = np.nonzero(cells[k:k+r1-r0])
+        i += k
+        p00, p01, p11, p10 = (i, j), (i, j+1), (i+1, j+1), (i+1, j)
+
+        tris = [
+            _quads(top[p00], top[p01], top[p11], top[p10]),
+            _quads(bottom[p00], bottom[p10], bottom[p11], bottom[p01]),
+        ]
+
+        # Walls on cell edges without a plate cell on the other side, the
+        # edge a -> b has the plate on its left
+        for (di, dj), a, b in (
+            ((-1, 0), p00, p01),
+            ((0, 1), p01, p11),
+            ((1, 0), p11, p10),
+            ((0, -1), p10, p00),
+        ):
+            ni, nj = i + di, j + dj
+            valid = (ni >= 0) & (ni < len(cells)) & (nj >= 0) & (nj < cells.shape[1])
+            edge = ~valid
+            edge[valid] = ~cells[ni[valid], nj[valid]]
+            a_, b_ = (a[0][edge], a[1][edge]), (b[0][edge], b[1][edge])
+            tris.append(_quads(top[a_], bottom[a_], bottom[b_], top[b_]))
+
+        yield np.concatenate(tris)
+
+def write_plate(writer, v, h, **kwargs):
+    """
+    Writes a plate mesh, see plate for the arguments
+
+    Returns:
+        int: Number of triangles
+    """
+    writer.begin()
+    for t in plate(v, h, **kwargs):
+        writer.triangles(t)
+    writer.end()
+    return writer.count
+
+def main(args):
+    if args.thickness <= 0:
+        print(f"stl: thickness must be positive, got {args.thickness}", file=sys.stderr)
+        return 1
+    try:
+        thickness = zones(parse_zones(args.zones)) if args.zones else args.thickness
+    except ValueError as e:
+        print(f"stl: {e}", file=sys.stderr)
+        return 1
+    if args.zones and args.flat:
+        print("stl: --zones and --flat exclude each other", file=sys.stderr)
+        return 1
+
+    found = Catalog(args.file).find(args.instrument, args.maker, args.model)
+    if len(found) != 1:
+        print(f"stl: {len(found)} instruments matching {args.instrument} {args.maker} {args.model}", file=sys.stderr)
+        return 1
+    entry = found[0]
+
+    a = arch(entry, args.plate)
+    if a is None:
+        name, key = ("front", "af") if args.plate == "top" else ("back", "ab")
+        print(f"stl: no {name} arching ({key}) in the catalog entry", file=sys.stderr)
+        return 1
+    h, afc, afd = a
+
+    instrument = render.violin_from_entry(entry)
+    try:
+        writer = StlWriter.open(args.output or f"{args.plate}.stl")
+    except OSError as e:
+        print(f"stl: {e}", file=sys.stderr)
+        return 1
+    with writer:
+        n = write_plate(writer, instrument, h, thickness=thickness, flat=args.flat,
+                        resolution=args.resolution, afc=afc, afd=afd)
+    print(f"{n} triangles", file=sys.stderr)
+    return 0
+
+def parser(prog="stl"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Export the arched top or back plate as binary STL"
+    )
+    parser.add_argument('instrument')
+    parser.add_argument('maker')
+    parser.add_argument('model')
+    parser.add_argument('--plate', choices=["top", "back"], default="top")
+    parser.add_argument('-o', '--output', type=str, help="output file, default top.stl or back.stl")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--resolution', type=float, default=0.5, help="grid spacing in mm")
+    parser.add_argument('--thickness', type=float, default=3, help="uniform plate thickness in mm")
+    parser.add_argument('--zones', type=str, help="graduation level:thickness,... by relative arch height, see mass")
+    parser.add_argument('--flat', action='store_true', help="flat inner surface instead of following the arching")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
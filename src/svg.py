@@ -1,3 +1,8 @@
+import io
+
+from profiling import stage
+from writer import ChunkWriter
+
 class Svg:
     _px2mm = 3.77952755906
 
@@ -21,6 +26,16 @@ class Svg:
     def circle(self, r, c, mirror=False):
         return f"<circle r=\"{self._px2mm * r}\" cx=\"{self.get_x(c, mirror)}\" cy=\"{self.get_y(c)}\" fill=\"{self.fill}\" stroke=\"{self.color}\" stroke-width=\"{self._px2mm * self.stroke_width}\" />"
     
+    def circles(self, r, centers, mirror=False):
+        # circle elements of the same radius, one per line, the shared
+        # attributes are formatted once and get_x, get_y are inlined
+        tail = f"\" fill=\"{self.fill}\" stroke=\"{self.color}\" stroke-width=\"{self._px2mm * self.stroke_width}\" />\n"
+        head = f"<circle r=\"{self._px2mm * r}\" cx=\""
+        return "".join(
+            f"{head}{self._px2mm * ((self.w-c[0] if mirror else c[0]) + self.transpose[0])}\" cy=\"{self._px2mm * (self.h - c[1] + self.transpose[1])}{tail}"
+            for c in centers
+        )
+
     def move_to(self, p, mirror=False):
         return f"M{self.get_x(p, mirror)} {self.get_y(p)}"
 
@@ -32,6 +47,39 @@ class Svg:
     
     def arc(self, r, p, dir=True, large_arc=False, mirror=False, relative=False):
         sweep_flag = not dir if mirror else dir
-        r *= self._px2mm
-        return f"{'a' if relative else 'A'}{r} {r} {0} {1 if large_arc else 0} {1 if sweep_flag else 0} {self.get_x(p, mirror)} {self.get_y(p)}"
+        # Formatting the floats is most of the cost, r is formatted once
+        # and get_x, get_y are inlined
+        r = str(r*self._px2mm)
+        x = self._px2mm * ((self.w-p[0] if mirror else p[0]) + self.transpose[0])
+        y = self._px2mm * (self.h - p[1] + self.transpose[1])
+        return f"{'a' if relative else 'A'}{r} {r} 0 {1 if large_arc else 0} {1 if sweep_flag else 0} {x} {y}"
+
+
+
+class SvgWriter(ChunkWriter):
+    """
+    Incremental SVG output, see ChunkWriter
+    """
+
+    @staticmethod
+    @stage("serialization")
+    def to_string(write, *args, **kwargs):
+        """
+        Runs write(writer, *args, **kwargs) into a string
+        """
+        out = io.StringIO()
+        writer = SvgWriter(out)
+        write(writer, *args, **kwargs)
+        writer.flush()
+        return out.getvalue()
+
+    def begin(self, width, height):
+        self.write(f"<svg xmlns=\"http://www.w3.org/2000/svg\" width=\"{width}\" height=\"{height}\">\n")
+
+    def end(self):
+        self.write("</svg>\n")
+        self.flush()
 
+    def path(self, commands, color, stroke_width):
+        # One path is small, it is joined and written at once
+        self.write(f"<path d=\"{''.join(commands)}\" style=\"fill:none;stroke:{color};stroke-width:{stroke_width}\" />")
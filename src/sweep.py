@@ -0,0 +1,252 @@
+## Parameter sweep over the four circle design space
+#
+#  python src/main.py sweep [-b instrument maker model] kc=0.6:0.9:0.01 kw=0.9,1.0,1.1 ...
+#
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import ViolinBatch
+import render
+from catalog import Catalog
+from svg import SvgWriter
+
+COLUMNS = ("variant",) + ViolinBatch.params + (
+    "length", "width",
+    "upper_bout", "center_bout", "lower_bout",
+    "du1_x", "du1_y", "du2_x", "du2_y",
+    "dl1_x", "dl1_y", "dl2_x", "dl2_y",
+    "area", "perimeter", "centroid_y", "ixx", "iyy"
+)
+
+def parse_spec(spec):
+    """
+    Parses a sweep specification
+
+    Args:
+        spec (str): name=start:stop:step (stop included), name=v1,v2,... or name=value
+
+    Returns:
+        str: Parameter name
+        ndarray: Parameter values
+    """
+    name, sep, values = spec.partition("=")
+    if not sep or name not in ViolinBatch.params + ("km",):
+        raise ValueError(f"Invalid sweep parameter '{spec}', expected one of {', '.join(ViolinBatch.params)}")
+
+    if ":" in values:
+        start, stop, step = [float(v) for v in values.split(":")]
+        if step <= 0 or stop < start:
+            raise ValueError(f"Invalid sweep range '{spec}'")
+        count = int(np.floor((stop-start)/step + 1e-9)) + 1
+        # rounded so 0.6:0.9:0.1 gives 0.9 and not 0.8999999999999999
+        return name, np.round(start + step*np.arange(count), 12)
+
+    return name, np.array([float(v) for v in values.split(",")])
+
+class Grid:
+    """
+    Cartesian product of the swept parameters, on top of fixed base values.
+    Variants are addressed by their flat index so chunks can be generated
+    without materializing the grid.
+    """
+
+    def __init__(self, axes, base={}):
+        self.names = [n if n != "km" else "kmu" for n,_ in axes]
+        self.axes = [a for _,a in axes]
+        self.base = {p: base[p] for p in ViolinBatch.params if p in base}
+        if "km" in base:
+            self.base.setdefault("kmu", base["km"])
+            self.base.setdefault("kml", base["km"])
+        # km sweeps both minor circles together
+        self.tied = [n for n,_ in axes if n == "km"]
+
+        missing = [p for p in ViolinBatch.params if p not in self.base and p not in self.names and not (p == "kml" and self.tied)]
+        if missing:
+            raise ValueError(f"No value given for {', '.join(missing)}")
+
+    def __len__(self):
+        return int(np.prod([len(a) for a in self.axes]))
+
+    def params(self, start, stop):
+        idx = np.unravel_index(np.arange(start, stop), [len(a) for a in self.axes])
+        params = dict(self.base)
+        for name, axis, i in zip(self.names, self.axes, idx):
+            params[name] = axis[i]
+        if self.tied:
+            params["kml"] = params["kmu"]
+        return params
+
+_worker = None
+
+def _init_worker(grid, format, keep_rows):
+    global _worker
+    _worker = (grid, format, keep_rows)
+
+def evaluate(grid, start, stop):
+    """
+    Calculates variants [start, stop) of the grid
+
+    Returns:
+        ndarray: One row per valid variant, see COLUMNS
+        int: Number of variants without a valid geometry
+    """
+    b = ViolinBatch(**grid.params(start, stop)).calculate()
+    properties = b.get_outline_properties()
+
+    rows = np.column_stack(
+        (np.arange(start, stop),)
+        + tuple(getattr(b, p) for p in ViolinBatch.params)
+        + b.get_dimensions_mm()
+        + b.get_bout_widths_mm()
+        + b.du1 + b.du2 + b.dl1 + b.dl2
+        + tuple(properties[p] for p in ("area", "perimeter", "y", "ixx", "iyy"))
+    )
+    valid = b.valid
+    return rows[valid], int(len(valid) - np.count_nonzero(valid))
+
+def format_rows(rows, format):
+    """
+    Serializes rows as CSV lines or NDJSON objects
+    """
+    out = io.StringIO()
+    values = ([int(r[0])] + r[1:].tolist() for r in rows)
+    if format == "csv":
+        csv.writer(out, lineterminator="\n").writerows(values)
+    else:
+        out.writelines(json.dumps(dict(zip(COLUMNS, v))) + "\n" for v in values)
+    return out.getvalue()
+
+def _evaluate_chunk(start, stop):
+    grid, format, keep_rows = _worker
+    rows, invalid = evaluate(grid, start, stop)
+    return rows if keep_rows else len(rows), invalid, format_rows(rows, format)
+
+def chunks(grid, format="csv", jobs=None, chunk_size=16384, keep_rows=False):
+    """
+    Evaluates and serializes the grid in chunks over a process pool,
+    yielding (rows, invalid, text) in order, rows is only the row count
+    unless keep_rows is set. At most two chunks per worker are in flight
+    to bound memory.
+    """
+    jobs = jobs or os.cpu_count()
+    ranges = ((s, min(s+chunk_size, len(grid))) for s in range(0, len(grid), chunk_size))
+
+    if jobs == 1:
+        _init_worker(grid, format, keep_rows)
+        for s, e in ranges:
+            yield _evaluate_chunk(s, e)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(grid, format, keep_rows)) as pool:
+        pending = deque()
+        for s, e in ranges:
+            pending.append(pool.submit(_evaluate_chunk, s, e))
+            if len(pending) >= 2*jobs:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+class TopK:
+    """
+    Keeps the k best rows seen so far, ranked by one column
+    """
+
+    def __init__(self, k, column, descending=False):
+        self.k = k
+        self.col = COLUMNS.index(column)
+        self.sign = -1 if descending else 1
+        self.rows = np.empty((0, len(COLUMNS)))
+
+    def add(self, rows):
+        rows = np.vstack((self.rows, rows))
+        if len(rows) > self.k:
+            rows = rows[np.argpartition(self.sign*rows[:,self.col], self.k-1)[:self.k]]
+        self.rows = rows
+
+    def sorted(self):
+        return self.rows[np.argsort(self.sign*self.rows[:,self.col], kind="stable")]
+
+def render_rows(rows, directory, type="violin", cache=None):
+    os.makedirs(directory, exist_ok=True)
+    for rank, row in enumerate(rows):
+        values = dict(zip(COLUMNS, row.tolist()))
+        instrument = render.violin_from_entry({p: values[p] for p in ViolinBatch.params}, cache=cache)
+        with SvgWriter.open(os.path.join(directory, f"sweep_{rank+1}_{int(values['variant'])}.svg")) as writer:
+            render.write_svg(writer, instrument, type=type, transpose=[5,5])
+
+def main(args):
+    base = {}
+    if args.base:
+        found = Catalog(args.file).find(*args.base)
+        if len(found) != 1:
+            print(f"sweep: {len(found)} instruments matching {' '.join(args.base)}", file=sys.stderr)
+            return 1
+        base = found[0]
+
+    try:
+        grid = Grid([parse_spec(s) for s in args.specs], base)
+    except ValueError as e:
+        print(f"sweep: {e}", file=sys.stderr)
+        return 1
+    top = TopK(args.top, args.sort_by, args.descending) if args.top else None
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    if args.format == "csv":
+        csv.writer(out, lineterminator="\n").writerow(COLUMNS)
+
+    start = time.perf_counter()
+    count, invalid = 0, 0
+    for rows, n_invalid, text in chunks(grid, format=args.format, jobs=args.jobs, chunk_size=args.chunk_size, keep_rows=top is not None):
+        out.write(text)
+        if top:
+            top.add(rows)
+            rows = len(rows)
+        count += rows
+        invalid += n_invalid
+
+    if args.output:
+        out.close()
+    else:
+        out.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"sweep: {count+invalid} variants, {invalid} invalid, {elapsed:.2f}s ({(count+invalid)/max(elapsed,1e-9):.0f}/s)", file=sys.stderr)
+
+    if top:
+        render_rows(top.sorted(), args.svg_dir, type=Catalog(args.file).instrument(args.base[0]) if args.base else "violin",
+                    cache=render.process_cache(args.cache_dir))
+
+    return 0
+
+def parser(prog="sweep"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Evaluate a grid of Violin parameters. Each spec is name=start:stop:step, name=v1,v2,... or name=value"
+    )
+    parser.add_argument('specs', nargs='+', metavar='name=values')
+    parser.add_argument('-b', '--base', nargs=3, metavar=('INSTRUMENT', 'MAKER', 'MODEL'),
+                        help="catalog entry giving the parameters not swept")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('-o', '--output', type=str, help="output file, default stdout")
+    parser.add_argument('-f', '--format', choices=("csv", "ndjson"), default="csv")
+    parser.add_argument('-j', '--jobs', type=int, help="worker processes, default all cores")
+    parser.add_argument('--chunk_size', type=int, default=16384)
+    parser.add_argument('--top', type=int, help="render the best k variants to SVG")
+    parser.add_argument('--sort_by', choices=COLUMNS, default="center_bout")
+    parser.add_argument('--descending', action='store_true')
+    parser.add_argument('--svg_dir', type=str, default="sweep")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
@@ -1,17 +1,21 @@
 ## Violin, Viola and Cello family instruments
 #  
 
+from itertools import chain
+
+import numpy as np
+
 from helpers import *
-from svg import Svg
+from svg import Svg, SvgWriter
 from arching import *
+import arcs
+from profiling import stage
 
 class Violin:
     _closs = {"violin":((40,15),(24,6)), "cello":((100,30),(50,10))}
 
-    body_calculated = False
-    corner_calculated = False
-
-    move_px = [0,0]
+    # Instrument parameters, as normalized by __init__
+    params = ("h", "kc", "ku", "kmu", "kml", "kw", "b1", "b2", "bu", "bl", "cu1", "cu2", "cl1", "cl2")
 
     def as_image_px(self, p, move=False, mirror=False):
         x = p[0] if not mirror else 2*self.rl-p[0]
@@ -97,8 +101,43 @@ class Violin:
         self.cl1 = cl1
         self.cl2 = cl2
 
-    def calculate_body_params(self):
-        # Circle parameters
+        self.body_calculated = False
+        self.corner_calculated = False
+        self._half_outline = None
+        self._outline = None
+        self._fragments = None
+        # (x, y) offset of as_image_px with move, set a new tuple to change it
+        self.move_px = (0, 0)
+
+    # Derived values as a dependency graph: node method -> (inputs, outputs).
+    # Inputs are parameters or outputs of earlier nodes, so the order is
+    # also the calculation order.
+    _body_nodes = {
+        "_calc_radii":          (("h", "kc", "ku", "kw", "kml", "kmu"), ("kr1", "kr2", "rl", "hc", "r1", "r2")),
+        "_calc_centers":        (("rl", "r1", "hc", "ku", "kc", "kw"), ("c1", "c2", "cl", "cu", "cc", "cc_left")),
+        "_calc_minor":          (("rl", "cl", "cu", "ku", "kml", "kmu"), ("cml_left", "cmu_left")),
+    }
+    _corner_nodes = {
+        "_calc_corner_center":  (("rl", "b1", "b2", "cc", "kw"), ("A1", "A2", "cA")),
+        "_calc_upper_corner":   (("rl", "ku", "cu1", "cu2", "cu", "cA", "A2"), ("xu1", "xu2", "Lu", "du1", "du2")),
+        "_calc_lower_corner":   (("rl", "cl1", "cl2", "cl", "cA", "A2"), ("xl1", "xl2", "Ll", "dl1", "dl2")),
+        "_calc_yu":             (("du1", "du2"), ("yu",)),
+        "_calc_yl":             (("dl1", "dl2"), ("yl",)),
+        "_calc_au":             (("bu", "yu"), ("au",)),
+        "_calc_al":             (("bl", "yl"), ("al",)),
+        "_calc_yuc":            (("du1", "yu", "cmu_left", "rl", "kmu"), ("yuc",)),
+        "_calc_ylc":            (("dl1", "yl", "cl", "rl"), ("ylc",)),
+        "_calc_auc":            (("du1", "au", "cc_left", "rl", "kc"), ("auc",)),
+        "_calc_alc":            (("dl1", "al", "cc_left", "rl", "kc"), ("alc",)),
+    }
+
+    # Derived values in calculation order
+    derived = tuple(chain.from_iterable(outputs for _, outputs in chain(_body_nodes.values(), _corner_nodes.values())))
+
+    # Fixed attributes instead of a per instance __dict__
+    __slots__ = params + derived + ("body_calculated", "corner_calculated", "_half_outline", "_outline", "_fragments", "move_px")
+
+    def _calc_radii(self):
         kA = ( pyth_sub(1 + self.kc, self.kc+self.kw/2) - 1 )
         kB = ( pyth_sub(self.ku + self.kc, self.kc+self.kw/2) - self.ku )
         self.kr1 = self.kml + pyth_add(1, 1-self.kml)
@@ -110,6 +149,7 @@ class Violin:
         self.r1 = self.rl * self.kr1
         self.r2 = self.rl * self.kr2
 
+    def _calc_centers(self):
         # Upper and lower major circles
         self.c1 = (self.rl, self.r1)
         self.c2 = (self.rl, self.r1+self.hc)
@@ -121,58 +161,182 @@ class Violin:
 
         # Center left circle
         self.cc_left = (self.rl*(1-(self.kc+self.kw/2)),self.cc[1])
-        
-        
-        # Minor circles
+
+    def _calc_minor(self):
         self.cml_left  = (self.rl*(1-(1-self.kml)), self.cl[1])
         self.cmu_left  = (self.rl*(1-(self.ku-self.kmu)), self.cu[1])
 
+    @stage("body")
+    def calculate_body_params(self):
+        for node in self._body_nodes:
+            getattr(self, node)()
+
         self.body_calculated = True
+        self._half_outline = self._outline = None
 
         return self.rl,self.r1,self.r2,self.cl,self.cu,self.cc,self.cc_left,self.c1,self.c2,self.cml_left,self.cmu_left
 
-    def calculate_corner_params(self):     
+    def _calc_corner_center(self):
         self.A1, self.A2 = self.rl*self.b1, self.rl*self.b2
-        self.xl1, self.xl2 = self.rl*self.cl1, self.rl*self.cl2
-        self.xu1, self.xu2 = self.rl*self.ku*self.cu1, self.rl*self.ku*self.cu2
-        
         self.cA = (self.cc[0] - self.kw * self.rl / 2 - self.A1, self.cc[1])
 
+    def _calc_upper_corner(self):
+        self.xu1, self.xu2 = self.rl*self.ku*self.cu1, self.rl*self.ku*self.cu2
         self.Lu = pyth_add(self.cu[0]-self.xu1-self.cA[0], self.cu[1]-self.cA[1])
-        self.Ll = pyth_add(self.cl[0]-self.xl1-self.cA[0], self.cl[1]-self.cA[1])
-        
         self.du1 =   ( 
                 self.cA[0] + (self.cu[0]- self.xu1-self.cA[0]) * self.A2/self.Lu,
                 self.cA[1] + (self.cu[1] - self.cA[1]) * self.A2/self.Lu
                 )
+        tmp = line_circle_intersect(self.cu, self.rl*self.ku, (self.cu[0]-self.xu2, self.cu[1]), self.cA)
+        self.du2 = tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
+
+    def _calc_lower_corner(self):
+        self.xl1, self.xl2 = self.rl*self.cl1, self.rl*self.cl2
+        self.Ll = pyth_add(self.cl[0]-self.xl1-self.cA[0], self.cl[1]-self.cA[1])
         self.dl1 =   ( 
                 self.cA[0] + (self.cl[0] - self.xl1-self.cA[0]) * self.A2/self.Ll,
                 self.cA[1] + (self.cl[1] - self.cA[1]) * self.A2/self.Ll
                 )
-        
-        tmp = line_circle_intersect(self.cu, self.rl*self.ku, (self.cu[0]-self.xu2, self.cu[1]), self.cA)
-        self.du2 = tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
-
         tmp = line_circle_intersect(self.cl, self.rl, (self.cl[0]-self.xl2, self.cl[1]), self.cA)
         self.dl2 = tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
 
-        self.yu, self.yl = self.du2[1]-self.du1[1],self.dl1[1]-self.dl2[1]
-        self.au, self.al = self.bu*self.yu, self.bl*self.yl
+    def _calc_yu(self):
+        self.yu = self.du2[1]-self.du1[1]
+
+    def _calc_yl(self):
+        self.yl = self.dl1[1]-self.dl2[1]
+
+    def _calc_au(self):
+        self.au = self.bu*self.yu
 
+    def _calc_al(self):
+        self.al = self.bl*self.yl
+
+    def _calc_yuc(self):
         tmp = circle_circle_intersect(self.du1, self.yu, self.cmu_left, self.rl*self.kmu+self.yu)
         self.yuc = tmp[0] if len(tmp)==1 or tmp[0][1] > tmp[1][1] else tmp[1]
-        
+
+    def _calc_ylc(self):
         tmp = circle_circle_intersect(self.dl1, self.yl, self.cl, self.rl+self.yl)
         self.ylc = tmp[0] if len(tmp)==1 or tmp[0][1] < tmp[1][1] else tmp[1]
 
+    def _calc_auc(self):
         tmp = circle_circle_intersect(self.du1, self.au, self.cc_left, self.rl*self.kc-self.au)
         self.auc = tmp[0] if len(tmp)==1 or tmp[0][1] < tmp[1][1] else tmp[1]
 
+    def _calc_alc(self):
         tmp = circle_circle_intersect(self.dl1, self.al, self.cc_left, self.rl*self.kc-self.al)
         self.alc = tmp[0] if len(tmp)==1 or tmp[0][1] > tmp[1][1] else tmp[1]
 
+    @stage("corner")
+    def calculate_corner_params(self):     
+        for node in self._corner_nodes:
+            getattr(self, node)()
+
         self.corner_calculated = True
+        self._half_outline = self._outline = None
+
+    def update(self, **params):
+        """
+        Changes parameters of a calculated instrument and recalculates only
+        the values depending on them. A value that comes out unchanged does
+        not propagate further.
+
+        Args:
+            params: Violin parameters, km sets kmu and kml
+
+        Returns:
+            set: Names of the recalculated values that changed
+        """
+        if "km" in params:
+            km = params.pop("km")
+            params.setdefault("kmu", km)
+            params.setdefault("kml", km)
+        unknown = [p for p in params if p not in self.params]
+        if unknown:
+            raise Exception(f"Violin update: unknown parameter {', '.join(unknown)}")
+
+        changed = {p for p, v in params.items() if getattr(self, p) != v}
+        for p in changed:
+            setattr(self, p, params[p])
+
+        if not (self.body_calculated and self.corner_calculated):
+            self.calculate_body_params()
+            self.calculate_corner_params()
+            return set(self.derived)
+
+        dirty = set(changed)
+        for node, (inputs, outputs) in chain(self._body_nodes.items(), self._corner_nodes.items()):
+            if dirty.isdisjoint(inputs):
+                continue
+            before = [getattr(self, o) for o in outputs]
+            getattr(self, node)()
+            dirty.update(o for o, b in zip(outputs, before) if getattr(self, o) != b)
+
+        if dirty:
+            self._half_outline = self._outline = None
+        return dirty - changed
     
+    def get_half_outline_records(self):
+        """
+        Returns:
+            list: Left half of the outline as float tuples in the field order of arcs.ARC, see arcs.half_outline_records
+        """
+        if self._half_outline is None:
+            self._half_outline = arcs.half_outline_records(self)
+        return self._half_outline
+
+    def get_outline_records(self):
+        """
+        Returns:
+            list: Closed outline as float tuples in the field order of arcs.ARC, see arcs.outline_records
+        """
+        if self._outline is None:
+            self._outline = arcs.outline_records(self, self.get_half_outline_records())
+        return self._outline
+
+    def get_half_outline(self):
+        """
+        Returns:
+            ndarray: Left half of the outline as arcs.ARC records, see arcs.half_outline
+        """
+        return np.array(self.get_half_outline_records(), dtype=arcs.ARC)
+
+    def get_outline(self):
+        """
+        Returns:
+            ndarray: Closed outline as arcs.ARC records, see arcs.outline
+        """
+        return np.array(self.get_outline_records(), dtype=arcs.ARC)
+
+    def _svg_fragments(self):
+        # SVG commands of the arcs, reused when an update leaves arcs unchanged
+        if self._fragments is None or len(self._fragments) > 64:
+            self._fragments = {}
+        return self._fragments
+
+    def get_outline_polyline(self, tolerance=0.01):
+        """
+        Closed outline as a polyline, see arcs.flatten
+
+        Args:
+            tolerance (float): Maximum chord error (mm)
+
+        Returns:
+            ndarray: x
+            ndarray: y
+        """
+        return arcs.flatten(self.get_outline(), tolerance)
+
+    def get_outline_properties(self):
+        """
+        Exact properties of the area within the outline, see arcs.properties
+
+        Returns:
+            dict: area (mm2), perimeter (mm), centroid x and y (mm), ixx, iyy and ixy (mm4)
+        """
+        return arcs.properties(self.get_outline())
+
     def get_circles(self, color="red", move=[0,0]):
         circles = []
         
@@ -235,192 +399,115 @@ class Violin:
 
         return circles
 
-    def get_circles_svg(self, color="red", move=[0,0]):
-        svg = ""
+    def write_circles(self, writer, color="red", move=[0,0]):
         for circle in self.get_circles(color=color, move=move):
-            svg += circle + "\n"
-        return svg
+            writer.write(circle + "\n")
+
+    def get_circles_svg(self, color="red", move=[0,0]):
+        return SvgWriter.to_string(self.write_circles, color=color, move=move)
 
     def get_outline_path(self, move=[0,0], color="black"):
-        
-        path = []
+        return SvgWriter.to_string(self.write_outline_path, move=move, color=color)
+
+    def write_outline_path(self, writer, move=[0,0], color="black"):
         svg = Svg(self.h, 2*self.rl, transpose=move)
         svg.color = color
         svg.stroke_width = 5
 
-        path.append(svg.move_to( (
-            self.rl    + (self.cml_left[0]-self.c1[0]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0], self.cml_left[1]-self.c1[1]), 
-            self.c1[1] + (self.cml_left[1]-self.c1[1]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0],self.cml_left[1]-self.c1[1])
-        )))
-        path.append(svg.arc(self.rl * self.kml, (
-            self.cl[0]-self.rl,
-            self.cl[1]
-        )))
-        tmp = line_circle_intersect(self.cl, self.rl, self.ylc, self.cl)
-        path.append(svg.arc(self.rl, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
-        ))
-        path.append(svg.arc(self.yl, self.dl1, dir=0))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.alc, self.cc_left)
-        path.append(svg.arc(self.al, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.auc, self.cc_left)
-        path.append(svg.arc(self.rl*self.kc, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        path.append(svg.arc(self.au, self.du1, dir=0))
-        tmp = line_circle_intersect(self.cu, self.rl*self.ku, self.yuc, self.cu)
-        path.append(svg.arc(self.yu, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        path.append(svg.arc(self.rl*self.ku, (
-            self.cu[0]-self.rl*self.ku,
-            self.cu[1]
-        )))
-        path.append(svg.arc(self.rl*self.kmu, (
-            self.cu[0] + (self.cmu_left[0]-self.c2[0]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1]), 
-            self.c2[1] + (self.cmu_left[1]-self.c2[1]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1])
-        )))
-        
-        path.append(svg.arc(self.r2, (
-            self.cu[0] + (self.cmu_left[0]-self.c2[0]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1]), 
-            self.c2[1] + (self.cmu_left[1]-self.c2[1]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1])
-        ), dir=0, mirror=True))
-
-        path.append(svg.arc(self.rl*self.kmu, (
-            self.cu[0]-self.rl*self.ku,
-            self.cu[1]
-        ), dir=0, mirror=True))
-        tmp = line_circle_intersect(self.cu, self.rl*self.ku, self.yuc, self.cu)
-        path.append(svg.arc(self.rl * self.ku, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1],
-            dir=0, mirror=True
-        ))
-        path.append(svg.arc(self.yu, self.du1, dir=1, mirror=True))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.auc, self.cc_left)
-        path.append(svg.arc(self.au, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=1, mirror=True
-        ))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.alc, self.cc_left)
-        path.append(svg.arc(self.rl * self.kc, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=1, mirror=True
-        ))
-        path.append(svg.arc(self.al, self.dl1, dir=1, mirror=True))
-        tmp = line_circle_intersect(self.cl, self.rl, self.ylc, self.cl)
-        path.append(svg.arc(self.yl, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1],
-            dir=1, mirror=True
-        ))
-        path.append(svg.arc(self.rl, (
-            self.cl[0]-self.rl,
-            self.cl[1]
-        ), dir=0, mirror=True))
-        path.append(svg.arc(self.rl * self.kml, (
-            self.rl    + (self.cml_left[0]-self.c1[0]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0], self.cml_left[1]-self.c1[1]), 
-            self.c1[1] + (self.cml_left[1]-self.c1[1]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0],self.cml_left[1]-self.c1[1])
-        ), dir=0, mirror=True))
-
-        path.append(svg.arc(self.r1, (
-            self.rl    + (self.cml_left[0]-self.c1[0]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0], self.cml_left[1]-self.c1[1]), 
-            self.c1[1] + (self.cml_left[1]-self.c1[1]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0],self.cml_left[1]-self.c1[1])
-        )))
-
-        path.append(svg.close())
-
-
-
-        path_str = "<path d=\""
-        for p in path:
-            path_str += p
-        path_str += f"\" style=\"fill:none;stroke:{svg.color};stroke-width:{svg.stroke_width}\" />"
-
-        return path_str       
+        path = chain(arcs.svg_commands(svg, self.get_outline_records(), self._svg_fragments()), [svg.close()])
+        writer.path(path, svg.color, svg.stroke_width)
+
+    def get_offset_outline(self, d, join="round"):
+        """
+        Outline offset by d, outwards for d > 0 (the plate edge from the rib
+        line by the overhang) and inwards for d < 0 (linings, purfling
+        channel), see arcs.offset
+
+        Args:
+            d (float or list): Offset or offsets (mm)
+            join (str): round or extend (pointed corners, round where the
+                extended arcs do not meet)
+
+        Returns:
+            ndarray: arcs.ARC records, a list of them for several offsets
+        """
+        return arcs.offset(self.get_outline(), d, join=join)
+
+    def write_offset_paths(self, writer, offsets, move=[0,0], color="grey", join="round"):
+        svg = Svg(self.h, 2*self.rl, transpose=move)
+        svg.color = color
+        svg.stroke_width = 2
+
+        for segments in self.get_offset_outline(list(offsets), join=join):
+            path = chain(arcs.svg_commands(svg, segments, self._svg_fragments()), [svg.close()])
+            writer.path(path, svg.color, svg.stroke_width)
+            writer.write("\n")
+
+
+    def get_template_profile(self):
+        """
+        Template outline: the left half of the outline from the lower end
+        of the body to the upper end, closed by lines 10mm right of the
+        center line.
 
+        Returns:
+            ndarray: Half outline, arcs.ARC records
+            list: End points of the closing lines, the last is the start of the outline
+        """
+        return self.get_half_outline(), self._template_lines()
+
+    def _template_lines(self):
+        return [
+            (self.cu[0]+10, self.h),
+            (self.cu[0]+10, 0),
+            (self.rl, 0)
+        ]
 
     def get_template(self, color="black", move=[0,0], type="violin"):
+        return SvgWriter.to_string(self.write_template, color=color, move=move, type=type)
+
+    @stage("template")
+    def write_template(self, writer, color="black", move=[0,0], type="violin"):
         
-        path = []
         svg = Svg(self.h, 2*self.rl, transpose=move)
         svg.color = color
         svg.stroke_width = .25*Svg._px2mm
         
-        # Template holes
-        closs_size = self._closs[type][0]
-        corner_closs_size = self._closs[type][1]
         hole_dia = 1 # mm
 
-        path.append(svg.move_to((self.rl, 0)))
-        path.append(svg.arc(self.r1, (
-            self.rl    + (self.cml_left[0]-self.c1[0]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0], self.cml_left[1]-self.c1[1]), 
-            self.c1[1] + (self.cml_left[1]-self.c1[1]) * self.r1/pyth_add(self.cml_left[0]-self.c1[0],self.cml_left[1]-self.c1[1])
-        )))
-        path.append(svg.arc(self.rl * self.kml, (
-            self.cl[0]-self.rl,
-            self.cl[1]
-        )))
-        tmp = line_circle_intersect(self.cl, self.rl, self.ylc, self.cl)
-        path.append(svg.arc(self.rl, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
-        ))
-        path.append(svg.arc(self.yl, self.dl1, dir=0))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.alc, self.cc_left)
-        path.append(svg.arc(self.al, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        tmp = line_circle_intersect(self.cc_left, self.rl*self.kc, self.auc, self.cc_left)
-        path.append(svg.arc(self.rl*self.kc, 
-            tmp[0] if tmp[0][0] > tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        path.append(svg.arc(self.au, self.du1, dir=0))
-        tmp = line_circle_intersect(self.cu, self.rl*self.ku, self.yuc, self.cu)
-        path.append(svg.arc(self.yu, 
-            tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1],
-            dir=0
-        ))
-        path.append(svg.arc(self.rl*self.ku, (
-            self.cu[0]-self.rl*self.ku,
-            self.cu[1]
-        )))
-        path.append(svg.arc(self.rl*self.kmu, (
-            self.cu[0] + (self.cmu_left[0]-self.c2[0]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1]), 
-            self.c2[1] + (self.cmu_left[1]-self.c2[1]) * self.r2/pyth_add(self.cmu_left[0]-self.c2[0], self.cmu_left[1]-self.c2[1])
-        )))
-        path.append(svg.arc(self.r2,(
-            self.cu[0], self.h #self.c2[1]+self.r2
-        )))
-        path.append(svg.line((self.cu[0]+10, self.h)))
-        path.append(svg.line((self.cu[0]+10, 0)))
-        path.append(svg.close())
+        lines = self._template_lines()
+        path = chain(arcs.svg_commands(svg, self.get_half_outline_records(), self._svg_fragments()), [svg.line(p) for p in lines[:-1]], [svg.close()])
 
         # Template outline path
-        as_str = "<path d=\""
-        for p in path:
-            as_str += p
-        as_str += f"\" style=\"fill:none;stroke:{svg.color};stroke-width:{svg._px2mm * svg.stroke_width}\" />\n"
+        writer.path(path, svg.color, svg._px2mm * svg.stroke_width)
+        writer.write("\n")
 
         svg.fill=color
         svg.stroke_width=0
 
-        as_str += svg.circle(hole_dia, self.cl) + "\n"
-        as_str += svg.circle(hole_dia, self.cu) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl, self.h-(closs_size[1]+10))) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl, closs_size[1]+10)) + "\n"
+        # Template holes
+        writer.write(svg.circles(hole_dia, self.get_template_holes(type)))
 
+    def get_template_holes(self, type="violin"):
+        """
+        Returns:
+            list: Centers of the template holes for the clamping blocks (closs)
+        """
+        closs_size = self._closs[type][0]
+        corner_closs_size = self._closs[type][1]
+
+        holes = []
+        holes.append(self.cl)
+        holes.append(self.cu)
+        holes.append((self.rl, self.h-(closs_size[1]+10)))
+        holes.append((self.rl, closs_size[1]+10))
 
-        as_str += svg.circle(hole_dia, (self.rl, self.h-closs_size[1])) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl-closs_size[0]/2, self.h-closs_size[1])) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl-closs_size[0]/2, self.h-closs_size[1]/2)) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl, closs_size[1])) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl-closs_size[0]/2, closs_size[1])) + "\n"
-        as_str += svg.circle(hole_dia, (self.rl-closs_size[0]/2, closs_size[1]/2)) + "\n"
+        holes.append((self.rl, self.h-closs_size[1]))
+        holes.append((self.rl-closs_size[0]/2, self.h-closs_size[1]))
+        holes.append((self.rl-closs_size[0]/2, self.h-closs_size[1]/2))
+        holes.append((self.rl, closs_size[1]))
+        holes.append((self.rl-closs_size[0]/2, closs_size[1]))
+        holes.append((self.rl-closs_size[0]/2, closs_size[1]/2))
 
         #tmp = line_circle_intersect(self.cl, self.rl-corner_closs_size[1], self.cl, self.dl1)
         #lower_corner_closs_center = tmp[0] if tmp[0][0] < tmp[1][0] else tmp[1]
@@ -439,22 +526,22 @@ class Violin:
             self.cl[1] + (self.rl-corner_closs_size[1]) * unit_lower[1]
         )
 
-        as_str += svg.circle(hole_dia, lower_corner_closs_center) + "\n"
-        as_str += svg.circle(hole_dia, upper_corner_closs_center) + "\n"
+        holes.append(lower_corner_closs_center)
+        holes.append(upper_corner_closs_center)
         
-        as_str += svg.circle(hole_dia, (upper_corner_closs_center[0] + corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + corner_closs_size[0]/2*normal_upper[1])) + "\n"
-        as_str += svg.circle(hole_dia, (upper_corner_closs_center[0] - corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] - corner_closs_size[0]/2*normal_upper[1])) + "\n"
+        holes.append((upper_corner_closs_center[0] + corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + corner_closs_size[0]/2*normal_upper[1]))
+        holes.append((upper_corner_closs_center[0] - corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] - corner_closs_size[0]/2*normal_upper[1]))
 
-        as_str += svg.circle(hole_dia, (upper_corner_closs_center[0] + .6*unit_upper[0]*corner_closs_size[1] + corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + .6*unit_upper[1]*corner_closs_size[1] + corner_closs_size[0]/2*normal_upper[1])) + "\n"
-        as_str += svg.circle(hole_dia, (upper_corner_closs_center[0] + .6*unit_upper[0]*corner_closs_size[1] - corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + .6*unit_upper[1]*corner_closs_size[1] - corner_closs_size[0]/2*normal_upper[1])) + "\n"
+        holes.append((upper_corner_closs_center[0] + .6*unit_upper[0]*corner_closs_size[1] + corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + .6*unit_upper[1]*corner_closs_size[1] + corner_closs_size[0]/2*normal_upper[1]))
+        holes.append((upper_corner_closs_center[0] + .6*unit_upper[0]*corner_closs_size[1] - corner_closs_size[0]/2*normal_upper[0], upper_corner_closs_center[1] + .6*unit_upper[1]*corner_closs_size[1] - corner_closs_size[0]/2*normal_upper[1]))
 
-        as_str += svg.circle(hole_dia, (lower_corner_closs_center[0] + corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + corner_closs_size[0]/2*normal_lower[1])) + "\n"
-        as_str += svg.circle(hole_dia, (lower_corner_closs_center[0] - corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] - corner_closs_size[0]/2*normal_lower[1])) + "\n"
+        holes.append((lower_corner_closs_center[0] + corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + corner_closs_size[0]/2*normal_lower[1]))
+        holes.append((lower_corner_closs_center[0] - corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] - corner_closs_size[0]/2*normal_lower[1]))
 
-        as_str += svg.circle(hole_dia, (lower_corner_closs_center[0] + .6*unit_lower[0]*corner_closs_size[1] + corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + .6*unit_lower[1]*corner_closs_size[1] + corner_closs_size[0]/2*normal_lower[1])) + "\n"
-        as_str += svg.circle(hole_dia, (lower_corner_closs_center[0] + .6*unit_lower[0]*corner_closs_size[1] - corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + .6*unit_lower[1]*corner_closs_size[1] - corner_closs_size[0]/2*normal_lower[1])) + "\n"
+        holes.append((lower_corner_closs_center[0] + .6*unit_lower[0]*corner_closs_size[1] + corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + .6*unit_lower[1]*corner_closs_size[1] + corner_closs_size[0]/2*normal_lower[1]))
+        holes.append((lower_corner_closs_center[0] + .6*unit_lower[0]*corner_closs_size[1] - corner_closs_size[0]/2*normal_lower[0], lower_corner_closs_center[1] + .6*unit_lower[1]*corner_closs_size[1] - corner_closs_size[0]/2*normal_lower[1]))
 
-        return as_str
+        return holes
 
     def get_center_line(self, move=[0,0]):
         linecfg = f"fill:none;stroke:green;stroke-width:{Svg._px2mm * 1}"
@@ -470,9 +557,18 @@ class Violin:
     
     def get_dimensions_mm(self):
         return self.h, 2*self.rl
+
+    def get_bout_widths_mm(self):
+        """
+        Returns:
+            float: Upper bout width
+            float: Center bout width
+            float: Lower bout width
+        """
+        return 2*self.rl*self.ku, self.rl*self.kw, 2*self.rl
     
-    def get_arching(self, h, afc=None, afd=None):
-        N=101
+    @stage("arching")
+    def get_arching(self, h, afc=None, afd=None, N=101):
         long = circle_arch(h=h, L=self.h, h1=afc, d1=afd, x=[self.h*i/(N-1) for i in range(N)])
 
         combine = lambda a,b : (a,b)
@@ -497,21 +593,72 @@ class Violin:
         
         return arches_width, arches_pos, arches, long
 
+    def get_arching_sections(self, h, stations=None, spacing=None, afc=None, afd=None, N=101):
+        """
+        Cross arches at any stations or spacing along the body, one at a
+        time, see arching.sections
+
+        Args:
+            h (float): Arch height, negative for the back
+            stations (iterable): (Optional) y of the sections (mm)
+            spacing (float): (Optional) A section every spacing mm, instead of stations
+            N (int): Points per section
+
+        Returns:
+            generator: Tuples of y, width and the section [x, z]
+        """
+        return sections(self, h, stations=stations, spacing=spacing, afc=afc, afd=afd, N=N)
+
+    def get_arching_surface(self, h, x, y, afc=None, afd=None):
+        """
+        Height field of the arching on a grid, see arching.surface
+
+        Args:
+            h (float): Arch height, negative for the back
+            x (ndarray): Grid x positions (mm), shape (nx,)
+            y (ndarray): Grid y positions (mm), shape (ny,)
+
+        Returns:
+            ndarray: z (mm), shape (ny, nx), NaN outside the outline
+        """
+        return surface(self, h, x, y, afc=afc, afd=afd)
+
+    def get_arching_model(self, h, afc=None, afd=None, resolution=0.5):
+        """
+        Arching for point queries of height, normal and inside, see arching.ArchingModel
+        """
+        return ArchingModel(self, h, afc=afc, afd=afd, resolution=resolution)
+
+    def get_plate(self, h, thickness=3, density=0.45, afc=None, afd=None):
+        """
+        Volume and mass of a plate with the arching, see arching.plate
+
+        Args:
+            h (float): Arch height, negative for the back
+            thickness: Thickness (mm), a number or a graduation map, see arching.zones
+            density (float): Density (g/cm3)
+
+        Returns:
+            dict: area, surface, arch_volume, volume and mass
+        """
+        return plate(self, h, thickness=thickness, density=density, afc=afc, afd=afd)
+
     def get_arches_path_on_outline(self, h, afc=None, afd=None, color="red", long_color="green", refline_color="grey", move=[0,0]):
+        return SvgWriter.to_string(self.write_arches_path_on_outline, h, afc=afc, afd=afd, color=color, 
+                                   long_color=long_color, refline_color=refline_color, move=move)
+
+    def write_arches_path_on_outline(self, writer, h, afc=None, afd=None, color="red", long_color="green", refline_color="grey", move=[0,0]):
         arches_width, arches_pos, arches, long = self.get_arching(h,afc,afd)
 
         combine = lambda a,b,c : (a,b,c)
-        paths = ""
         for a,p,w in map(combine, arches, arches_pos, arches_width):
             start = (move[0]+(2*self.rl-w)/2, move[1]-p)
-            paths += self.get_arch_path([[0,w],[0,0]], start=start, color=refline_color)
-            paths += "\n"
-            paths += self.get_arch_path(a,start=start, color=color)
-            paths += "\n"
-        paths += self.get_arch_path([[0,self.h],[0,0]], dir=1, start=(move[0]+self.rl, move[1]), color=refline_color)
-        paths += self.get_arch_path(long, dir=1, start=(move[0]+self.rl, move[1]), color=long_color)
-
-        return paths
+            self.write_arch_path(writer, [[0,w],[0,0]], start=start, color=refline_color)
+            writer.write("\n")
+            self.write_arch_path(writer, a,start=start, color=color)
+            writer.write("\n")
+        self.write_arch_path(writer, [[0,self.h],[0,0]], dir=1, start=(move[0]+self.rl, move[1]), color=refline_color)
+        self.write_arch_path(writer, long, dir=1, start=(move[0]+self.rl, move[1]), color=long_color)
 
     def get_arches_paths(self, h, color="black"):
         arches_width, _, arches, long = self.get_arching(h)
@@ -525,6 +672,9 @@ class Violin:
         return paths
     
     def get_arch_path(self, arch, dir=0, start=(0,0), color="black"):
+        return SvgWriter.to_string(self.write_arch_path, arch, dir=dir, start=start, color=color)
+
+    def write_arch_path(self, writer, arch, dir=0, start=(0,0), color="black"):
         path = []
         
         svg = Svg(self.h, 2*self.rl, transpose=start)
@@ -537,15 +687,6 @@ class Violin:
         for a in arch_p[1:]:
             path.append(svg.line(a))
         
-        as_str = "<path d=\""
-        for p in path:
-            as_str += p
-        as_str += f"\" style=\"fill:none;stroke:{svg.color};stroke-width:{svg._px2mm * svg.stroke_width}\" />"
+        writer.path(path, svg.color, svg._px2mm * svg.stroke_width)
 
-        return as_str
         
-
-
-
-
-
@@ -0,0 +1,182 @@
+## Watch mode, re-renders the catalog entries changed in data/instruments.json
+#
+#  python src/main.py watch [-o dir] [--interval s] [--debounce s] [--sheets outline,template,arching]
+#
+#  The file is polled, after a change it has to stay unchanged for the
+#  debounce time before it is read, so an editor saving in several
+#  writes triggers one refresh. Entries are compared with the previous
+#  state of the file and only new or changed ones are rendered, the
+#  sheets of removed entries are deleted. The calculated geometry is
+#  kept between refreshes, an entry whose parameters did not change is
+#  not calculated again.
+#
+
+import os
+import sys
+import time
+import json
+import argparse
+
+import render
+import profiling
+from catalog import Catalog
+
+def snapshot(catalog):
+    """
+    Returns:
+        dict: (instrument, maker, name, year) -> entry
+    """
+    entries = {}
+    for instrument, maker, entry in catalog.entries():
+        key = (instrument, maker, str(entry.get('name')), str(entry.get('year')))
+        entries[key] = entry
+    return entries
+
+def diff(old, new):
+    """
+    Returns:
+        list: Keys of new or changed entries
+        list: Keys of removed entries
+    """
+    changed = [k for k, e in new.items() if old.get(k) != e]
+    removed = [k for k in old if k not in new]
+    return changed, removed
+
+def _signature(file):
+    try:
+        st = os.stat(file)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def poll(file, interval=0.2, debounce=0.3):
+    """
+    Yields each time the file changed and then stayed unchanged for debounce seconds
+    """
+    last = _signature(file)
+    while True:
+        time.sleep(interval)
+        current = _signature(file)
+        if current == last:
+            continue
+        while True:
+            time.sleep(debounce)
+            settled = _signature(file)
+            if settled == current:
+                break
+            current = settled
+        last = current
+        yield
+
+class Watcher:
+    """
+    Keeps the rendered sheets of a catalog file up to date
+
+    Args:
+        file (str): Catalog file
+        directory (str): Output directory
+        sheets (list): Sheets to render, see render.SHEETS
+        cache_dir (str): (Optional) Keep calculated geometry in this directory
+    """
+
+    def __init__(self, file, directory, sheets=render.SHEETS, cache_dir=None):
+        self.file = file
+        self.directory = directory
+        self.sheets = sheets
+        self.cache_dir = cache_dir
+        self.entries = {}
+
+    def _remove_sheets(self, key, sheets=render.SHEETS, keep=()):
+        instrument, maker, name, year = key
+        for sheet in sheets:
+            file = os.path.join(self.directory, f"{render.file_name(instrument, maker, name, year)}_{sheet}.svg")
+            if file not in keep and os.path.exists(file):
+                os.remove(file)
+
+    def refresh(self):
+        """
+        Reads the catalog and renders the new and changed entries
+
+        Returns:
+            int: Rendered entries
+            int: Removed entries
+            list: (key, error) of entries that failed
+        """
+        new = snapshot(Catalog(self.file))
+        changed, removed = diff(self.entries, new)
+
+        failed = []
+        entries = dict(new)
+        for key in changed:
+            instrument, maker, _, _ = key
+            # render_job resets the profiling counters, the earlier ones are added back
+            before = profiling.stats()
+            _, written, error, _, _ = render.render_job((instrument, maker, new[key], self.directory, self.sheets, self.cache_dir))
+            profiling.merge(before)
+            if error is not None:
+                failed.append((key, error))
+                # Keep the previous state, the entry is rendered again at the next refresh
+                if key in self.entries:
+                    entries[key] = self.entries[key]
+                else:
+                    del entries[key]
+                continue
+            # Sheets the entry no longer has, e.g. arching after af and ab were removed
+            self._remove_sheets(key, self.sheets, keep=written)
+        for key in removed:
+            self._remove_sheets(key)
+
+        self.entries = entries
+        return len(changed), len(removed), failed
+
+    def run(self, interval=0.2, debounce=0.3, initial=True):
+        if initial:
+            self._refresh()
+        else:
+            self.entries = snapshot(Catalog(self.file))
+        for _ in poll(self.file, interval, debounce):
+            self._refresh()
+
+    def _refresh(self):
+        start = time.perf_counter()
+        try:
+            changed, removed, failed = self.refresh()
+        except (OSError, json.JSONDecodeError) as e:
+            # Half saved or invalid file, wait for the next change
+            print(f"watch: {self.file}: {e}", file=sys.stderr)
+            return
+        for key, error in failed:
+            print(f"watch: {' '.join(key)}: failed, {error}", file=sys.stderr)
+        print(f"{changed} rendered, {removed} removed in {1000*(time.perf_counter()-start):.1f} ms", file=sys.stderr)
+
+def main(args):
+    sheets = args.sheets.split(",")
+    unknown = [s for s in sheets if s not in render.SHEETS]
+    if unknown:
+        print(f"watch: unknown sheet {', '.join(unknown)}, expected one of {', '.join(render.SHEETS)}", file=sys.stderr)
+        return 1
+    os.makedirs(args.output, exist_ok=True)
+
+    print(f"watching {args.file}", file=sys.stderr)
+    try:
+        Watcher(args.file, args.output, sheets, args.cache_dir).run(args.interval, args.debounce, initial=not args.changes_only)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def parser(prog="watch"):
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Watch the catalog and re-render the entries that change"
+    )
+    parser.add_argument('-o', '--output', type=str, default="out", help="output directory")
+    parser.add_argument('--file', type=str, default="data/instruments.json")
+    parser.add_argument('--sheets', type=str, default=",".join(render.SHEETS), help="comma separated sheets, default all")
+    parser.add_argument('--interval', type=float, default=0.2, help="polling interval in seconds")
+    parser.add_argument('--debounce', type=float, default=0.3, help="seconds the file has to be unchanged")
+    parser.add_argument('--changes_only', action='store_true', help="don't render the whole catalog at start")
+    parser.add_argument('--cache_dir', type=str, help="keep calculated geometry in this directory")
+    return parser
+
+if __name__ == '__main__':
+    sys.exit(main(parser().parse_args()))
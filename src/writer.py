@@ -0,0 +1,55 @@
+## Chunked text output, the base of the SVG, DXF and G-code writers
+#
+
+import io
+
+class ChunkWriter:
+    """
+    Incremental text output. Writes are buffered and passed to the sink
+    as one string per chunk, so a document is never held in memory.
+
+    The sink can be any text or binary file-like object.
+    """
+
+    def __init__(self, sink, chunk_size=1<<16):
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.binary = not isinstance(sink, io.TextIOBase)
+        self._parts = []
+        self._size = 0
+
+    @classmethod
+    def open(cls, file, chunk_size=1<<16, **kwargs):
+        """
+        Writer to an unbuffered file, one write syscall per chunk. kwargs
+        are passed to the writer.
+        """
+        sink = open(file, "wb", buffering=0)
+        try:
+            return cls(sink, chunk_size=chunk_size, **kwargs)
+        except BaseException:
+            sink.close()
+            raise
+
+    def write(self, s):
+        self._parts.append(s)
+        self._size += len(s)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self._parts:
+            chunk = "".join(self._parts)
+            self.sink.write(chunk.encode() if self.binary else chunk)
+            self._parts = []
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
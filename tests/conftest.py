@@ -0,0 +1,22 @@
+import os
+import sys
+import json
+
+import pytest
+
+# The modules are flat in src, as run by src/main.py
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+@pytest.fixture(scope="session")
+def entries():
+    """
+    (instrument, maker, entry) of the catalog
+    """
+    from catalog import Catalog
+    return list(Catalog(os.path.join(ROOT, "data", "instruments.json")).entries())
+
+@pytest.fixture(scope="session")
+def violins(entries):
+    import render
+    return [render.violin_from_entry(e) for _, _, e in entries]
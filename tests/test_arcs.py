@@ -0,0 +1,118 @@
+import math
+
+import numpy as np
+import pytest
+
+import arcs
+import render
+from batch import ViolinBatch
+
+FIELDS = ("cx", "cy", "r", "x0", "y0", "x1", "y1", "a0", "a1")
+
+def circle(cx, cy, r):
+    # Closed clockwise outline of two half circles
+    return arcs.arcs(cx, cy, r, [cx + r, cx - r], [cy, cy], [cx - r, cx + r], [cy, cy], True)
+
+def assert_outlines_equal(a, b, atol=1e-9):
+    for f in FIELDS:
+        assert np.allclose(a[f], b[f], rtol=0, atol=atol), f
+    assert np.array_equal(a["dir"], b["dir"])
+
+def variants(entries, n=8, spread=0.02):
+    rng = np.random.default_rng(1)
+    result = []
+    for _, _, entry in entries:
+        for _ in range(n):
+            e = dict(entry)
+            for p in ViolinBatch.params + ("km",):
+                if p in e and p != "h":
+                    e[p] *= 1 + rng.uniform(-spread, spread)
+            result.append(e)
+    return result
+
+def test_records_match_arrays(violins):
+    for v in violins:
+        assert_outlines_equal(np.array(v.get_outline_records(), dtype=arcs.ARC), arcs.outline(v))
+        assert_outlines_equal(np.array(v.get_half_outline_records(), dtype=arcs.ARC), arcs.half_outline(v))
+
+def test_batch_matches_violin(entries):
+    instruments = [render.violin_from_entry(e) for e in variants(entries)]
+    batch = ViolinBatch.from_violins(instruments).calculate()
+    assert batch.valid.all()
+    outlines = batch.get_outline()
+    for k, v in enumerate(instruments):
+        assert_outlines_equal(outlines[k], v.get_outline())
+
+def test_properties_circle():
+    p = arcs.properties(circle(3, -2, 5))
+    assert p["area"] == pytest.approx(math.pi*25)
+    assert p["perimeter"] == pytest.approx(2*math.pi*5)
+    assert (p["x"], p["y"]) == pytest.approx((3, -2))
+    assert p["ixx"] == pytest.approx(math.pi*5**4/4)
+    assert p["iyy"] == pytest.approx(math.pi*5**4/4)
+    assert p["ixy"] == pytest.approx(0, abs=1e-9)
+
+def test_properties_match_polygon(violins):
+    for v in violins:
+        segments = v.get_outline()
+        p = arcs.properties(segments)
+        x, y = arcs.flatten(segments, tolerance=1e-6)
+        x, y = x[:-1], y[:-1]
+        xn, yn = np.roll(x, -1), np.roll(y, -1)
+        cross = x*yn - xn*y
+        # Clockwise polygon
+        area = -np.sum(cross)/2
+        cx = -np.sum((x + xn)*cross)/(6*area)
+        cy = -np.sum((y + yn)*cross)/(6*area)
+        ixx = -np.sum((y*y + y*yn + yn*yn)*cross)/12 - area*cy*cy
+        iyy = -np.sum((x*x + x*xn + xn*xn)*cross)/12 - area*cx*cx
+        assert p["area"] == pytest.approx(area, rel=1e-7)
+        assert p["perimeter"] == pytest.approx(np.sum(np.hypot(xn - x, yn - y)), rel=1e-7)
+        assert (p["x"], p["y"]) == pytest.approx((cx, cy), rel=1e-7)
+        assert p["ixx"] == pytest.approx(ixx, rel=1e-6)
+        assert p["iyy"] == pytest.approx(iyy, rel=1e-6)
+
+def test_properties_batch(violins):
+    batch = ViolinBatch.from_violins(violins).calculate()
+    p = batch.get_outline_properties()
+    for k, v in enumerate(violins):
+        q = arcs.properties(v.get_outline())
+        for name in q:
+            assert p[name][k] == pytest.approx(q[name], rel=1e-12, abs=1e-5)
+
+@pytest.mark.parametrize("d", [0.5, 1.5, 4, -1.5, -4])
+def test_offset_distance(violins, d):
+    for v in violins:
+        outline = v.get_outline()
+        for join in ("round", "extend"):
+            offset = arcs.offset(outline, d, join=join)
+            x, y = arcs.flatten(offset, tolerance=1e-3)
+            nx, ny = arcs.nearest(outline, x, y)
+            distance = np.hypot(x - nx, y - ny)
+            if join == "round":
+                assert np.allclose(distance, abs(d), rtol=0, atol=1e-9)
+            else:
+                # Pointed corners are farther away, never closer
+                assert np.all(distance >= abs(d) - 1e-9)
+
+@pytest.mark.parametrize("d", [0.5, 1.5, 4])
+def test_offset_area(violins, d):
+    for v in violins:
+        outline = v.get_outline()
+        p = arcs.properties(outline)
+        q = arcs.properties(arcs.offset(outline, d))
+        assert q["area"] == pytest.approx(p["area"] + p["perimeter"]*d + math.pi*d*d, rel=1e-12)
+        assert q["perimeter"] == pytest.approx(p["perimeter"] + 2*math.pi*d, rel=1e-12)
+
+def test_offset_circle():
+    for d in (2, -2):
+        offset = arcs.offset(circle(0, 0, 5), d)
+        assert np.allclose(offset["r"], 5 + d)
+    with pytest.raises(ValueError):
+        arcs.offset(circle(0, 0, 5), -6)
+
+def test_offset_several(violins):
+    outline = violins[0].get_outline()
+    several = arcs.offset(outline, [1.5, -1.5])
+    for d, segments in zip((1.5, -1.5), several):
+        assert_outlines_equal(segments, arcs.offset(outline, d))
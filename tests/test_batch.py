@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import render
+from batch import POINTS, ViolinBatch
+from violin import Violin
+
+def assert_matches(b, i, v):
+    # Instrument i of the batch against the Violin, value by value
+    for d in Violin.derived:
+        if d in POINTS:
+            assert (getattr(b, d)[0][i], getattr(b, d)[1][i]) == pytest.approx(getattr(v, d), rel=1e-12, abs=1e-9), d
+        else:
+            assert getattr(b, d)[i] == pytest.approx(getattr(v, d), rel=1e-12, abs=1e-9), d
+
+def test_calculate_catalog(violins):
+    b = ViolinBatch.from_violins(violins).calculate()
+    assert len(b) == len(violins) and b.valid.all()
+    for i, v in enumerate(violins):
+        assert_matches(b, i, v)
+
+def test_outline_catalog(violins):
+    b = ViolinBatch.from_violins(violins).calculate()
+    outlines = b.get_outline()
+    properties = b.get_outline_properties()
+    for i, v in enumerate(violins):
+        outline = v.get_outline()
+        for field in outline.dtype.names:
+            assert outlines[i][field].tolist() == pytest.approx(outline[field].tolist(), rel=1e-12, abs=1e-9), field
+        for key, value in v.get_outline_properties().items():
+            # ixy is 0 by symmetry, up to rounding
+            assert properties[key][i] == pytest.approx(value, rel=1e-12, abs=1e-12*properties["ixx"][i]), key
+        assert np.array(b.get_bout_widths_mm())[:, i] == pytest.approx(v.get_bout_widths_mm())
+
+def test_separate_passes(violins):
+    # calculate is the body then the corner pass
+    b = ViolinBatch.from_violins(violins)
+    b.calculate_body_params()
+    b.calculate_corner_params()
+    for i, v in enumerate(violins):
+        assert_matches(b, i, v)
+
+def test_broadcast(entries):
+    _, _, entry = entries[0]
+    v = render.violin_from_entry(entry)
+    kc = [v.kc, v.kc*1.01, v.kc*0.99]
+    b = ViolinBatch(**dict({p: getattr(v, p) for p in Violin.params}, kc=kc)).calculate()
+    assert len(b) == 3 and b.h.tolist() == [v.h]*3
+    for i in range(3):
+        w = b.violin(i)
+        w.calculate_body_params()
+        w.calculate_corner_params()
+        assert w.kc == kc[i]
+        assert_matches(b, i, w)
+
+def test_km():
+    b = ViolinBatch(0.5, 0.8, 1.1, 0.5, 0.3, 1, 1, 0.2, 0.4, 0.2, 0.4, km=[0.5, 0.6])
+    assert b.kmu.tolist() == b.kml.tolist() == [0.5, 0.6]
+    with pytest.raises(Exception):
+        ViolinBatch(0.5, 0.8, 1.1, 0.5, 0.3, 1, 1, 0.2, 0.4, 0.2, 0.4, kmu=0.5)
+
+def test_invalid(violins):
+    b = ViolinBatch.from_violins(violins[:2])
+    b.kw[1] = 10
+    b.calculate()
+    assert b.valid.tolist() == [True, False]
+    assert np.isnan(b.rl[1])
+    assert_matches(b, 0, violins[0])
+    # The Violin raises where the batch gives NaN
+    with pytest.raises(ValueError):
+        b.violin(1).calculate_body_params()
@@ -0,0 +1,97 @@
+import os
+import pickle
+
+import pytest
+
+import cache
+import render
+from cache import GeometryCache
+
+def assert_same_geometry(a, b):
+    for p in a.params + a.derived:
+        assert getattr(a, p) == getattr(b, p), p
+    assert a.get_outline_records() == b.get_outline_records()
+
+@pytest.fixture
+def entry(entries):
+    return entries[0][2]
+
+def test_hit_miss(entry):
+    c = GeometryCache()
+    first = render.violin_from_entry(entry, cache=c)
+    second = render.violin_from_entry(entry, cache=c)
+    assert (c.misses, c.hits) == (1, 1)
+    assert first is not second
+    assert_same_geometry(first, render.violin_from_entry(entry))
+    assert_same_geometry(second, render.violin_from_entry(entry))
+
+def test_key_normalized(entry):
+    c = GeometryCache()
+    render.violin_from_entry(entry, cache=c)
+    # Rounding noise and km as kmu and kml are the same design
+    nearby = dict(entry, kc=entry["kc"] + 1e-13)
+    if "km" in nearby:
+        nearby["kmu"] = nearby["kml"] = nearby.pop("km")
+    render.violin_from_entry(nearby, cache=c)
+    assert (c.misses, c.hits) == (1, 1)
+    render.violin_from_entry(dict(entry, kc=entry["kc"] + 1e-3), cache=c)
+    assert c.misses == 2
+
+def test_eviction(entries):
+    c = GeometryCache(maxsize=1)
+    a, b = entries[0][2], entries[1][2]
+    for e in (a, b, a):
+        render.violin_from_entry(e, cache=c)
+    assert (c.misses, c.hits, c.evictions, len(c)) == (3, 0, 2, 1)
+
+def test_disk(entry, tmp_path):
+    c = GeometryCache(directory=str(tmp_path))
+    render.violin_from_entry(entry, cache=c)
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and files[0].endswith(".pkl")
+
+    # Another process, or the next run
+    c = GeometryCache(directory=str(tmp_path))
+    assert_same_geometry(render.violin_from_entry(entry, cache=c), render.violin_from_entry(entry))
+    assert (c.disk_hits, c.misses) == (1, 0)
+
+def test_disk_version(entry, tmp_path, monkeypatch):
+    render.violin_from_entry(entry, cache=GeometryCache(directory=str(tmp_path)))
+    monkeypatch.setattr(cache, "VERSION", cache.VERSION + 1)
+    c = GeometryCache(directory=str(tmp_path))
+    render.violin_from_entry(entry, cache=c)
+    assert (c.disk_hits, c.misses) == (0, 1)
+    # Stored again under the new version
+    assert len(os.listdir(tmp_path)) == 2
+
+@pytest.mark.parametrize("content", [b"", b"not a pickle", pickle.dumps((cache.VERSION, {"h": 1}))])
+def test_disk_unreadable(entry, tmp_path, content):
+    c = GeometryCache(directory=str(tmp_path))
+    with open(c._file(c.key(entry)), "wb") as f:
+        f.write(content)
+    assert_same_geometry(render.violin_from_entry(entry, cache=c), render.violin_from_entry(entry))
+    assert (c.disk_hits, c.misses) == (0, 1)
+
+def test_entry_without_h(entry):
+    entry = {p: v for p, v in entry.items() if p != "h"}
+    # The Violin default on both paths
+    assert render.violin_from_entry(entry).h == 100
+    assert render.violin_from_entry(entry, cache=GeometryCache()).h == 100
+
+def test_entry_missing_parameter(entry):
+    entry = {p: v for p, v in entry.items() if p != "kc"}
+    with pytest.raises(KeyError):
+        render.violin_from_entry(entry)
+    with pytest.raises(KeyError):
+        render.violin_from_entry(entry, cache=GeometryCache())
+
+def test_process_cache(entry, tmp_path):
+    assert render.process_cache() is render.process_cache()
+    assert render.process_cache(str(tmp_path)) is not render.process_cache()
+    # A worker keeps the geometry from job to job
+    job = ("violin", "Guarneri", entry, str(tmp_path), ["outline"], None)
+    render.render_job(job)
+    hits = render.process_cache().hits
+    _, files, error, _, _ = render.render_job(job)
+    assert error is None and len(files) == 1
+    assert render.process_cache().hits == hits + 1
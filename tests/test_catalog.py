@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+
+import pytest
+
+import catalog
+from catalog import Catalog
+
+from conftest import ROOT
+
+@pytest.fixture
+def file(tmp_path):
+    file = tmp_path / "instruments.json"
+    shutil.copy(os.path.join(ROOT, "data", "instruments.json"), file)
+    return str(file)
+
+def test_save_round_trip(file):
+    with open(file) as f:
+        original = json.load(f)
+    Catalog(file).save(indent=2)
+    with open(file) as f:
+        assert json.load(f) == original
+    assert Catalog(file).data == original
+    assert os.listdir(os.path.dirname(file)) == ["instruments.json"]
+
+def test_save_other_file(file, tmp_path):
+    Catalog(file).save(str(tmp_path / "copy.json"))
+    assert Catalog(str(tmp_path / "copy.json")).data == Catalog(file).data
+
+def test_save_failure_keeps_file(file, monkeypatch):
+    with open(file) as f:
+        original = f.read()
+
+    def fail(*args, **kwargs):
+        raise TypeError("not serializable")
+    monkeypatch.setattr(catalog.json, "dumps", fail)
+    with pytest.raises(TypeError):
+        Catalog(file).save()
+    with open(file) as f:
+        assert f.read() == original
+    assert os.listdir(os.path.dirname(file)) == ["instruments.json"]
+
+def test_lookups_case_insensitive(file):
+    c = Catalog(file)
+    assert c.instruments() == ["violin", "cello"]
+    assert c.instrument("VIOLIN") == "violin"
+    assert c.instrument("viola") is None
+    assert c.makers("Violin") == ["Guarneri"]
+    assert c.makers("viola") is None
+    assert [e["name"] for e in c.models("violin", "guarneri")] == ["Ole Bull"]
+    assert c.models("violin", "Stradivari") is None
+
+def test_find(file):
+    c = Catalog(file)
+    assert [e["year"] for e in c.find("violin", "GUARNERI", "ole bull")] == [1744]
+    assert [e["name"] for e in c.find("violin", "guarneri", "1744")] == ["Ole Bull"]
+    # Part of the name, or the year within model
+    assert [e["name"] for e in c.find("violin", "guarneri", "bull")] == ["Ole Bull"]
+    assert [e["name"] for e in c.find("violin", "guarneri", "Ole Bull 1744")] == ["Ole Bull"]
+    assert c.find("violin", "guarneri", "Messiah") == []
+    assert c.find("viola", "guarneri", "Ole Bull") == []
+    assert c.find("violin", "Amati", "Ole Bull") == []
+
+def test_select(file):
+    c = Catalog(file)
+    everything = list(c.select())
+    assert everything == list(c.entries())
+    assert [(i, m) for i, m, _ in c.select("CELLO")] == [(i, m) for i, m, _ in everything if i == "cello"]
+    assert [e["name"] for _, _, e in c.select("cello", "op")] == ["T1"]
+    assert [(i, m, e["name"]) for i, m, e in c.select("violin", "guarneri", "ole")] == [("violin", "Guarneri", "Ole Bull")]
+    assert list(c.select("viola")) == []
+
+def test_index_follows_file(file):
+    assert Catalog(file).makers("violin") == ["Guarneri"]
+    assert os.path.exists(file + ".index")
+
+    data = Catalog(file).data
+    data["violin"]["Amati"] = [dict(data["violin"]["Guarneri"][0], name="King", year=1560)]
+    with open(file, "w") as f:
+        json.dump(data, f)
+    c = Catalog(file)
+    assert c.makers("violin") == ["Guarneri", "Amati"]
+    assert [e["year"] for e in c.find("violin", "amati", "king")] == [1560]
+
+def test_index_not_writable(file, tmp_path):
+    c = Catalog(file, index=str(tmp_path / "missing" / "instruments.index"))
+    assert c.makers("violin") == ["Guarneri"]
+    assert not os.path.exists(tmp_path / "missing")
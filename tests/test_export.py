@@ -0,0 +1,119 @@
+import io
+import math
+import re
+
+import pytest
+
+import export
+import render
+from export import DxfWriter, GcodeWriter, write_parts
+from svg import SvgWriter
+from writer import ChunkWriter
+
+def dxf_entities(text):
+    # (kind, {code: value}) of the ENTITIES section
+    lines = text.split("\n")
+    pairs = list(zip(lines[0::2], lines[1::2]))
+    start = pairs.index(("2", "ENTITIES")) + 1
+    end = pairs.index(("0", "ENDSEC"), start)
+    entities = []
+    for code, value in pairs[start:end]:
+        if code == "0":
+            entities.append((value, {}))
+        elif code != "999":
+            entities[-1][1][int(code)] = value if code == "8" else float(value)
+    return entities
+
+def arc_points(g):
+    # Start and end of a DXF arc, counterclockwise from 50 to 51
+    a0, a1 = math.radians(g[50]), math.radians(g[51])
+    return ((g[10] + g[40]*math.cos(a0), g[20] + g[40]*math.sin(a0)),
+            (g[10] + g[40]*math.cos(a1), g[20] + g[40]*math.sin(a1)))
+
+def output(tmp_path, cls, parts, template=False, **kwargs):
+    file = tmp_path / "out"
+    with cls.open(str(file), **kwargs) as writer:
+        n = write_parts(writer, iter(parts), template=template)
+    assert n == len(parts)
+    return file.read_text()
+
+@pytest.fixture
+def parts(entries):
+    return [(f"{i} {m} {e['name']}", i, render.violin_from_entry(e)) for i, m, e in entries]
+
+def test_writers_are_not_svg():
+    for cls in (DxfWriter, GcodeWriter):
+        assert issubclass(cls, ChunkWriter) and not issubclass(cls, SvgWriter)
+
+def test_dxf_outline(tmp_path, parts):
+    text = output(tmp_path, DxfWriter, parts)
+    assert text.startswith("0\nSECTION\n2\nHEADER\n") and text.endswith("0\nENDSEC\n0\nEOF\n")
+    lines = text.split("\n")
+    assert lines[0::2].count("999") == len(parts)
+
+    entities = dxf_entities(text)
+    assert [kind for kind, _ in entities] == ["ARC"]*20*len(parts)
+    for k in range(len(parts)):
+        arcs = [g for _, g in entities[20*k:20*(k+1)]]
+        assert all(g[8] == "OUTLINE" for g in arcs)
+        # A closed contour, each arc ends where another starts
+        ends = [p for g in arcs for p in arc_points(g)]
+        for p in ends:
+            assert sum(math.dist(p, q) < 1e-5 for q in ends) == 2
+
+def test_dxf_template(tmp_path, parts):
+    entities = dxf_entities(output(tmp_path, DxfWriter, parts, template=True))
+    holes = sum(len(v.get_template_holes(type)) for _, type, v in parts)
+    assert sum(kind == "CIRCLE" for kind, _ in entities) == holes
+    assert {g[8] for kind, g in entities if kind == "CIRCLE"} == {"HOLES"}
+    assert {kind for kind, _ in entities} == {"ARC", "LINE", "CIRCLE"}
+
+@pytest.mark.parametrize("depth, step_down", [(6, 2), (6, 4), (1, 2)])
+def test_gcode_outline(tmp_path, parts, depth, step_down):
+    lines = output(tmp_path, GcodeWriter, parts[:1], depth=depth, step_down=step_down).split("\n")
+    assert lines[0] == "%" and lines[-2:] == ["%", ""]
+    assert "M30" in lines
+
+    passes = math.ceil(depth/step_down)
+    plunges = [float(re.search(r"Z(-?[\d.]+)", l).group(1)) for l in lines if l.startswith("G1 Z")]
+    assert plunges == pytest.approx([-depth*(i+1)/passes for i in range(passes)])
+    moves = [l for l in lines if l.startswith(("G2 ", "G3 "))]
+    assert len(moves) == 20*passes
+
+    # Each arc starts and ends on its circle
+    position = None
+    for l in lines:
+        values = dict((k, float(v)) for k, v in re.findall(r"([XYIJ])(-?[\d.]+)", l))
+        if l.startswith(("G2 ", "G3 ")):
+            center = (position[0] + values["I"], position[1] + values["J"])
+            assert math.dist(center, position) == pytest.approx(math.dist(center, (values["X"], values["Y"])), abs=1e-3)
+        if "X" in values:
+            position = (values["X"], values["Y"])
+
+def test_gcode_compensation(tmp_path, parts):
+    for side, code in (("outside", "G41"), ("inside", "G42")):
+        text = output(tmp_path, GcodeWriter, parts[:1], side=side, tool=3)
+        assert text.count(f"{code} D3 ") == 3 and text.count("G40 G1") == 3
+        assert "T3 M6" in text
+    with pytest.raises(ValueError):
+        GcodeWriter(io.StringIO(), side="left")
+
+def test_gcode_holes(tmp_path, parts):
+    text = output(tmp_path, GcodeWriter, parts[:1], template=True)
+    _, type, v = parts[0]
+    holes = len(v.get_template_holes(type))
+    lines = text.split("\n")
+    assert text.count("G98 G81 ") == 1 and lines.count("G80") == 1
+    start = next(k for k, l in enumerate(lines) if l.startswith("G98 G81"))
+    assert lines.index("G80", start) - start == holes
+
+def test_open_fails(tmp_path, capsys):
+    file = str(tmp_path / "missing" / "out.dxf")
+    assert export.main(export.parser().parse_args(["-o", file])) == 1
+    assert capsys.readouterr().err.startswith("export: ")
+    assert export.main(export.parser().parse_args(["-f", "gcode", "-o", file])) == 1
+
+def test_open_closes_on_error(tmp_path):
+    with pytest.raises(ValueError):
+        GcodeWriter.open(str(tmp_path / "out.nc"), side="left")
+    assert (tmp_path / "out.nc").read_bytes() == b""
@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+import pytest
+
+from helpers import (
+    line_circle_intersect, line_circle_intersections,
+    circle_circle_intersect, circle_circle_intersections,
+)
+
+def test_line_circle_vertical():
+    right, left, valid = line_circle_intersections((0, 0), 5, (3, -10), (3, 10))
+    assert valid
+    assert np.allclose(right, (3, 4))
+    assert np.allclose(left, (3, -4))
+    assert line_circle_intersect((0, 0), 5, (3, -10), (3, 10)) == pytest.approx([(3, 4), (3, -4)])
+
+def test_line_circle_matches_scalar():
+    rng = np.random.default_rng(0)
+    c = rng.uniform(-10, 10, (2, 200))
+    r = rng.uniform(1, 10, 200)
+    p0 = rng.uniform(-10, 10, (2, 200))
+    p1 = rng.uniform(-10, 10, (2, 200))
+    p_large, p_small, valid = line_circle_intersections(c, r, p0, p1)
+    for k in range(200):
+        expected = line_circle_intersect(c[:, k], r[k], p0[:, k], p1[:, k])
+        assert valid[k] == bool(expected)
+        if expected:
+            got = sorted([(p_large[0][k], p_large[1][k]), (p_small[0][k], p_small[1][k])], reverse=True)
+            assert np.allclose(got, expected)
+
+@pytest.mark.parametrize("r", [1e-3, 1, 1e3])
+def test_line_circle_near_tangent(r):
+    tol = 1e-9
+    # Within tol of tangency the line touches in one point
+    right, left, valid = line_circle_intersections((0, 0), r, (-2*r, r*(1 + tol/2)), (2*r, r*(1 + tol/2)), tol=tol)
+    assert valid
+    assert np.allclose(right, left, rtol=0, atol=1e-6*r)
+    assert np.allclose(right, (0, r), rtol=0, atol=1e-6*r)
+    # Beyond it the line misses
+    right, _, valid = line_circle_intersections((0, 0), r, (-2*r, r*(1 + 3*tol)), (2*r, r*(1 + 3*tol)), tol=tol)
+    assert not valid
+    assert np.isnan(right[0])
+
+def test_line_circle_same_points():
+    with np.errstate(all="raise"):
+        right, left, valid = line_circle_intersections((0, 0), 5, (1, 1), (1, 1))
+    assert not valid
+    assert np.isnan(right).all() and np.isnan(left).all()
+
+@pytest.mark.parametrize("r0, r1", [(1, 1), (1e-3, 2e-3), (1e3, 10)])
+def test_circle_circle_near_tangent(r0, r1):
+    tol = 1e-9
+    for gap, expected in ((tol/2, True), (2*tol, False)):
+        d = (r0 + r1)*(1 + gap)
+        right, left, valid = circle_circle_intersections((0, 0), r0, (d, 0), r1, tol=tol)
+        assert valid == expected
+        if expected:
+            assert np.allclose(right, left, rtol=0, atol=1e-6*r0)
+            assert np.allclose(right, (r0, 0), rtol=0, atol=1e-6*r0)
+
+@pytest.mark.parametrize("r0, c1, r1", [
+    (1.5, (3, 0), 1),       # apart
+    (5, (1, 0), 1),         # inside
+    (5, (4, 3), 2),         # crossing
+    (5, (0, 7), 2),         # touching
+    (5, (-2, -1), 4),       # crossing, center on the left
+])
+def test_circle_circle_touch_matches_scalar(r0, c1, r1):
+    right, left, valid = circle_circle_intersections((0, 0), r0, c1, r1, touch=True)
+    expected = circle_circle_intersect((0, 0), r0, c1, r1)
+    assert valid
+    if len(expected) == 1:
+        expected = expected*2
+    assert np.allclose(right, expected[0])
+    assert np.allclose(left, expected[1])
+
+def test_circle_circle_apart_without_touch():
+    right, left, valid = circle_circle_intersections((0, 0), 1, (3, 0), 1)
+    assert not valid
+    assert math.isnan(right[0]) and math.isnan(left[1])
+
+def test_circle_circle_arrays():
+    c0 = (np.array([0, 0, 0]), np.array([0, 0, 0]))
+    c1 = (np.array([3, 10, 1]), np.array([0, 0, 0]))
+    right, left, valid = circle_circle_intersections(c0, [2, 1, 5], c1, [2, 1, 1])
+    assert valid.tolist() == [True, False, False]
+    assert np.allclose((right[0][0], right[1][0]), (1.5, -math.sqrt(4 - 2.25)))
+    assert np.allclose((left[0][0], left[1][0]), (1.5, math.sqrt(4 - 2.25)))
+
+def test_circle_circle_scalar():
+    # One pair of the array kernel, as plain floats
+    points = circle_circle_intersect((0, 0), 5, (4, 3), 2)
+    assert len(points) == 2 and all(type(x) is float for p in points for x in p)
+    assert circle_circle_intersect((0, 0), 5, (0, 7), 2) == pytest.approx([(0, 5)])
+    # Apart, moved to touch: r0 is d - r1
+    assert circle_circle_intersect((0, 0), 1.5, (3, 0), 1) == pytest.approx([(2, 0)])
+    assert circle_circle_intersect((0, 0), 5, (0, 0), 5) == []
+    assert circle_circle_intersect((0, 0), 5, (0, 0), 2) == []
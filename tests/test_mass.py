@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import arcs
+import render
+from arching import plate, zones
+from batch import ViolinBatch
+from mass import arch, parse_zones
+
+KEYS = ("area", "surface", "arch_volume", "volume", "mass")
+
+def test_plate_area(violins):
+    for v in violins:
+        # Nearly flat, the surface is the area
+        p = plate(v, 1e-3, thickness=2, density=0.5)
+        area = arcs.properties(v.get_outline())["area"]
+        assert p["area"] == pytest.approx(area, rel=1e-5)
+        assert p["surface"] == pytest.approx(p["area"], rel=1e-8)
+        assert p["volume"] == pytest.approx(2*p["surface"])
+        assert p["mass"] == pytest.approx(p["volume"]*0.5e-3)
+
+@pytest.mark.parametrize("h", [15, -15])
+def test_plate_arched(violins, h):
+    for v in violins:
+        p = plate(v, h)
+        assert p["surface"] > p["area"]
+        assert 0 < p["arch_volume"] < abs(h)*p["area"]
+        assert p["volume"] == pytest.approx(3*p["surface"])
+        # The back mirrors the top
+        assert p == pytest.approx(plate(v, -h))
+
+def test_plate_zones(violins):
+    v = violins[0]
+    assert plate(v, 15, thickness=zones([(0, 3)]))["volume"] == pytest.approx(plate(v, 15)["volume"])
+    graduated = plate(v, 15, thickness=zones([(0, 3.2), (0.3, 2.6), (0.8, 3)]))
+    assert 2.6*graduated["surface"] < graduated["volume"] < 3.2*graduated["surface"]
+
+def test_plate_center_arch(entries):
+    for _, _, e in entries:
+        if "afc" in e:
+            v = render.violin_from_entry(e)
+            flatter = plate(v, e["af"], afc=e["afc"], afd=e["afd"])
+            assert flatter["arch_volume"] < plate(v, e["af"])["arch_volume"]
+            with pytest.raises(Exception):
+                plate(v, e["af"], afc=e["af"] + 1, afd=e["afd"])
+
+def test_batch_matches_plate(entries):
+    selected = [(e, arch(e, "top")) for _, _, e in entries for _ in range(3) if arch(e, "top")]
+    selected += [(e, arch(e, "back")) for _, _, e in entries if arch(e, "back")]
+    violins = [render.violin_from_entry(e) for e, _ in selected]
+    h, afc, afd = (np.array(values, dtype=float) for values in zip(*(a for _, a in selected)))
+    graduation = zones([(0, 3.2), (0.3, 2.6), (0.8, 3)])
+
+    p = ViolinBatch.from_violins(violins).calculate().get_plate(h, thickness=graduation, density=0.4, afc=afc, afd=afd)
+    for k, (v, (hk, afck, afdk)) in enumerate(zip(violins, (a for _, a in selected))):
+        q = plate(v, hk, thickness=graduation, density=0.4, afc=afck, afd=afdk)
+        for key in KEYS:
+            assert p[key][k] == pytest.approx(q[key], rel=1e-10), key
+
+def test_batch_invalid(violins):
+    b = ViolinBatch.from_violins(violins[:2])
+    b.kw[1] = 10
+    b.calculate()
+    assert b.valid.tolist() == [True, False]
+    p = b.get_plate(15)
+    assert p["volume"][0] == pytest.approx(plate(violins[0], 15)["volume"], rel=1e-10)
+    assert all(np.isnan(p[key][1]) for key in KEYS)
+
+def test_arch_sign():
+    entry = {"af": 16, "afc": 12, "afd": 3, "ab": 15}
+    assert arch(entry, "top") == (16, 12, 3)
+    assert arch(entry, "back") == (-15, None, None)
+    assert arch({"ab": 15}, "top") is None
+
+def test_parse_zones():
+    assert parse_zones("0:3.2,0.3:2.6") == [(0, 3.2), (0.3, 2.6)]
+    for spec in ("", "0:3,1", "a:3", "0:-1"):
+        with pytest.raises(ValueError):
+            parse_zones(spec)
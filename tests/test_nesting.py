@@ -0,0 +1,117 @@
+import os
+import math
+import itertools
+
+import numpy as np
+import pytest
+
+import nesting
+from conftest import ROOT
+from export import DxfWriter
+from nesting import MaxRects, hull, instrument_parts, min_area_rect, nest, points, rotate
+
+@pytest.fixture
+def parts(entries, violins):
+    return [p for (i, m, e), v in zip(entries, violins) for p in instrument_parts(f"{i} {m} {e['name']}", i, v, e)]
+
+def boxes(placed, tolerance=0.1):
+    # (sheet, x0, y0, x1, y1) of the placed parts, from their flattened points
+    result = []
+    for sheet, _, elements, _, (ox, oy) in placed:
+        x, y = points(elements, tolerance)
+        result.append((sheet, x.min() + ox, y.min() + oy, x.max() + ox, y.max() + oy))
+    return result
+
+def test_hull():
+    x = np.array([0, 2, 2, 0, 1, 1, 0.5])
+    y = np.array([0, 0, 1, 1, 0.5, 0, 0.2])
+    h = hull(x, y)
+    assert sorted(map(tuple, h.tolist())) == [(0, 0), (0, 1), (2, 0), (2, 1)]
+    # Counterclockwise
+    area = np.sum(h[:,0]*np.roll(h[:,1], -1) - np.roll(h[:,0], -1)*h[:,1])/2
+    assert area == pytest.approx(2)
+
+def test_min_area_rect():
+    corners = np.array([(0, 0), (40, 0), (40, 10), (0, 10)], dtype=float)
+    c, s = math.cos(0.3), math.sin(0.3)
+    turned = np.column_stack((c*corners[:,0] - s*corners[:,1], s*corners[:,0] + c*corners[:,1]))
+    angle, w, h = min_area_rect(hull(turned[:,0], turned[:,1]))
+    assert w*h == pytest.approx(400)
+    assert sorted((w, h)) == pytest.approx([10, 40])
+    assert math.remainder(angle + 0.3, math.pi/2) == pytest.approx(0, abs=1e-12)
+
+def test_rotate(parts):
+    _, elements, _ = parts[0]
+    x, y = points(elements)
+    tx, ty = points(rotate(elements, 0.7))
+    c, s = math.cos(0.7), math.sin(0.7)
+    # Lines turn exactly, flattened arcs within the tolerance
+    assert np.hypot(tx, ty) == pytest.approx(np.hypot(x, y), abs=0.2)
+    lines = [e for e in elements if e[0] == "line"]
+    turned = [e for e in rotate(elements, 0.7) if e[0] == "line"]
+    for (_, p0, _), (_, q0, _) in zip(lines, turned):
+        assert q0 == pytest.approx((c*p0[0] - s*p0[1], s*p0[0] + c*p0[1]))
+
+def test_max_rects():
+    free = MaxRects(100, 50)
+    assert free.find(120, 10) is None
+    assert free.find(40, 110) is None
+    # Taller than the sheet, it goes in turned
+    assert free.find(10, 80)[3]
+    free.place(0, 0, 60, 30)
+    # The free rectangles are what is left, maximal
+    assert sorted(map(tuple, free.free.tolist())) == [(0, 30, 100, 20), (60, 0, 40, 50)]
+    _, x, y, turned = free.find(40, 40)
+    assert (x, y, turned) == (60, 0, False)
+
+def test_nest(parts):
+    gap = 3
+    placed = nest(parts, 1000, 800, gap=gap)
+    assert sorted(p[1] for p in placed) == sorted(p[0] for p in parts)
+    sheets = {p[0] for p in placed}
+    assert sheets == set(range(len(sheets)))
+
+    placed_boxes = boxes(placed)
+    for _, x0, y0, x1, y1 in placed_boxes:
+        assert gap/2 - 1e-6 <= x0 and x1 <= 1000 - gap/2 + 1e-6
+        assert gap/2 - 1e-6 <= y0 and y1 <= 800 - gap/2 + 1e-6
+    # Parts on the same sheet keep the gap
+    for a, b in itertools.combinations(placed_boxes, 2):
+        if a[0] == b[0]:
+            assert (a[3] + gap <= b[1] + 1e-6 or b[3] + gap <= a[1] + 1e-6 or
+                    a[4] + gap <= b[2] + 1e-6 or b[4] + gap <= a[2] + 1e-6)
+
+def test_nest_holes_follow(parts):
+    placed = nest(parts[:1], 600, 400)
+    _, _, elements, holes, _ = placed[0]
+    _, original, original_holes = parts[0]
+    assert len(holes) == len(original_holes) > 0
+    # The holes keep their place relative to the turned profile
+    x, y = points(original)
+    tx, ty = points(elements)
+    d = np.hypot(original_holes[0][0] - x, original_holes[0][1] - y).min()
+    assert np.hypot(holes[0][0] - tx, holes[0][1] - ty).min() == pytest.approx(d, abs=0.2)
+
+def test_nest_too_large(parts):
+    with pytest.raises(ValueError, match="does not fit on the sheet"):
+        nest(parts, 100, 100)
+
+def test_write_nested(parts, tmp_path):
+    placed = nest(parts, 1000, 800)
+    file = tmp_path / "nested.dxf"
+    with DxfWriter.open(str(file)) as writer:
+        sheets = nesting.write_nested(writer, placed, 1000, 800)
+    assert sheets == len({p[0] for p in placed})
+    text = file.read_text()
+    assert text.endswith("0\nEOF\n")
+    assert text.split("\n")[0::2].count("999") == len(placed)
+
+def test_main(tmp_path, capsys):
+    file = str(tmp_path / "nested.nc")
+    catalog = os.path.join(ROOT, "data", "instruments.json")
+    args = nesting.parser().parse_args(["violin", "-f", "gcode", "-o", file, "--parts", "template,outline", "--file", catalog])
+    assert nesting.main(args) == 0
+    assert "parts on" in capsys.readouterr().err
+    assert nesting.main(nesting.parser().parse_args(["--parts", "neck"])) == 1
+    assert nesting.main(nesting.parser().parse_args(["--sheet", "600"])) == 1
+    assert nesting.main(nesting.parser().parse_args(["--arch_spacing", "0"])) == 1
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from batch import (POINTS, RECORD, ViolinBatch, load_records, record_dtype,
+                   save_records, violin_from_record)
+from violin import Violin
+
+@pytest.fixture
+def batch(violins):
+    b = ViolinBatch.from_violins(list(violins) + [violins[0]])
+    b.kw[-1] = 10
+    return b.calculate()
+
+def test_records(batch, violins):
+    records = batch.to_records()
+    assert records.dtype == RECORD and len(records) == len(batch)
+    assert records["valid"].tolist() == [True]*len(violins) + [False]
+    assert records["cu"][:-1, 1].tolist() == batch.cu[1][:-1].tolist()
+    assert np.isnan(records["rl"][-1])
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load(batch, tmp_path, mmap):
+    file = str(tmp_path / "records.npy")
+    records = batch.to_records()
+    save_records(file, records)
+    loaded = load_records(file, mmap=mmap)
+    assert isinstance(loaded, np.memmap) == mmap
+    assert loaded.dtype == RECORD
+    assert loaded.tobytes() == records.tobytes()
+    if mmap:
+        # Read only, the file is not changed through the map
+        with pytest.raises(ValueError):
+            loaded["h"][0] = 1
+
+def test_from_records_views(batch, tmp_path):
+    file = str(tmp_path / "records.npy")
+    save_records(file, batch.to_records())
+    loaded = load_records(file)
+    b = ViolinBatch.from_records(loaded)
+    # Views of the map, nothing copied
+    assert np.shares_memory(b.rl, loaded) and np.shares_memory(b.cu[0], loaded)
+    for d in Violin.derived:
+        assert np.array_equal(getattr(b, d), getattr(batch, d), equal_nan=True), d
+    assert b.valid.tolist() == batch.valid.tolist()
+    # A loaded batch gives the same outlines without calculating
+    valid = batch.valid
+    assert b.get_outline()[valid].tobytes() == batch.get_outline()[valid].tobytes()
+
+def test_violin_from_record(batch, violins):
+    records = batch.to_records()
+    for record, v in zip(records, violins):
+        w = violin_from_record(record)
+        for d in Violin.derived:
+            value = getattr(w, d)
+            assert value == (tuple(record[d].tolist()) if d in POINTS else record[d]), d
+            assert type(value) is (tuple if d in POINTS else float), d
+        # The batch and the Violin agree up to rounding
+        outline = w.get_outline()
+        for field in outline.dtype.names:
+            assert outline[field].tolist() == pytest.approx(v.get_outline()[field].tolist(), rel=1e-12, abs=1e-9), field
+
+def test_float32(batch):
+    records = batch.to_records("f4")
+    assert records.dtype == record_dtype("f4")
+    # Half the size, but for the valid flag
+    assert 2*(records.dtype.itemsize - 1) == RECORD.itemsize - 1
+    assert records["rl"][0] == pytest.approx(batch.rl[0], rel=1e-6)
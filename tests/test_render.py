@@ -0,0 +1,54 @@
+import os
+import errno
+
+import pytest
+
+import profiling
+import render
+
+@pytest.fixture
+def entry(entries):
+    return entries[0]
+
+def test_render_entry(entry, tmp_path):
+    instrument, maker, e = entry
+    files = render.render_entry(instrument, maker, e, str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(f) for f in files)
+    assert len(files) == len(render.SHEETS)
+
+def test_render_entry_open_fails(entry, tmp_path, monkeypatch):
+    # The error of the open, not one of removing the file it did not create
+    instrument, maker, e = entry
+
+    def full(file, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device", file)
+    monkeypatch.setattr(render.SvgWriter, "open", full)
+    with pytest.raises(OSError) as error:
+        render.render_entry(instrument, maker, e, str(tmp_path))
+    assert error.value.errno == errno.ENOSPC
+
+def test_render_entry_no_partial_sheet(entry, tmp_path, monkeypatch):
+    instrument, maker, e = entry
+
+    def fail(writer, *args, **kwargs):
+        writer.write("<svg")
+        raise ValueError("no geometry")
+    monkeypatch.setattr(render, "write_svg", fail)
+    with pytest.raises(ValueError):
+        render.render_entry(instrument, maker, e, str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+def test_serialization_per_document(entry, tmp_path):
+    instrument, maker, e = entry
+    profiling.reset()
+    profiling.enable()
+    try:
+        files = render.render_entry(instrument, maker, e, str(tmp_path))
+        render.get_svg(render.violin_from_entry(e))
+    finally:
+        profiling.disable()
+    stats = profiling.stats()
+    profiling.reset()
+    # Once per document, not per path command
+    assert stats["serialization"]["calls"] == len(files) + 1
+    assert stats["outline"]["calls"] > 0
@@ -0,0 +1,83 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+from conftest import ROOT
+from catalog import Catalog
+from server import HttpError, RenderServer
+
+MODEL = "/render?instrument=violin&maker=Guarneri&model=Ole%20Bull"
+
+@pytest.fixture(scope="module")
+def server():
+    server = RenderServer(Catalog(os.path.join(ROOT, "data", "instruments.json")), jobs=1)
+    yield server
+    server.shutdown()
+
+def respond(server, target, headers={}, method="GET"):
+    return asyncio.run(server.respond(method, target, headers))
+
+def adhoc(entry, **changes):
+    return "/render?" + "&".join(f"{p}={v}" for p, v in dict(entry, **changes).items() if isinstance(v, (int, float)))
+
+def test_render_etag(server):
+    status, headers, body = respond(server, MODEL)
+    assert status == 200 and headers["Content-Type"] == "image/svg+xml"
+    assert body.startswith(b"<svg") and body.endswith(b"</svg>\n")
+    etag = headers["ETag"]
+
+    # The same document from the cache, under the same tag
+    assert respond(server, MODEL + "&view=outline") == (status, headers, body)
+    status, headers, body = respond(server, MODEL, {"if-none-match": f'"other", {etag}'})
+    assert (status, headers, body) == (304, {"ETag": etag}, b"")
+    assert respond(server, MODEL, {"if-none-match": '"other"'})[0] == 200
+
+    status, headers, _ = respond(server, MODEL + "&view=template")
+    assert status == 200 and headers["ETag"] != etag
+
+def test_render_adhoc(server, entries):
+    _, _, entry = entries[0]
+    status, headers, body = respond(server, adhoc(entry))
+    assert status == 200
+    # Rounding noise of the parameters is the same document
+    assert respond(server, adhoc(entry, kc=entry["kc"] + 1e-13))[1]["ETag"] == headers["ETag"]
+
+def test_render_invalid_geometry(server, entries):
+    _, _, entry = entries[0]
+    with pytest.raises(HttpError) as error:
+        respond(server, adhoc(entry, kw=10))
+    assert error.value.status == 422
+    assert str(error.value).startswith("cannot render: ")
+
+@pytest.mark.parametrize("target, status", [
+    ("/render?instrument=violin&maker=Guarneri", 400),
+    ("/render?instrument=violin&maker=Guarneri&model=none", 404),
+    (MODEL + "&view=side", 400),
+    ("/render?kc=a", 400),
+    ("/render?kc=1", 400),
+    ("/catalog/violin/none", 404),
+    ("/other", 404),
+])
+def test_bad_requests(server, target, status):
+    with pytest.raises(HttpError) as error:
+        respond(server, target)
+    assert error.value.status == status
+
+def test_method(server):
+    with pytest.raises(HttpError) as error:
+        respond(server, MODEL, method="POST")
+    assert error.value.status == 405
+
+def test_catalog(server, entries):
+    status, headers, body = respond(server, "/catalog")
+    assert status == 200 and headers["Content-Type"] == "application/json"
+    index = json.loads(body)
+    assert sum(len(models) for makers in index.values() for models in makers.values()) == len(entries)
+
+def test_shutdown():
+    server = RenderServer(Catalog(os.path.join(ROOT, "data", "instruments.json")), jobs=1)
+    server.shutdown()
+    with pytest.raises(RuntimeError):
+        server.pool.submit(print)
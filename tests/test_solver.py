@@ -0,0 +1,63 @@
+import pytest
+
+import solver
+from solver import fit, measure
+
+TARGETS = ("length", "lower_bout", "center_bout", "upper_bout",
+           "upper_corner_height", "lower_corner_height", "upper_corner_width", "lower_corner_width")
+
+def entry_measures(entry):
+    params = {p: [entry[p]] if p in entry else [entry["km"]] for p in solver.DEFAULTS}
+    return {k: float(m[0]) for k, m in measure(params).items()}
+
+def test_fit_catalog(entries):
+    # The measures of each entry are met again, starting from the defaults
+    for _, _, entry in entries:
+        measures = entry_measures(entry)
+        targets = {k: measures[k] for k in TARGETS}
+        result = fit(targets)
+        assert result.converged
+        assert 1 <= result.iterations < 100
+        assert max(abs(r) for r in result.residuals.values()) < 1e-5
+        assert entry_measures(result.params) == pytest.approx(result.measures)
+
+def test_fit_initial(entries):
+    _, _, entry = entries[0]
+    measures = entry_measures(entry)
+    result = fit({k: measures[k] for k in TARGETS}, initial=entry)
+    assert result.converged
+    # Already there
+    assert result.iterations == 1
+    assert result.params["kc"] == pytest.approx(entry["kc"])
+
+def test_fit_free():
+    result = fit({"lower_bout": 210}, free=["kc"])
+    assert result.converged
+    assert set(p for p in result.params if result.params[p] != solver.DEFAULTS[p]) <= {"kc"}
+    assert result.measures["lower_bout"] == pytest.approx(210, abs=1e-5)
+
+def test_fit_unreachable():
+    # b1 cannot make the center bout that wide, the damping runs away
+    result = fit({"center_bout": 200}, free=["b1"])
+    assert not result.converged
+    assert abs(result.residuals["center_bout"]) > 100
+
+def test_fit_max_iter():
+    with pytest.raises(ValueError):
+        fit({"lower_bout": 210}, max_iter=0)
+    result = fit({"lower_bout": 210, "center_bout": 120}, max_iter=1)
+    assert result.iterations == 1
+
+def test_fit_invalid_start():
+    with pytest.raises(ValueError, match=r"rl is undefined \(.*kw=2.5 from 2\*center_bout/lower_bout"):
+        fit({"lower_bout": 200, "center_bout": 250})
+
+def test_fit_unknown():
+    with pytest.raises(ValueError):
+        fit({"waist": 100})
+    with pytest.raises(ValueError):
+        fit({"lower_bout": 200}, free=["x"])
+
+def test_undefined():
+    assert solver.undefined(solver.DEFAULTS) is None
+    assert solver.undefined(dict(solver.DEFAULTS, kw=2.5)) == "rl"
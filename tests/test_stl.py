@@ -0,0 +1,73 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+
+import stl
+from arching import plate, zones
+
+def mesh(v, h, **kwargs):
+    return np.concatenate(list(stl.plate(v, h, resolution=2, **kwargs)))
+
+def assert_closed(triangles):
+    # Every directed edge once, and its reverse once: closed and
+    # consistently oriented
+    _, index = np.unique(triangles.reshape(-1, 3), axis=0, return_inverse=True)
+    index = index.reshape(-1, 3)
+    edges = np.concatenate((index[:, [0, 1]], index[:, [1, 2]], index[:, [2, 0]]))
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    directed = {tuple(e) for e in edges.tolist()}
+    assert len(directed) == len(edges)
+    assert directed == {(b, a) for a, b in directed}
+
+def volume(triangles):
+    # Divergence theorem, positive for outward normals
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    return np.sum(np.einsum("ij,ij->i", a, np.cross(b, c)))/6
+
+@pytest.fixture(scope="module")
+def violin(violins):
+    return violins[0]
+
+@pytest.mark.parametrize("h", [15, -15])
+def test_plate_closed(violin, h):
+    triangles = mesh(violin, h)
+    assert_closed(triangles)
+    # The thickness is vertical, the volume is thickness times the area
+    expected = 3*plate(violin, h)["area"]
+    assert volume(triangles) == pytest.approx(expected, rel=0.005)
+
+@pytest.mark.parametrize("h", [15, -15])
+def test_plate_flat(violin, h):
+    triangles = mesh(violin, h, thickness=3, flat=True)
+    assert_closed(triangles)
+    z = triangles[..., 2]
+    assert (z.min(), z.max()) == pytest.approx((-3, 15) if h > 0 else (-15, 3), abs=0.5)
+    expected = plate(violin, h, thickness=3)
+    assert volume(triangles) == pytest.approx(expected["arch_volume"] + 3*expected["area"], rel=0.005)
+
+def test_plate_graduated(violin):
+    graduation = zones([(0, 3.2), (0.3, 2.6), (0.8, 3)])
+    triangles = mesh(violin, 15, thickness=graduation)
+    assert_closed(triangles)
+    # plate integrates the thickness normal to the surface, over the
+    # surface instead of the area
+    expected = plate(violin, 15, thickness=graduation)
+    assert volume(triangles) == pytest.approx(expected["volume"]*expected["area"]/expected["surface"], rel=0.005)
+    assert 2.6*expected["area"] < volume(triangles) < 3.2*expected["area"]
+
+def test_plate_flat_graduated(violin):
+    with pytest.raises(ValueError):
+        next(stl.plate(violin, 15, thickness=lambda x, y, s: 3 + 0*x, flat=True))
+
+def test_writer(violin):
+    out = io.BytesIO()
+    writer = stl.StlWriter(out)
+    n = stl.write_plate(writer, violin, 15, resolution=4)
+    data = out.getvalue()
+    assert struct.unpack("<I", data[80:84])[0] == n
+    assert len(data) == 84 + 50*n
+    facets = np.frombuffer(data, dtype=stl.FACET, offset=84)
+    assert_closed(facets["v"].astype(float))
+    assert np.allclose(np.linalg.norm(facets["normal"], axis=1), 1, atol=1e-5)
@@ -0,0 +1,102 @@
+import csv
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+import sweep
+from conftest import ROOT
+from batch import ViolinBatch
+from sweep import COLUMNS, Grid, TopK, chunks, evaluate, parse_spec
+
+@pytest.fixture
+def base(entries):
+    return entries[0][2]
+
+def test_parse_spec():
+    name, values = parse_spec("kc=0.6:0.9:0.1")
+    assert name == "kc" and values.tolist() == [0.6, 0.7, 0.8, 0.9]
+    assert parse_spec("kw=0.9,1.1")[1].tolist() == [0.9, 1.1]
+    assert parse_spec("h=350")[1].tolist() == [350]
+    for spec in ("kc", "x=1", "kc=1:0:0.1", "kc=0:1:0"):
+        with pytest.raises(ValueError):
+            parse_spec(spec)
+
+def test_grid_order(base):
+    grid = Grid([parse_spec("kc=0.5,0.6,0.7"), parse_spec("km=0.4,0.5")], base)
+    assert len(grid) == 6
+    # The last axis varies fastest, km sets both minor circles
+    params = grid.params(1, 4)
+    assert params["kc"].tolist() == [0.5, 0.6, 0.6]
+    assert params["kmu"].tolist() == params["kml"].tolist() == [0.5, 0.4, 0.5]
+    assert params["kw"] == base["kw"]
+
+def test_grid_missing():
+    with pytest.raises(ValueError, match="No value given for"):
+        Grid([parse_spec("kc=0.5")])
+
+def test_evaluate(base):
+    grid = Grid([parse_spec("kc=0.5:0.7:0.05"), parse_spec("kw=1.0,10")], base)
+    rows, invalid = evaluate(grid, 0, len(grid))
+    # kw=10 has no geometry
+    assert invalid == 5 and len(rows) == 5
+    assert rows[:, 0].tolist() == [0, 2, 4, 6, 8]
+    b = ViolinBatch(**grid.params(0, len(grid))).calculate()
+    assert rows[:, COLUMNS.index("lower_bout")] == pytest.approx(2*b.rl[::2])
+    assert rows[:, COLUMNS.index("area")] == pytest.approx(b.get_outline_properties()["area"][::2])
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_chunks_in_order(base, chunk_size):
+    grid = Grid([parse_spec("kc=0.5:0.7:0.05"), parse_spec("kw=1.0,10")], base)
+    whole, _ = evaluate(grid, 0, len(grid))
+    results = list(chunks(grid, jobs=1, chunk_size=chunk_size, keep_rows=True))
+    assert len(results) == -(-len(grid)//chunk_size)
+    assert np.array_equal(np.vstack([rows for rows, _, _ in results]), whole)
+    assert sum(invalid for _, invalid, _ in results) == len(grid) - len(whole)
+    text = "".join(t for _, _, t in results)
+    assert [float(v) for v in next(csv.reader(io.StringIO(text)))] == whole[0].tolist()
+
+def test_chunks_pool(base):
+    grid = Grid([parse_spec("kc=0.5:0.7:0.01")], base)
+    single = list(chunks(grid, jobs=1, chunk_size=4))
+    pool = list(chunks(grid, jobs=2, chunk_size=4))
+    assert [(n, i, t) for n, i, t in pool] == single
+
+def test_format_ndjson(base):
+    grid = Grid([parse_spec("kc=0.5,0.6")], base)
+    rows, _ = evaluate(grid, 0, 2)
+    lines = sweep.format_rows(rows, "ndjson").splitlines()
+    objects = [json.loads(l) for l in lines]
+    assert [o["variant"] for o in objects] == [0, 1]
+    assert list(objects[0]) == list(COLUMNS)
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_top_k(descending):
+    rng = np.random.default_rng(0)
+    rows = rng.uniform(0, 1, (1000, len(COLUMNS)))
+    top = TopK(10, "area", descending)
+    for chunk in np.array_split(rows, 7):
+        top.add(chunk)
+    col = COLUMNS.index("area")
+    expected = np.sort(rows[:, col])
+    expected = expected[::-1][:10] if descending else expected[:10]
+    assert top.sorted()[:, col].tolist() == expected.tolist()
+
+def test_top_k_fewer_rows():
+    top = TopK(10, "area")
+    top.add(np.zeros((3, len(COLUMNS))))
+    assert len(top.sorted()) == 3
+
+def test_main_top(tmp_path, capsys):
+    output, svg_dir = tmp_path / "out.csv", tmp_path / "svg"
+    args = sweep.parser().parse_args(["-b", "violin", "Guarneri", "Ole Bull", "kc=0.5:0.7:0.05", "kw=1.0,10",
+                                      "-j", "1", "-o", str(output), "--file", os.path.join(ROOT, "data", "instruments.json"), "--top", "2", "--svg_dir", str(svg_dir)])
+    assert sweep.main(args) == 0
+    lines = output.read_text().splitlines()
+    assert lines[0] == ",".join(COLUMNS) and len(lines) == 6
+    # The two smallest center bouts, in order
+    rows = sorted(csv.DictReader(lines), key=lambda r: float(r["center_bout"]))[:2]
+    assert sorted(f.name for f in svg_dir.iterdir()) == [f"sweep_{k+1}_{r['variant']}.svg" for k, r in enumerate(rows)]
+    assert "10 variants, 5 invalid" in capsys.readouterr().err
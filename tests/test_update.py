@@ -0,0 +1,72 @@
+import pytest
+
+import render
+from violin import Violin
+
+def fresh(v, **params):
+    w = Violin(**{p: params.get(p, getattr(v, p)) for p in Violin.params})
+    w.calculate_body_params()
+    w.calculate_corner_params()
+    return w
+
+def derived(v):
+    return {d: getattr(v, d) for d in Violin.derived}
+
+class Tracing(Violin):
+    # Records the attributes a node method reads
+    def __getattribute__(self, name):
+        if not name.startswith("_") and name in Violin.params + Violin.derived:
+            object.__getattribute__(self, "read").add(name)
+        return object.__getattribute__(self, name)
+
+def test_graph_inputs(violins):
+    # A node reads nothing but its declared inputs, else an update misses it
+    v = Tracing(**{p: getattr(violins[0], p) for p in Violin.params})
+    for node, (inputs, outputs) in {**Violin._body_nodes, **Violin._corner_nodes}.items():
+        v.read = set()
+        getattr(v, node)()
+        assert v.read - set(outputs) <= set(inputs), node
+
+@pytest.mark.parametrize("p", Violin.params)
+def test_update_matches_fresh(violins, p):
+    for v in violins:
+        v = fresh(v)
+        value = getattr(v, p)*1.01
+        before = derived(v)
+        changed = v.update(**{p: value})
+        expected = fresh(v, **{p: value})
+        assert derived(v) == derived(expected)
+        assert changed == {d for d in Violin.derived if before[d] != getattr(expected, d)}
+        assert v.get_outline_records() == expected.get_outline_records()
+        assert v.get_outline_path() == expected.get_outline_path()
+
+def test_update_corner_only(violins):
+    v = fresh(violins[0])
+    changed = v.update(b1=v.b1*1.01)
+    assert changed and changed <= set(o for _, outputs in Violin._corner_nodes.values() for o in outputs)
+    assert "cA" in changed and "rl" not in changed
+
+def test_update_unchanged(violins):
+    v = fresh(violins[0])
+    outline = v.get_outline_records()
+    path = v.get_outline_path()
+    assert v.update(kc=v.kc, b1=v.b1) == set()
+    # The outline is kept
+    assert v.get_outline_records() is outline
+    assert v.get_outline_path() == path
+
+def test_update_km(violins):
+    v = fresh(violins[0])
+    v.update(km=0.5)
+    assert v.kmu == v.kml == 0.5
+    assert derived(v) == derived(fresh(v))
+
+def test_update_not_calculated(entries):
+    v = render.violin_from_entry(entries[0][2], calculate=False)
+    assert v.update(kc=v.kc*1.01) == set(Violin.derived)
+    assert v.body_calculated and v.corner_calculated
+
+def test_update_unknown(violins):
+    v = fresh(violins[0])
+    with pytest.raises(Exception, match="unknown parameter x"):
+        v.update(x=1)